@@ -0,0 +1,527 @@
+"""
+async_okx_trader.py
+
+Asynchronous counterpart of OKXTrader built on ccxt.async_support.
+
+One async exchange instance (and therefore one keep-alive HTTP session) is
+shared by every call. Independent requests run concurrently with
+asyncio.gather, so start-up (markets + balance + open orders + tickers) and a
+signal cycle take roughly as long as the slowest request instead of the sum
+of all of them. The public methods mirror OKXTrader's account, order and
+market-data API as coroutines; pure computations (backtests, sweeps) stay on
+OKXTrader and the modules it uses.
+
+Usage:
+    trader = await AsyncOKXTrader.create()
+    try:
+        signal = await trader.check_triangle_arbitrage()
+    finally:
+        await trader.close()
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+
+import ccxt.async_support as ccxt_async
+from dotenv import load_dotenv
+
+from book_evaluator import evaluate_books
+from config import SAFE_MARGIN, IS_SIMULATION, COIN_LIST, TAKER_FEE
+from logger_config import setup_logger, log_event
+from market_cache import MarketMetadataCache
+from okx_trader import OKXTrader
+from price_snapshot import AsyncPriceSnapshot
+from triangle_executor import TriangleExecutor
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = setup_logger(__name__)
+
+
+class AsyncOKXTrader:
+    """
+    AsyncOKXTrader exposes OKXTrader's exchange-facing methods as coroutines over a
+    single ccxt.async_support OKX instance.
+    """
+
+    TRIANGLE_SYMBOLS = OKXTrader.TRIANGLE_SYMBOLS
+
+    def __init__(self, exchange=None):
+        """
+        Builds the trader without touching the network; use AsyncOKXTrader.create()
+        to also load markets, balance and open orders.
+
+        :param exchange: Optional pre-built async ccxt-compatible exchange
+                         (e.g. fake_exchange.AsyncFakeExchange for offline runs).
+        """
+        self.api_key = os.getenv("OKX_API_KEY")
+        self.api_secret = os.getenv("OKX_API_SECRET_KEY")
+        self.passphrase = os.getenv("OKX_API_PASSPHRASE")
+
+        # Same endpoint overrides as OKXTrader; the async exchange keeps one aiohttp session alive.
+        persist_markets = exchange is None
+        self.exchange = exchange or ccxt_async.myokx({
+            'apiKey': self.api_key,
+            'secret': self.api_secret,
+            'password': self.passphrase,
+            'enableRateLimit': True,
+            'urls': {
+                'api': {
+                    'public': 'https://my.okx.com',
+                    'private': 'https://my.okx.com',
+                }
+            }
+        })
+        # Snapshot-only market cache: refreshes are awaited in initialize() (refresh_async), not run on a thread.
+        self.market_cache = MarketMetadataCache(self.exchange, background=False, persist=persist_markets)
+        self.price_snapshot = AsyncPriceSnapshot(self.exchange, symbols=self.TRIANGLE_SYMBOLS + COIN_LIST)
+
+        self.balance = None
+        self.holdings = {}
+        self.active_orders = []
+        self.executor = None
+
+    @classmethod
+    async def create(cls, exchange=None):
+        """
+        Builds and initializes a trader (markets, balance, open orders and tickers fetched concurrently).
+        """
+        trader = cls(exchange)
+        await trader.initialize()
+        return trader
+
+    async def initialize(self):
+        """
+        Loads markets (unless a snapshot is on disk), balance, open orders and the
+        ticker snapshot concurrently.
+        """
+        tasks = [self.get_account_balance(), self.get_open_orders(), self.price_snapshot.refresh()]
+        if not self.market_cache.ready.is_set():
+            tasks.append(self.market_cache.refresh_async())
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.active_orders = results[1] if isinstance(results[1], list) else []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error initializing AsyncOKXTrader: {result}")
+        logger.info("AsyncOKXTrader initialized.")
+        return self
+
+    async def close(self):
+        """
+        Stops the execution engine (if started) and closes the shared HTTP session.
+        """
+        if self.executor is not None:
+            await self.executor.stop()
+        await self.exchange.close()
+
+    async def __aenter__(self):
+        return await self.initialize()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # ---------------------------
+    # Account and order queries
+    # ---------------------------
+    async def get_account_balance(self):
+        """
+        Retrieves and returns the current account balance.
+        Updates self.balance and self.holdings.
+        """
+        logger.info("Fetching account balance...")
+        try:
+            balance_info = await self.exchange.fetch_balance()
+            self.holdings = balance_info.get('total', {})
+            self.balance = self.holdings.get('USDT', 0.0) or self.holdings.get('USD', 0.0)
+            logger.info(f"Account balance fetched: {self.balance}")
+            return self.balance
+        except Exception as e:
+            logger.error(f"Error fetching account balance: {e}")
+            return None
+
+    async def _fetch_orders(self, method, symbol=None, start_date=None, end_date=None):
+        since = self.exchange.parse8601(start_date) if start_date else None
+        orders = await method(symbol=symbol, since=since)
+        if end_date:
+            end_timestamp = self.exchange.parse8601(end_date)
+            orders = [order for order in orders if order['timestamp'] <= end_timestamp]
+        return orders
+
+    async def get_open_orders(self, start_date: str = None, end_date: str = None):
+        """
+        Retrieve all open orders in the given date range.
+        """
+        logger.info("Fetching open orders...")
+        try:
+            return await self._fetch_orders(self.exchange.fetch_open_orders, None, start_date, end_date)
+        except Exception as e:
+            logger.error(f"Error fetching open orders: {e}")
+            return []
+
+    async def get_closed_orders(self, start_date: str = None, end_date: str = None):
+        """
+        Retrieve all closed orders in the given date range.
+        """
+        logger.info("Fetching closed orders...")
+        try:
+            return await self._fetch_orders(self.exchange.fetch_closed_orders, None, start_date, end_date)
+        except Exception as e:
+            logger.error(f"Error fetching closed orders: {e}")
+            return []
+
+    async def get_last_closed_order(self, instrument_id: str, start_date: str = None, end_date: str = None):
+        """
+        Get the last closed order for a specific instrument.
+        """
+        logger.info(f"Fetching last closed order for instrument {instrument_id}...")
+        try:
+            closed_orders = await self._fetch_orders(self.exchange.fetch_closed_orders, instrument_id,
+                                                     start_date, end_date)
+            return max(closed_orders, key=lambda x: x['timestamp']) if closed_orders else None
+        except Exception as e:
+            logger.error(f"Error fetching last closed order for {instrument_id}: {e}")
+            return None
+
+    async def get_past_orders(self, start_date: str, end_date: str):
+        """
+        Retrieves order history (open + closed) within the specified date range, fetching both concurrently.
+        """
+        logger.info("Fetching past orders (open + closed)...")
+        open_orders, closed_orders = await asyncio.gather(self.get_open_orders(start_date, end_date),
+                                                          self.get_closed_orders(start_date, end_date))
+        return {
+            "open_orders": open_orders,
+            "closed_orders": closed_orders
+        }
+
+    async def get_orders_by_date(self, start_date: str, end_date: str, status: str = None):
+        """
+        Retrieves orders within a date range, optionally filtered by status.
+        """
+        logger.info(f"Fetching orders by date from {start_date} to {end_date}, status={status}...")
+        try:
+            requests = []
+            if status in ['open', 'active']:
+                requests.append(self._fetch_orders(self.exchange.fetch_open_orders, None, start_date, end_date))
+            if status in [None, 'closed']:
+                requests.append(self._fetch_orders(self.exchange.fetch_closed_orders, None, start_date, end_date))
+            return [order for orders in await asyncio.gather(*requests) for order in orders]
+        except Exception as e:
+            logger.error(f"Error fetching orders by date: {e}")
+            return []
+
+    async def get_order_status(self, order_id: str, coin: str) -> str:
+        """
+        Get the status of an order ('open', 'closed', 'canceled', etc.).
+        """
+        logger.info(f"Fetching order status for order ID {order_id}...")
+        try:
+            order = await self.exchange.fetch_order(order_id, coin.replace('-', '/'))
+            return order['status']
+        except Exception as e:
+            logger.error(f"Error fetching order status for {order_id}: {str(e)}")
+            return None
+
+    async def sync_account_info(self):
+        """
+        Updates balance, holdings and active orders (both requests run concurrently).
+        """
+        logger.info("Synchronizing account info with exchange...")
+        try:
+            _, self.active_orders = await asyncio.gather(self.get_account_balance(), self.get_open_orders())
+            logger.info(f"Synchronized account: balance={self.balance}, holdings={self.holdings}")
+        except Exception as e:
+            logger.error(f"Error synchronizing account info: {e}")
+
+    # ---------------------------
+    # Order placement and cancellation
+    # ---------------------------
+    async def place_limit_order(self, order_type: str, instrument_id: str, quantity: float, price: float):
+        """
+        Place a limit order ('BUY' or 'SELL').
+        """
+        if IS_SIMULATION:
+            print(f"[SIMULATION] calling AsyncOKXTrader.place_limit_order({order_type}, {instrument_id}, {quantity}, {price})")
+            return None
+        logger.info("Placing limit order...")
+        try:
+            side = 'buy' if order_type.lower() == 'buy' else 'sell'
+            quantity = self.market_cache.amount_to_precision(instrument_id, quantity)
+            if price:
+                price = self.market_cache.price_to_precision(instrument_id, price)
+            if self.balance < (price * quantity if price else 0) + SAFE_MARGIN:
+                raise ValueError("Not enough balance to place this order.")
+            order = await self.exchange.create_order(symbol=instrument_id, type='limit' if price else 'market',
+                                                     side=side, amount=quantity, price=price or None, params={})
+            self.active_orders.append(order)
+            logger.info(f"Placed limit order: {order}")
+            return order
+        except Exception as e:
+            logger.error(f"Error placing limit order: {e}")
+            return None
+
+    async def place_market_order(self, side: str, symbol: str, size: float) -> dict:
+        """
+        Place a market order. The reference price and the order placement are independent
+        of each other, so the price comes from the shared snapshot.
+        """
+        logger.info("Placing market order...")
+        try:
+            if size is None or size <= 0:
+                logger.error(f"Invalid size for market order: {size}")
+                return {'error': 'Invalid size', 'filled': 0, 'price': 0}
+            size = float(f"{size:.6f}")
+            side = side.lower()
+            current_price, order = await asyncio.gather(self.price_snapshot.last(symbol),
+                                                        self.exchange.create_market_order(symbol, side, size))
+            order_id = order.get('id')
+            filled_order = await self.exchange.fetch_order(order_id, symbol)
+            result = {
+                'id': order_id,
+                'symbol': symbol,
+                'side': side,
+                'type': 'market',
+                'filled': float(filled_order.get('filled', 0)),
+                'price': float(filled_order.get('price', current_price or 0)),
+                'timestamp': filled_order.get('timestamp', int(datetime.now().timestamp() * 1000))
+            }
+            if filled_order.get('status') != 'closed':
+                self.active_orders.append(result)
+            logger.info(f"Market {side.upper()} order placed: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"Error placing market order: {e}")
+            return {'error': str(e), 'filled': 0, 'price': 0}
+
+    async def place_stop_loss_order(self, order_type: str, instrument_id: str, quantity: float,
+                                    slTriggerPx: float = None):
+        """
+        Place a stop loss order (sell only). If slTriggerPx is None, no SL is placed.
+        """
+        if IS_SIMULATION:
+            print(f"[SIMULATION] calling AsyncOKXTrader.place_stop_loss_order('SELL', {instrument_id}, {quantity}, {slTriggerPx})")
+            return None
+        logger.info("Placing stop loss order...")
+        try:
+            if slTriggerPx is None:
+                logger.warning("No slTriggerPx provided; not placing a stop loss.")
+                return None
+            if order_type.lower() != 'sell':
+                raise ValueError("Stop loss order must be a sell order.")
+            quantity = self.market_cache.amount_to_precision(instrument_id, quantity)
+            slOrdPrice = self.market_cache.price_to_precision(instrument_id, slTriggerPx * 0.999)
+            params = {"tdMode": "cash", "stopPx": slTriggerPx, "px": slOrdPrice}
+            order = await self.exchange.create_order(symbol=instrument_id, type='limit', side='sell', amount=quantity,
+                                                     price=slOrdPrice or slTriggerPx, params=params)
+            self.active_orders.append(order)
+            logger.info(f"Placed stop loss order: {order}")
+            return order
+        except Exception as e:
+            logger.error(f"Error placing stop loss order: {e}")
+            return None
+
+    async def place_take_profit_order(self, order_type: str, instrument_id: str, quantity: float,
+                                      tpTriggerPx: float = None):
+        """
+        Place a take profit order (sell only). If tpTriggerPx is None, no TP is placed.
+        """
+        if IS_SIMULATION:
+            print(f"[SIMULATION] calling AsyncOKXTrader.place_take_profit_order('SELL', {instrument_id}, {quantity}, {tpTriggerPx})")
+            return None
+        logger.info("Placing take profit order...")
+        try:
+            if tpTriggerPx is None:
+                logger.warning("No tpTriggerPx provided; not placing a take profit.")
+                return None
+            if order_type.lower() != 'sell':
+                raise ValueError("Take profit order must be a sell order.")
+            quantity = self.market_cache.amount_to_precision(instrument_id, quantity)
+            tpOrdPrice = self.market_cache.price_to_precision(instrument_id, tpTriggerPx * 1.001)
+            params = {"tdMode": "cross", "tpTriggerPx": str(tpTriggerPx), "tpOrdPx": str(tpOrdPrice)}
+            order = await self.exchange.create_order(symbol=instrument_id, type='limit', side='sell', amount=quantity,
+                                                     price=tpOrdPrice or tpTriggerPx, params=params)
+            self.active_orders.append(order)
+            logger.info(f"Placed take profit order: {order}")
+            return order
+        except Exception as e:
+            logger.error(f"Error placing take profit order: {e}")
+            return None
+
+    async def cancel_order(self, order_id: str):
+        """
+        Cancels a single order using its order ID.
+        """
+        logger.info(f"Cancelling order {order_id}...")
+        try:
+            order_info = next((o for o in self.active_orders if o.get('id') == order_id), None)
+            if not order_info:
+                try:
+                    order_info = await self.exchange.fetch_order(order_id)
+                except Exception as e:
+                    logger.warning(f"Could not fetch order {order_id} details: {e}")
+            symbol = order_info.get('symbol') if order_info else None
+            if not symbol:
+                logger.error(f"Cannot cancel order {order_id}: symbol information not found")
+                return None
+            response = await self.exchange.cancel_order(order_id, symbol)
+            logger.info(f"Cancelled order {order_id}: {response}")
+            self.active_orders = [o for o in self.active_orders if o.get('id') != order_id]
+            return response
+        except Exception as e:
+            logger.error(f"Error cancelling order {order_id}: {e}")
+            return None
+
+    async def cancel_all_orders(self):
+        """
+        Cancels all open orders concurrently.
+        """
+        logger.info("Cancelling all active orders...")
+        try:
+            open_orders = [o for o in await self.get_open_orders() if o.get('symbol')]
+            results = await asyncio.gather(*(self.exchange.cancel_order(o['id'], o['symbol']) for o in open_orders),
+                                           return_exceptions=True)
+            failed = [o['id'] for o, r in zip(open_orders, results) if isinstance(r, Exception)]
+            self.active_orders.clear()
+            logger.info(f"Cancelled {len(open_orders) - len(failed)} orders, failed to cancel {len(failed)} orders.")
+            remaining = await self.get_open_orders()
+            if remaining:
+                logger.warning(f"{len(remaining)} orders still remain active.")
+            else:
+                logger.info("All active orders have been cancelled.")
+            return True
+        except Exception as e:
+            logger.info(f"Error cancelling all orders: {e}")
+            return False
+
+    # ---------------------------
+    # Market data
+    # ---------------------------
+    async def get_current_price(self, coin: str) -> float:
+        """
+        Get the current price of a coin.
+        """
+        return await self.price_snapshot.last(coin)
+
+    async def get_minimum_investment_by_coin(self, coin: str) -> float:
+        """
+        Minimum order value (in quote currency) for one coin.
+        """
+        coin = coin.replace('-', '/')
+        market = self.market_cache.get(coin)
+        min_order_value = market['min_amount'] * await self.price_snapshot.last(coin)
+        print(f"Minimum order size for {coin}: {market['min_amount']} {market['base']}")
+        print(f"Equivalent to: {min_order_value:.2f} {market['quote']}")
+        return min_order_value
+
+    async def get_minimum_investment_by_coin_list(self) -> float:
+        """
+        Largest minimum order value among COIN_LIST (one ticker request for all coins).
+        """
+        await self.price_snapshot.get_tickers(COIN_LIST)
+        values = await asyncio.gather(*(self.get_minimum_investment_by_coin(coin) for coin in COIN_LIST))
+        return max(values, default=0)
+
+    async def fetch_triangle_market_data(self):
+        """
+        Fetches last price and base volume of BTC/USDT, ETH/USDT and ETH/BTC in one bulk request.
+        """
+        try:
+            tickers = await self.price_snapshot.get_tickers(self.TRIANGLE_SYMBOLS)
+            data = {"timestamp": datetime.now().isoformat()}
+            for sym in self.TRIANGLE_SYMBOLS:
+                data[sym] = {"last": tickers[sym].get("last"), "volume": tickers[sym].get("baseVolume")}
+            logger.info(f"Fetched triangle market data: {data}")
+            return data
+        except Exception as e:
+            logger.error(f"Error fetching triangle market data: {e}")
+            return None
+
+    async def check_triangle_arbitrage(self, threshold=0.002, data=None):
+        """
+        Checks for triangle arbitrage opportunities (see OKXTrader.check_triangle_arbitrage).
+        """
+        if data is None:
+            data = await self.fetch_triangle_market_data()
+            if data is None:
+                logger.error("No market data available for triangle arbitrage check.")
+                return None
+        # The signal itself is pure; reuse the synchronous implementation on the fetched data.
+        return OKXTrader.check_triangle_arbitrage(self, threshold=threshold, data=data)
+
+    async def fetch_triangle_order_books(self, depth=5):
+        """
+        Fetches the top 'depth' levels of the three triangle order books concurrently.
+        """
+        try:
+            books = await asyncio.gather(*(self.exchange.fetch_order_book(sym, limit=depth)
+                                           for sym in self.TRIANGLE_SYMBOLS))
+            return dict(zip(self.TRIANGLE_SYMBOLS, books))
+        except Exception as e:
+            logger.error(f"Error fetching triangle order books: {e}")
+            return None
+
+    async def check_triangle_arbitrage_executable(self, notional, threshold=0.002, books=None, depth=5, fee=TAKER_FEE):
+        """
+        Checks for triangle arbitrage at executable (order book) prices (see evaluate_books).
+        """
+        try:
+            if books is None:
+                books = await self.fetch_triangle_order_books(depth)
+                if books is None:
+                    logger.error("No order book data available for executable arbitrage check.")
+                    return None
+            result = evaluate_books(books, notional, threshold=threshold, fee=fee)
+            log_event(logger, "executable_triangle_signal", result)
+            return result
+        except Exception as e:
+            logger.error(f"Error checking executable triangle arbitrage: {e}")
+            return None
+
+    # ---------------------------
+    # Execution
+    # ---------------------------
+    async def execute_triangle(self, signal, notional, **executor_options):
+        """
+        Executes the cycle flagged by a check_triangle_arbitrage signal with all three legs fired at once.
+
+        :param signal: Result of check_triangle_arbitrage (its prices size the legs).
+        :param notional: USDT committed to the first leg.
+        :param executor_options: Passed to TriangleExecutor on first use (max_slippage, fill_timeout, ...).
+        :return: TriangleExecutor report, or None when no cycle is flagged.
+        """
+        signal_ns = time.perf_counter_ns()
+        cycle = 1 if signal.get("Cycle1_opportunity") else 2 if signal.get("Cycle2_opportunity") else None
+        if cycle is None:
+            return None
+        if IS_SIMULATION:
+            print(f"[SIMULATION] calling AsyncOKXTrader.execute_triangle(cycle={cycle}, notional={notional})")
+            return None
+        if self.executor is None:
+            self.executor = TriangleExecutor(self.exchange, self.market_cache, **executor_options)
+        prices = {sym: signal[sym] for sym in self.TRIANGLE_SYMBOLS}
+        try:
+            return await self.executor.execute(cycle, prices, notional, signal_ns=signal_ns)
+        except Exception as e:
+            logger.error(f"Error executing triangle cycle {cycle}: {e}")
+            return None
+
+
+async def main():
+    """
+    Starts an AsyncOKXTrader and prints one triangle arbitrage signal.
+    """
+    trader = await AsyncOKXTrader.create()
+    try:
+        print(f"Balance: {trader.balance}")
+        print(f"Active Orders: {len(trader.active_orders)}")
+        print(await trader.check_triangle_arbitrage())
+    finally:
+        await trader.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
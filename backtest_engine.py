@@ -0,0 +1,239 @@
+"""
+backtest_engine.py
+
+Columnar (NumPy) implementation of the triangle arbitrage backtest used by
+OKXTrader.backtest_triangle_arbitrage_minute. Every step of the minute loop
+(cycle factors, opportunity masks, compounding, trade statistics and drawdown)
+is expressed as a whole-array operation so that long histories and parameter
+sweeps run without a Python-level loop. StreamingBacktest applies the same
+computation batch by batch with constant memory.
+"""
+
+import numpy as np
+import pandas as pd
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+TRIANGLE_SYMBOLS = ("BTC/USDT", "ETH/USDT", "ETH/BTC")
+INITIAL_PORTFOLIO = 10000.0
+MINUTES_PER_YEAR = 525600
+
+
+def _price_column(values):
+    """
+    Converts a column of prices into a float64 array. Live-style values
+    (dicts with a "last" key) are unwrapped and missing values become NaN.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        return values.astype(np.float64, copy=False)
+    if isinstance(values, pd.Series) and values.dtype.kind == 'f':
+        return values.to_numpy(dtype=np.float64)
+    values = [v.get("last") if isinstance(v, dict) else v for v in values]
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def to_price_arrays(historical_data):
+    """
+    Normalizes historical triangle data into three float64 close-price arrays.
+
+    Parameters:
+        historical_data: A pandas DataFrame or a mapping of column name to array-like
+            with "BTC/USDT", "ETH/USDT" and "ETH/BTC" columns, or the list of merged
+            records accepted by backtest_triangle_arbitrage_minute.
+
+    Returns:
+        tuple: (btc_usdt, eth_usdt, eth_btc) as float64 NumPy arrays.
+    """
+    if isinstance(historical_data, list):
+        historical_data = pd.DataFrame.from_records(historical_data)
+    return tuple(_price_column(historical_data[sym]) for sym in TRIANGLE_SYMBOLS)
+
+
+def compute_cycle_factors(btc_usdt, eth_usdt, eth_btc):
+    """
+    Computes both triangle cycle factors for every row.
+
+    Rows where a price is missing or zero are marked invalid (the loop treats
+    them as "no signal") and their factors are set to NaN.
+
+    Returns:
+        tuple: (cycle1, cycle2, valid) arrays.
+    """
+    btc_usdt = np.asarray(btc_usdt, dtype=np.float64)
+    eth_usdt = np.asarray(eth_usdt, dtype=np.float64)
+    eth_btc = np.asarray(eth_btc, dtype=np.float64)
+
+    valid = (btc_usdt != 0) & (eth_usdt != 0) & (eth_btc != 0)
+    valid &= ~(np.isnan(btc_usdt) | np.isnan(eth_usdt) | np.isnan(eth_btc))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cross = btc_usdt * eth_btc
+        cycle1 = np.where(valid, eth_usdt / cross, np.nan)
+        cycle2 = np.where(valid, cross / eth_usdt, np.nan)
+    return cycle1, cycle2, valid
+
+
+def trade_returns_from_cycles(cycle1, cycle2, trade_fraction=0.1, threshold=0.002):
+    """
+    Derives the per-record trade returns from precomputed cycle factors.
+
+    A record trades when either cycle factor exceeds 1 + threshold; the return is
+    trade_fraction * (selected_factor - 1), otherwise 0.
+    """
+    opp1 = cycle1 > (1 + threshold)
+    opp2 = cycle2 > (1 + threshold)
+    selected_factor = np.maximum(np.where(opp1, cycle1, 0.0), np.where(opp2, cycle2, 0.0))
+    traded = opp1 | opp2
+    return np.where(traded, trade_fraction * (selected_factor - 1.0), 0.0), opp1, opp2
+
+
+def summarize_returns(trade_returns, initial_portfolio=INITIAL_PORTFOLIO):
+    """
+    Compounds trade returns into a portfolio curve and computes the backtest statistics.
+
+    Returns:
+        dict: Same keys as OKXTrader.backtest_triangle_arbitrage_minute; portfolio_history
+        is a NumPy array that starts with the initial portfolio value.
+    """
+    n = len(trade_returns)
+    portfolio_history = np.empty(n + 1, dtype=np.float64)
+    portfolio_history[0] = initial_portfolio
+    np.cumprod(1.0 + trade_returns, out=portfolio_history[1:])
+    portfolio_history[1:] *= initial_portfolio
+
+    cumulative_return = (portfolio_history[-1] / initial_portfolio) - 1
+    avg_return = float(trade_returns.mean()) if n else 0
+    std_return = float(trade_returns.std()) if n else 0
+    sharpe_ratio = (avg_return / std_return * (MINUTES_PER_YEAR ** 0.5)) if std_return != 0 else float('inf')
+
+    running_peak = np.maximum.accumulate(portfolio_history)
+    max_drawdown = float(((running_peak - portfolio_history) / running_peak).max())
+
+    return {
+        "portfolio_history": portfolio_history,
+        "cumulative_return": float(cumulative_return),
+        "average_return": avg_return,
+        "std_return": std_return,
+        "sharpe_ratio": sharpe_ratio,
+        "max_drawdown": max_drawdown
+    }
+
+
+def run_vectorized_backtest(btc_usdt, eth_usdt, eth_btc, trade_fraction=0.1, threshold=0.002,
+                            initial_portfolio=INITIAL_PORTFOLIO):
+    """
+    Runs the triangle arbitrage minute backtest over whole price arrays.
+
+    Parameters:
+        btc_usdt, eth_usdt, eth_btc (array-like): Close prices, one row per minute.
+        trade_fraction (float): Fraction of the portfolio to use per trade (default 0.1).
+        threshold (float): Minimum arbitrage excess over 1 required to trigger a trade (default 0.002).
+        initial_portfolio (float): Starting portfolio value (default 10,000 USDT).
+
+    Returns:
+        dict: See summarize_returns, plus "trade_count" (number of executed trades).
+    """
+    cycle1, cycle2, _ = compute_cycle_factors(btc_usdt, eth_usdt, eth_btc)
+    trade_returns, opp1, opp2 = trade_returns_from_cycles(cycle1, cycle2, trade_fraction, threshold)
+    result = summarize_returns(trade_returns, initial_portfolio)
+    result["trade_count"] = int(np.count_nonzero(opp1 | opp2))
+    return result
+
+
+class StreamingBacktest:
+    """
+    Constant-memory version of the triangle backtest for histories larger than RAM.
+
+    Record batches are consumed one at a time (update) while only running statistics are kept:
+    Welford/Chan mean and variance of the trade returns, the current portfolio value and the
+    running peak / max drawdown. Optionally every 'equity_every'-th point of the portfolio curve
+    is retained, so memory stays bounded by history_length / equity_every.
+    """
+
+    def __init__(self, trade_fraction=0.1, threshold=0.002, initial_portfolio=INITIAL_PORTFOLIO,
+                 equity_every=None):
+        """
+        :param trade_fraction: Fraction of the portfolio to use per trade (default 0.1).
+        :param threshold: Minimum arbitrage excess over 1 required to trigger a trade (default 0.002).
+        :param initial_portfolio: Starting portfolio value (default 10,000 USDT).
+        :param equity_every: Keep every n-th portfolio value (None keeps no curve).
+        """
+        self.trade_fraction = trade_fraction
+        self.threshold = threshold
+        self.initial_portfolio = initial_portfolio
+        self.equity_every = equity_every
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.trade_count = 0
+        self.portfolio = initial_portfolio
+        self.peak = initial_portfolio
+        self.max_drawdown = 0.0
+        self.equity_curve = [initial_portfolio] if equity_every else None
+
+    def update(self, batch):
+        """
+        Consumes one batch (DataFrame, mapping of columns or list of records).
+        """
+        btc_usdt, eth_usdt, eth_btc = to_price_arrays(batch)
+        n = len(btc_usdt)
+        if n == 0:
+            return
+        cycle1, cycle2, _ = compute_cycle_factors(btc_usdt, eth_usdt, eth_btc)
+        trade_returns, opp1, opp2 = trade_returns_from_cycles(cycle1, cycle2, self.trade_fraction, self.threshold)
+        self.trade_count += int(np.count_nonzero(opp1 | opp2))
+
+        # Chan et al. parallel update of the running mean / sum of squared deviations.
+        batch_mean = float(trade_returns.mean())
+        batch_m2 = float(((trade_returns - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta * delta * self.count * n / total
+
+        portfolio = np.cumprod(1.0 + trade_returns)
+        portfolio *= self.portfolio
+        running_peak = np.maximum(np.maximum.accumulate(portfolio), self.peak)
+        self.max_drawdown = max(self.max_drawdown, float(((running_peak - portfolio) / running_peak).max()))
+        self.peak = float(running_peak[-1])
+
+        if self.equity_every:
+            # Positions in the global curve (index 0 is the initial value) that fall in this batch.
+            first = (-(self.count + 1)) % self.equity_every
+            self.equity_curve.extend(portfolio[first::self.equity_every].tolist())
+        self.portfolio = float(portfolio[-1])
+        self.count = total
+
+    def result(self):
+        """
+        Returns the same statistics as backtest_triangle_arbitrage_minute; portfolio_history
+        holds the downsampled curve (or None when equity_every is not set).
+        """
+        std_return = (self.m2 / self.count) ** 0.5 if self.count else 0
+        avg_return = self.mean if self.count else 0
+        return {
+            "portfolio_history": self.equity_curve,
+            "cumulative_return": (self.portfolio / self.initial_portfolio) - 1,
+            "average_return": avg_return,
+            "std_return": std_return,
+            "sharpe_ratio": (avg_return / std_return * (MINUTES_PER_YEAR ** 0.5)) if std_return != 0 else float('inf'),
+            "max_drawdown": self.max_drawdown,
+            "trade_count": self.trade_count,
+            "record_count": self.count
+        }
+
+
+def run_streaming_backtest(batches, trade_fraction=0.1, threshold=0.002, equity_every=None):
+    """
+    Runs StreamingBacktest over an iterable of record batches (e.g. TriangleHistoryStore.iter_partitions()).
+
+    Returns:
+        dict: See StreamingBacktest.result.
+    """
+    backtest = StreamingBacktest(trade_fraction=trade_fraction, threshold=threshold, equity_every=equity_every)
+    for batch in batches:
+        backtest.update(batch)
+    return backtest.result()
@@ -0,0 +1,226 @@
+"""
+basis_scanner.py
+
+Spot-vs-futures basis scanner for OKX.
+
+Each spot symbol (COIN_LIST, or every USDT spot pair) is paired with its
+USDT-margined perpetual swap and dated futures. Tickers are fetched in bulk
+(one fetch_tickers call per instrument type) and the basis, annualized basis
+and funding-adjusted carry of every pair are computed in one vectorized pandas
+pass, then ranked. backtest_basis_carry replays spot / derivative / funding
+series as columns for the historical counterpart.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import COIN_LIST, TAKER_FEE
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+DAY_MS = 86_400_000
+DEFAULT_FUNDING_INTERVAL_HOURS = 8
+
+
+def pair_instruments(markets, spot_symbols=None, quote="USDT"):
+    """
+    Pairs spot markets with their linear (quote-settled) swaps and dated futures.
+
+    :param markets: exchange.load_markets() output.
+    :param spot_symbols: Spot symbols to include (default: every active spot market quoted in 'quote').
+    :return: DataFrame with one row per (spot, derivative): spot, base, derivative, type, expiry.
+    """
+    table = pd.DataFrame.from_records(
+        [{"symbol": m["symbol"], "base": m["base"], "quote": m["quote"], "type": m.get("type"),
+          "settle": m.get("settle"), "linear": m.get("linear"), "active": m.get("active") is not False,
+          "expiry": m.get("expiry")} for m in markets.values()])
+    if table.empty:
+        return pd.DataFrame(columns=["spot", "base", "derivative", "type", "expiry"])
+    table = table[table["active"] & (table["quote"] == quote)]
+
+    spot = table[table["type"] == "spot"][["symbol", "base"]].rename(columns={"symbol": "spot"})
+    if spot_symbols is not None:
+        spot = spot[spot["spot"].isin(list(spot_symbols))]
+    derivatives = table[table["type"].isin(["swap", "future"]) & (table["settle"] == quote)
+                        & (table["linear"] != False)]
+    derivatives = derivatives[["symbol", "base", "type", "expiry"]].rename(columns={"symbol": "derivative"})
+    return spot.merge(derivatives, on="base", how="inner").reset_index(drop=True)
+
+
+def _ticker_frame(tickers, prefix):
+    """
+    Converts a fetch_tickers() dict into a DataFrame of bid/ask/last/mid columns named '<prefix>_*'.
+    """
+    frame = pd.DataFrame.from_records(
+        [{"symbol": sym, "bid": t.get("bid"), "ask": t.get("ask"), "last": t.get("last")}
+         for sym, t in tickers.items()], columns=["symbol", "bid", "ask", "last"])
+    frame[["bid", "ask", "last"]] = frame[["bid", "ask", "last"]].astype(np.float64)
+    frame["mid"] = ((frame["bid"] + frame["ask"]) / 2).fillna(frame["last"])
+    return frame.rename(columns={c: f"{prefix}_{c}" for c in ("bid", "ask", "last", "mid")})
+
+
+def compute_basis(pairs, spot_tickers, derivative_tickers, funding_rates=None, now_ms=None, fee=TAKER_FEE):
+    """
+    Computes basis and carry for every spot/derivative pair in one vectorized pass.
+
+    Columns added:
+        basis: derivative_mid / spot_mid - 1
+        entry_basis: executable cash-and-carry basis (sell derivative at bid, buy spot at ask)
+        days_to_expiry: for dated futures (NaN for swaps)
+        annualized_basis: basis * 365 / days_to_expiry (dated futures only)
+        funding_rate, annualized_funding: current swap funding and its annualized value
+        carry: annualized return of long spot / short derivative (annualized basis for futures,
+               annualized funding for swaps) net of four taker fees amortized over the holding period
+        direction: 'cash_and_carry' (long spot, short derivative), 'reverse' when carry is negative,
+                   or None when carry is unknown (e.g. a swap without a funding rate); such rows rank last
+
+    :return: DataFrame ranked by absolute carry, best first.
+    """
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    frame = pairs.merge(_ticker_frame(spot_tickers, "spot"), left_on="spot", right_on="symbol", how="inner")
+    frame = frame.drop(columns="symbol")
+    frame = frame.merge(_ticker_frame(derivative_tickers, "deriv"), left_on="derivative", right_on="symbol", how="inner")
+    frame = frame.drop(columns="symbol")
+
+    frame["basis"] = frame["deriv_mid"] / frame["spot_mid"] - 1
+    frame["entry_basis"] = frame["deriv_bid"] / frame["spot_ask"] - 1
+    expiry = pd.to_numeric(frame["expiry"], errors="coerce")
+    frame["days_to_expiry"] = np.where(frame["type"] == "future", (expiry - now_ms) / DAY_MS, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame["annualized_basis"] = frame["basis"] * 365 / frame["days_to_expiry"]
+
+    funding = pd.DataFrame.from_records(
+        [{"derivative": sym, "funding_rate": r.get("fundingRate"),
+          "funding_interval_hours": _interval_hours(r.get("interval"))}
+         for sym, r in (funding_rates or {}).items()],
+        columns=["derivative", "funding_rate", "funding_interval_hours"])
+    frame = frame.merge(funding, on="derivative", how="left")
+    frame["funding_rate"] = frame["funding_rate"].astype(np.float64)
+    frame["funding_interval_hours"] = frame["funding_interval_hours"].astype(np.float64).fillna(DEFAULT_FUNDING_INTERVAL_HOURS)
+    frame["annualized_funding"] = frame["funding_rate"] * (365 * 24 / frame["funding_interval_hours"])
+
+    # Round-trip fees (two legs in, two legs out), amortized over the holding period
+    # (time to expiry for futures, one year for swaps).
+    holding_years = np.where(frame["type"] == "future", frame["days_to_expiry"] / 365, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fee_drag = 4 * fee / holding_years
+    gross = np.where(frame["type"] == "future", frame["annualized_basis"], frame["annualized_funding"])
+    frame["carry"] = np.sign(gross) * np.maximum(np.abs(gross) - fee_drag, 0.0)
+    frame["direction"] = np.where(frame["carry"] >= 0, "cash_and_carry", "reverse")
+    frame["direction"] = frame["direction"].where(frame["carry"].notna(), None)
+
+    frame = frame.assign(_rank=frame["carry"].abs()).sort_values("_rank", ascending=False, na_position="last")
+    return frame.drop(columns="_rank").reset_index(drop=True)
+
+
+def _interval_hours(interval):
+    """
+    Parses a ccxt funding interval such as '8h' into hours (None if unknown).
+    """
+    if isinstance(interval, str) and interval.endswith("h"):
+        try:
+            return float(interval[:-1])
+        except ValueError:
+            return None
+    return None
+
+
+class BasisScanner:
+    """
+    Pairs spot symbols with OKX swaps/futures and ranks basis and carry opportunities.
+    """
+
+    def __init__(self, exchange, spot_symbols=None, all_usdt_pairs=False, fee=TAKER_FEE):
+        """
+        :param exchange: ccxt exchange (markets are loaded on first scan).
+        :param spot_symbols: Spot symbols to scan (default COIN_LIST).
+        :param all_usdt_pairs: Scan every active USDT spot pair instead of spot_symbols.
+        :param fee: Taker fee per leg used in the carry calculation.
+        """
+        self.exchange = exchange
+        self.spot_symbols = None if all_usdt_pairs else list(spot_symbols or COIN_LIST)
+        self.fee = fee
+        self.pairs = None
+
+    def load_pairs(self):
+        """
+        (Re)builds the spot/derivative pair table from the exchange markets.
+        """
+        self.pairs = pair_instruments(self.exchange.load_markets(), self.spot_symbols)
+        logger.info(f"Basis scanner tracking {len(self.pairs)} spot/derivative pairs.")
+        return self.pairs
+
+    def fetch_snapshot(self):
+        """
+        Fetches spot, swap and futures tickers in bulk (one request per instrument type)
+        plus swap funding rates. Returns (spot_tickers, derivative_tickers, funding_rates).
+        """
+        if self.pairs is None:
+            self.load_pairs()
+        spot_symbols = self.pairs["spot"].unique().tolist()
+        swaps = self.pairs.loc[self.pairs["type"] == "swap", "derivative"].unique().tolist()
+        futures = self.pairs.loc[self.pairs["type"] == "future", "derivative"].unique().tolist()
+
+        spot_tickers = self.exchange.fetch_tickers(spot_symbols) if spot_symbols else {}
+        derivative_tickers = {}
+        for symbols in (swaps, futures):
+            if symbols:
+                derivative_tickers.update(self.exchange.fetch_tickers(symbols))
+        funding_rates = {}
+        if swaps and self.exchange.has.get('fetchFundingRates'):
+            funding_rates = self.exchange.fetch_funding_rates(swaps)
+        return spot_tickers, derivative_tickers, funding_rates
+
+    def scan(self, top=None, min_abs_carry=0.0):
+        """
+        Returns ranked basis/carry opportunities as a DataFrame (see compute_basis).
+        """
+        spot_tickers, derivative_tickers, funding_rates = self.fetch_snapshot()
+        ranked = compute_basis(self.pairs, spot_tickers, derivative_tickers, funding_rates, fee=self.fee)
+        ranked = ranked[ranked["carry"].abs() >= min_abs_carry]
+        return ranked.head(top) if top else ranked
+
+
+def backtest_basis_carry(history, derivative="perp", fee=TAKER_FEE, periods_per_year=525600):
+    """
+    Replays a long-spot / short-derivative position over historical columns.
+
+    :param history: DataFrame with columns "spot", the derivative price column and optionally
+                    "funding_rate" (rate paid at that row's funding time, 0/NaN elsewhere).
+    :param derivative: Name of the derivative price column ("perp" or a dated future).
+    :param fee: Taker fee per leg; four legs are charged (open and close of both sides).
+    :param periods_per_year: Rows per year, for the Sharpe ratio (default: minute data).
+    :return: dict with equity_curve, cumulative_return, funding_pnl, basis_pnl, sharpe_ratio, max_drawdown.
+    """
+    spot = history["spot"].to_numpy(dtype=np.float64)
+    deriv = history[derivative].to_numpy(dtype=np.float64)
+    funding = history["funding_rate"].to_numpy(dtype=np.float64) if "funding_rate" in history else np.zeros(len(spot))
+    funding = np.nan_to_num(funding)
+    if len(spot) < 2:
+        return None
+
+    # Per-step return of a hedged unit notional: spot leg minus derivative leg, plus funding received
+    # by the short derivative (positive funding is paid by longs to shorts).
+    spot_ret = np.diff(spot) / spot[:-1]
+    deriv_ret = np.diff(deriv) / deriv[:-1]
+    basis_ret = spot_ret - deriv_ret
+    funding_ret = funding[1:]
+    step_returns = basis_ret + funding_ret
+    step_returns[0] -= 2 * fee
+    step_returns[-1] -= 2 * fee
+
+    equity = np.concatenate(([1.0], np.cumprod(1.0 + step_returns)))
+    running_peak = np.maximum.accumulate(equity)
+    std = step_returns.std()
+    return {
+        "equity_curve": equity,
+        "cumulative_return": float(equity[-1] - 1),
+        "funding_pnl": float(funding_ret.sum()),
+        "basis_pnl": float(basis_ret.sum()),
+        "sharpe_ratio": float(step_returns.mean() / std * np.sqrt(periods_per_year)) if std else float('inf'),
+        "max_drawdown": float(((running_peak - equity) / running_peak).max())
+    }
@@ -0,0 +1,241 @@
+"""
+benchmark.py
+
+Offline benchmark suite for the OKXTrader hot paths:
+
+  - check_triangle_arbitrage (per-record signal evaluation)
+  - backtest_triangle_arbitrage_minute / _vectorized / _streaming
+  - fetch_all_historical_triangle_data_incremental / _concurrent (against FakeExchange)
+  - calculate_pnl (over synthetic closed orders)
+  - the live signal-to-order loop replayed against FakeOKXExchange (--replay)
+
+Synthetic triangle price series and order histories are generated at each
+requested size. Every case reports wall time, throughput and peak traced
+memory, and the results are written as JSON so runs can be compared across
+commits.
+
+Usage:
+    python benchmark.py --sizes 1000,100000,10000000 --output bench_results.json
+    python benchmark.py --replay 3600 --replay-speed 100 --replay-latency 0.05 --replay-jitter 0.02
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from fake_exchange import (FakeExchange, FakeOKXExchange, ReplayDriver, synthetic_closed_orders, synthetic_ticks,
+                           synthetic_triangle_candles)
+from metrics import LatencyHistogram
+from okx_trader import OKXTrader
+
+
+def synthetic_triangle_prices(n: int, seed: int = 0):
+    """
+    Random-walk close prices for the three legs, with ETH/BTC noisy around the implied cross rate.
+    """
+    rng = np.random.default_rng(seed)
+    btc = 50000.0 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    eth = 2500.0 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    eth_btc = eth / btc * (1 + rng.normal(0, 2e-3, n))
+    return pd.DataFrame({"BTC/USDT": btc, "ETH/USDT": eth, "ETH/BTC": eth_btc})
+
+
+def _measure(func, with_memory=True):
+    """
+    Runs func once for timing and, optionally, once more under tracemalloc for peak memory.
+    Returns (seconds, peak_bytes or None).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if with_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def _record(results, name, rows, seconds, peak):
+    entry = {
+        "name": name,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else None,
+        "peak_memory_mb": peak / 1e6 if peak is not None else None
+    }
+    results.append(entry)
+    print(f"{name:<40} rows={rows:<10} {seconds:>10.4f}s  "
+          f"{entry['rows_per_second'] or 0:>14.0f} rows/s  "
+          f"peak={entry['peak_memory_mb'] if peak is not None else float('nan'):.1f} MB")
+
+
+def run_benchmarks(sizes, loop_cap=100000, download_cap=20000, download_latency=0.0, with_memory=True):
+    """
+    Runs every benchmark case at each size. Pure-Python paths (per-record signal, loop backtest,
+    downloads, calculate_pnl) are capped at loop_cap / download_cap rows so large sizes stay tractable.
+    """
+    results = []
+    workdir = tempfile.mkdtemp(prefix="okx_bench_")
+    for n in sizes:
+        prices = synthetic_triangle_prices(n)
+
+        # Signal evaluation and loop backtest (pure Python, capped).
+        loop_rows = min(n, loop_cap)
+        records = prices.iloc[:loop_rows].to_dict(orient="records")
+        trader = OKXTrader(exchange=FakeExchange())
+
+        def signal_loop():
+            for record in records:
+                trader.check_triangle_arbitrage(threshold=0.002, data=record)
+        _record(results, "check_triangle_arbitrage", loop_rows, *_measure(signal_loop, with_memory))
+        _record(results, "backtest_triangle_arbitrage_minute", loop_rows,
+                *_measure(lambda: trader.backtest_triangle_arbitrage_minute(records), with_memory))
+
+        # Columnar backtests over the full size.
+        _record(results, "backtest_triangle_arbitrage_vectorized", n,
+                *_measure(lambda: trader.backtest_triangle_arbitrage_vectorized(prices), with_memory))
+        batch = 100000
+        _record(results, "backtest_triangle_arbitrage_streaming", n,
+                *_measure(lambda: trader.backtest_triangle_arbitrage_streaming(
+                    prices.iloc[i:i + batch] for i in range(0, n, batch)), with_memory))
+
+        # History download against the fake exchange (capped).
+        minutes = min(n, download_cap)
+        start_dt = datetime(2025, 1, 1)
+        end_dt = start_dt + timedelta(minutes=minutes)
+        start_ms = int(start_dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        download_trader = OKXTrader(exchange=FakeExchange(synthetic_triangle_candles(start_ms, minutes),
+                                                          latency=download_latency))
+        filename = os.path.join(workdir, "history.json")
+        _record(results, "fetch_historical_incremental", minutes,
+                *_measure(lambda: download_trader.fetch_all_historical_triangle_data_incremental(
+                    start_dt, end_dt, filename=filename), with_memory))
+        _record(results, "fetch_historical_concurrent", minutes,
+                *_measure(lambda: download_trader.fetch_all_historical_triangle_data_concurrent(
+                    start_dt, end_dt, filename=filename, requests_per_second=1e6), with_memory))
+
+        # PnL over synthetic closed orders (capped).
+        order_count = min(n, loop_cap)
+        pnl_trader = OKXTrader(exchange=FakeExchange(closed_orders=synthetic_closed_orders(order_count)))
+
+        def pnl():
+            # calculate_pnl prints one line per coin; keep the benchmark table readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                pnl_trader.calculate_pnl("2025-01-01T00:00:00Z", "2030-01-01T00:00:00Z")
+        _record(results, "calculate_pnl", order_count, *_measure(pnl, with_memory))
+        del prices, records
+    return results
+
+
+def run_replay_benchmark(seconds=3600.0, speed=100.0, interval=1.0, latency=0.05, jitter=0.02,
+                         ticks_per_second=10.0, threshold=0.002, order_size=0.001, seed=0):
+    """
+    Replays synthetic ticks through OKXTrader's live loop: every 'interval' virtual seconds the
+    triangle signal is evaluated from fresh tickers and an opportunity sends a market order
+    (create + fetch_order). Latencies are virtual seconds, i.e. what the loop would see live.
+    """
+    ticks = synthetic_ticks(seconds=seconds, ticks_per_second=ticks_per_second, seed=seed)
+    exchange = FakeOKXExchange(ticks, speed=speed, latency=latency, jitter=jitter, seed=seed)
+    trader = OKXTrader(exchange=exchange)
+    # The snapshot ages in wall-clock time; always refetch so each step sees the replayed book.
+    trader.price_snapshot.max_staleness = 0.0
+    clock = exchange.clock
+    signal_to_ack = LatencyHistogram()
+    counts = {"signals": 0, "opportunities": 0, "orders": 0}
+
+    def step(now_ms):
+        started = clock.now()
+        result = trader.check_triangle_arbitrage(threshold=threshold)
+        counts["signals"] += 1
+        if result and (result["Cycle1_opportunity"] or result["Cycle2_opportunity"]):
+            counts["opportunities"] += 1
+            order = trader.place_market_order("buy", "BTC/USDT", order_size)
+            if order and not order.get('error'):
+                counts["orders"] += 1
+                signal_to_ack.record(clock.now() - started)
+
+    report = ReplayDriver(exchange).run(step, interval=interval)
+    report.update(counts)
+    report["requests"] = exchange.request_count
+    report["signal_to_ack"] = signal_to_ack.summary()
+    print(f"replay {report['virtual_seconds']:.0f}s virtual in {report['real_seconds']:.2f}s "
+          f"({report['speedup']:.1f}x), steps={report['steps']} skipped={report['skipped']} "
+          f"orders={report['orders']} requests={report['requests']} rate_limited={report['rate_limited']}")
+    for name in ("callback", "lag", "signal_to_ack"):
+        summary = report[name]
+        print(f"  {name:<14} n={summary['count']:<6} p50={summary['p50'] * 1e3:8.1f} ms  "
+              f"p99={summary['p99'] * 1e3:8.1f} ms  max={summary['max'] * 1e3:8.1f} ms")
+    return report
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    """
+    CLI entry point for the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(description="Offline benchmarks for OKXTrader hot paths.")
+    parser.add_argument("--sizes", default="1000,100000", help="Comma separated row counts (e.g. 1000,100000,10000000).")
+    parser.add_argument("--loop-cap", type=int, default=100000, help="Row cap for pure-Python paths.")
+    parser.add_argument("--download-cap", type=int, default=20000, help="Minute cap for download benchmarks.")
+    parser.add_argument("--download-latency", type=float, default=0.0, help="Fake exchange latency per request (s).")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory pass.")
+    parser.add_argument("--with-logging", action="store_true", help="Keep INFO log output enabled.")
+    parser.add_argument("--replay", type=float, default=None,
+                        help="Instead of the suite, replay this many virtual seconds of the live loop.")
+    parser.add_argument("--replay-speed", type=float, default=100.0, help="Replay speed (x real time).")
+    parser.add_argument("--replay-interval", type=float, default=1.0, help="Virtual seconds between loop steps.")
+    parser.add_argument("--replay-latency", type=float, default=0.05, help="Fake exchange round trip (virtual s).")
+    parser.add_argument("--replay-jitter", type=float, default=0.02, help="Extra uniform latency (virtual s).")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file.")
+    args = parser.parse_args()
+
+    # Hot-path events are already sampled and dropped in backtests; this also silences the remaining INFO lines.
+    if not args.with_logging:
+        logging.disable(logging.INFO)
+    report = {
+        "commit": _git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform()
+    }
+    if args.replay is not None:
+        report["replay"] = run_replay_benchmark(args.replay, speed=args.replay_speed, interval=args.replay_interval,
+                                                latency=args.replay_latency, jitter=args.replay_jitter)
+    else:
+        sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+        report["sizes"] = sizes
+        report["results"] = run_benchmarks(sizes, loop_cap=args.loop_cap, download_cap=args.download_cap,
+                                           download_latency=args.download_latency, with_memory=not args.no_memory)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Benchmark results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
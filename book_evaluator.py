@@ -0,0 +1,253 @@
+"""
+book_evaluator.py
+
+Executable (bid/ask and depth aware) evaluation of the BTC/USDT, ETH/USDT,
+ETH/BTC triangle.
+
+check_triangle_arbitrage compares 'last' prices only. Here each cycle is
+priced the way it would actually trade, starting from a USDT notional:
+
+    Cycle 1: USDT -> BTC (buy BTC/USDT on the asks)
+             BTC  -> ETH (buy ETH/BTC on the asks)
+             ETH  -> USDT (sell ETH/USDT on the bids)
+    Cycle 2: USDT -> ETH (buy ETH/USDT on the asks)
+             ETH  -> BTC (sell ETH/BTC on the bids)
+             BTC  -> USDT (sell BTC/USDT on the bids)
+
+Every leg walks the book level by level and pays the taker fee. The scalar
+functions work on ccxt-style order books and are cheap enough to run on every
+book update; the *_batch functions evaluate many historical snapshots at once
+with NumPy.
+"""
+
+import numpy as np
+
+from config import TAKER_FEE
+
+# (symbol, side) for each leg of each cycle; 'buy' spends quote, 'sell' spends base.
+CYCLE_LEGS = {
+    1: (("BTC/USDT", "buy"), ("ETH/BTC", "buy"), ("ETH/USDT", "sell")),
+    2: (("ETH/USDT", "buy"), ("ETH/BTC", "sell"), ("BTC/USDT", "sell")),
+}
+
+
+# ---------------------------
+# Scalar (single book) evaluation
+# ---------------------------
+def buy_with_quote(asks, quote_amount, fee=TAKER_FEE):
+    """
+    Spends quote_amount on the asks. Returns the base amount received net of fees,
+    or None if the book is not deep enough.
+    """
+    remaining = quote_amount
+    received = 0.0
+    for level in asks:
+        price, size = level[0], level[1]
+        level_quote = price * size
+        if remaining <= level_quote:
+            received += remaining / price
+            return received * (1 - fee)
+        received += size
+        remaining -= level_quote
+    return None
+
+
+def sell_base(bids, base_amount, fee=TAKER_FEE):
+    """
+    Sells base_amount into the bids. Returns the quote amount received net of fees,
+    or None if the book is not deep enough.
+    """
+    remaining = base_amount
+    received = 0.0
+    for level in bids:
+        price, size = level[0], level[1]
+        if remaining <= size:
+            received += remaining * price
+            return received * (1 - fee)
+        received += size * price
+        remaining -= size
+    return None
+
+
+def cycle_output(books, cycle, notional, fee=TAKER_FEE):
+    """
+    Runs 'notional' USDT through the given cycle (1 or 2) and returns the USDT received,
+    or None if any leg runs out of depth.
+
+    :param books: Dict symbol -> {"bids": [[price, size], ...], "asks": [[price, size], ...]}
+                  (ccxt fetch_order_book format, best level first).
+    """
+    amount = notional
+    for symbol, side in CYCLE_LEGS[cycle]:
+        book = books[symbol]
+        amount = buy_with_quote(book["asks"], amount, fee) if side == "buy" else sell_base(book["bids"], amount, fee)
+        if amount is None:
+            return None
+    return amount
+
+
+def _cycle_capacity(books, cycle):
+    """
+    Upper bound on the USDT notional the first leg of the cycle can absorb.
+    """
+    symbol, _ = CYCLE_LEGS[cycle][0]
+    return sum(level[0] * level[1] for level in books[symbol]["asks"])
+
+
+def max_profitable_size(books, cycle, fee=TAKER_FEE, min_profit=0.0, tolerance=1e-6, max_iterations=60):
+    """
+    Largest USDT notional whose executable cycle factor still exceeds 1 + min_profit.
+
+    The average fill price of every leg only gets worse with size, so the executable factor
+    is non-increasing in notional and a bisection finds the boundary.
+    """
+    high = _cycle_capacity(books, cycle)
+    if high <= 0:
+        return 0.0
+    # Marginal factor at (almost) zero size: if the top of book is not profitable, nothing is.
+    probe = min(high, 1e-9 * max(high, 1.0))
+    out = cycle_output(books, cycle, probe, fee)
+    if out is None or out / probe <= 1 + min_profit:
+        return 0.0
+    low = probe
+    for _ in range(max_iterations):
+        if high - low <= tolerance * high:
+            break
+        mid = (low + high) / 2
+        out = cycle_output(books, cycle, mid, fee)
+        if out is not None and out / mid > 1 + min_profit:
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+def evaluate_books(books, notional, threshold=0.002, fee=TAKER_FEE, with_max_size=True):
+    """
+    Executable counterpart of OKXTrader.check_triangle_arbitrage.
+
+    :param books: Dict symbol -> ccxt-style order book (top of book only is fine).
+    :param notional: USDT size to evaluate.
+    :param threshold: Minimum executable excess over 1 to flag an opportunity.
+    :param fee: Taker fee per leg.
+    :param with_max_size: Also compute the maximum profitable size per cycle.
+    :return: Dict with executable cycle factors (None when the book is too thin),
+             opportunity flags and, optionally, maximum profitable sizes in USDT.
+    """
+    result = {"notional": notional, "fee": fee, "threshold": threshold}
+    for cycle in (1, 2):
+        out = cycle_output(books, cycle, notional, fee)
+        factor = out / notional if out is not None else None
+        result[f"Cycle{cycle}_factor"] = factor
+        result[f"Cycle{cycle}_opportunity"] = factor is not None and factor > (1 + threshold)
+        if with_max_size:
+            result[f"Cycle{cycle}_max_size"] = max_profitable_size(books, cycle, fee)
+    return result
+
+
+def books_from_quotes(quotes):
+    """
+    Builds one-level books from a latest-quote table such as LiveTriangleEngine.quotes
+    (dicts with "bid", "ask", "bid_size", "ask_size"). Missing sizes count as empty levels.
+    """
+    return {symbol: {"bids": [[q["bid"], q.get("bid_size") or 0.0]] if q.get("bid") else [],
+                     "asks": [[q["ask"], q.get("ask_size") or 0.0]] if q.get("ask") else []}
+            for symbol, q in quotes.items()}
+
+
+# ---------------------------
+# Vectorized (batch of snapshots) evaluation
+# ---------------------------
+def _levels(px, sz):
+    """
+    Normalizes (n,) or (n, L) price/size arrays; missing levels (NaN) get zero size.
+    """
+    px = np.asarray(px, dtype=np.float64)
+    sz = np.asarray(sz, dtype=np.float64)
+    if px.ndim == 1:
+        px, sz = px[:, None], sz[:, None]
+    missing = np.isnan(px) | np.isnan(sz) | (px <= 0)
+    return np.where(missing, 1.0, px), np.where(missing, 0.0, sz)
+
+
+def buy_with_quote_batch(ask_px, ask_sz, quote_amount, fee=TAKER_FEE):
+    """
+    Vectorized buy_with_quote. quote_amount is a scalar or (n,) array; rows without
+    enough depth return NaN.
+    """
+    px, sz = _levels(ask_px, ask_sz)
+    quote_amount = np.broadcast_to(np.asarray(quote_amount, dtype=np.float64), (px.shape[0],))
+    level_quote = px * sz
+    cum_before = np.cumsum(level_quote, axis=1) - level_quote
+    spent = np.clip(quote_amount[:, None] - cum_before, 0.0, level_quote)
+    received = (spent / px).sum(axis=1) * (1 - fee)
+    return np.where(quote_amount <= level_quote.sum(axis=1), received, np.nan)
+
+
+def sell_base_batch(bid_px, bid_sz, base_amount, fee=TAKER_FEE):
+    """
+    Vectorized sell_base. base_amount is a scalar or (n,) array; rows without enough
+    depth (or with a NaN amount) return NaN.
+    """
+    px, sz = _levels(bid_px, bid_sz)
+    base_amount = np.broadcast_to(np.asarray(base_amount, dtype=np.float64), (px.shape[0],))
+    cum_before = np.cumsum(sz, axis=1) - sz
+    filled = np.clip(base_amount[:, None] - cum_before, 0.0, sz)
+    received = (filled * px).sum(axis=1) * (1 - fee)
+    return np.where(base_amount <= sz.sum(axis=1), received, np.nan)
+
+
+def cycle_output_batch(books, cycle, notional, fee=TAKER_FEE):
+    """
+    Vectorized cycle_output over n snapshots.
+
+    :param books: Dict symbol -> {"bid_px", "bid_sz", "ask_px", "ask_sz"} arrays of shape (n,)
+                  for top of book or (n, L) for L depth levels (NaN-padded).
+    :param notional: Scalar or (n,) USDT notionals.
+    """
+    amount = notional
+    for symbol, side in CYCLE_LEGS[cycle]:
+        book = books[symbol]
+        if side == "buy":
+            amount = buy_with_quote_batch(book["ask_px"], book["ask_sz"], amount, fee)
+        else:
+            amount = sell_base_batch(book["bid_px"], book["bid_sz"], amount, fee)
+    return amount
+
+
+def max_profitable_size_batch(books, cycle, fee=TAKER_FEE, min_profit=0.0, iterations=50):
+    """
+    Vectorized max_profitable_size: a fixed number of bisection steps applied to all rows at once.
+    """
+    symbol, _ = CYCLE_LEGS[cycle][0]
+    px, sz = _levels(books[symbol]["ask_px"], books[symbol]["ask_sz"])
+    high = (px * sz).sum(axis=1)
+    probe = np.maximum(high * 1e-9, 1e-12)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profitable = cycle_output_batch(books, cycle, probe, fee) / probe > 1 + min_profit
+        low = np.where(profitable, probe, 0.0)
+        high = np.where(profitable, high, 0.0)
+        for _ in range(iterations):
+            mid = (low + high) / 2
+            ok = cycle_output_batch(books, cycle, mid, fee) / mid > 1 + min_profit
+            low = np.where(ok, mid, low)
+            high = np.where(ok, high, mid)
+    return low
+
+
+def evaluate_books_batch(books, notional, threshold=0.002, fee=TAKER_FEE, with_max_size=True):
+    """
+    Vectorized evaluate_books over a batch of historical book snapshots.
+
+    :return: Dict of (n,) arrays: Cycle{1,2}_factor (NaN where depth is insufficient),
+             Cycle{1,2}_opportunity and, optionally, Cycle{1,2}_max_size in USDT.
+    """
+    result = {}
+    for cycle in (1, 2):
+        with np.errstate(invalid='ignore'):
+            factor = cycle_output_batch(books, cycle, notional, fee) / notional
+            result[f"Cycle{cycle}_factor"] = factor
+            result[f"Cycle{cycle}_opportunity"] = factor > (1 + threshold)
+        if with_max_size:
+            result[f"Cycle{cycle}_max_size"] = max_profitable_size_batch(books, cycle, fee)
+    return result
@@ -3,6 +3,9 @@
 # Define a safe margin to use in trading calculations to avoid insufficient balance issues
 SAFE_MARGIN = 50.0  # This value can be adjusted based on your risk management strategy
 
+# Taker fee per leg used when evaluating executable (bid/ask) arbitrage cycles
+TAKER_FEE = 0.001  # OKX regular-tier spot taker fee (0.1%)
+
 # Flag to determine if the script should run in simulation mode or live mode
 IS_SIMULATION = True
 
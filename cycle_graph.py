@@ -0,0 +1,236 @@
+"""
+cycle_graph.py
+
+Generalized N-asset cycle detection over the OKX spot market graph.
+
+Every active spot market BASE/QUOTE contributes two directed edges between
+currencies: QUOTE -> BASE (buy at the ask) and BASE -> QUOTE (sell at the
+bid). Edge weights are negative log conversion rates including the taker fee,
+so a cycle is profitable exactly when its weights sum to a negative number.
+
+All triangular (and optionally 4-leg) cycles are enumerated once and stored as
+an integer matrix of edge ids. A price update only touches the two edges of one
+market, so only the cycles passing through those edges are re-scored, which is
+a single fancy-indexed NumPy sum. A Bellman-Ford pass is available to detect
+negative cycles of any length.
+"""
+
+import math
+
+import numpy as np
+
+from config import TAKER_FEE
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+
+class CurrencyGraph:
+    """
+    Currency graph with precomputed cycles and incremental, per-edge re-scoring.
+    """
+
+    def __init__(self, symbols, bases, quotes, max_length=3, max_cycles=200000, fee=TAKER_FEE):
+        """
+        :param symbols: Market symbols, e.g. ["BTC/USDT", "ETH/BTC", ...].
+        :param bases, quotes: Base and quote currency of each symbol.
+        :param max_length: Longest cycle to precompute (3 or 4).
+        :param max_cycles: Stop enumerating after this many cycles.
+        :param fee: Taker fee applied on every leg.
+        """
+        if max_length not in (3, 4):
+            raise ValueError("max_length must be 3 or 4.")
+        self.symbols = list(symbols)
+        self.symbol_index = {sym: i for i, sym in enumerate(self.symbols)}
+        self.currencies = sorted(set(bases) | set(quotes))
+        self.currency_index = {c: i for i, c in enumerate(self.currencies)}
+        self.fee_weight = -math.log(1 - fee)
+
+        # Edge 2*i: quote -> base (buy symbol i); edge 2*i+1: base -> quote (sell symbol i).
+        n_edges = 2 * len(self.symbols)
+        self.edge_from = np.empty(n_edges, dtype=np.int64)
+        self.edge_to = np.empty(n_edges, dtype=np.int64)
+        for i, (base, quote) in enumerate(zip(bases, quotes)):
+            b, q = self.currency_index[base], self.currency_index[quote]
+            self.edge_from[2 * i], self.edge_to[2 * i] = q, b
+            self.edge_from[2 * i + 1], self.edge_to[2 * i + 1] = b, q
+        # Last slot is a zero-weight sentinel used to pad shorter cycles.
+        self.sentinel = n_edges
+        self.weights = np.full(n_edges + 1, np.nan)
+        self.weights[self.sentinel] = 0.0
+
+        self.cycle_edges = self._enumerate_cycles(max_length, max_cycles)
+        self.scores = np.full(len(self.cycle_edges), np.nan)
+        self.edge_cycles = self._index_edges()
+        logger.info(f"Currency graph: {len(self.currencies)} currencies, {len(self.symbols)} markets, "
+                    f"{len(self.cycle_edges)} cycles (max length {max_length}).")
+
+    @classmethod
+    def from_markets(cls, markets, quote_currencies=None, max_length=3, max_cycles=200000, fee=TAKER_FEE):
+        """
+        Builds the graph from exchange.load_markets() output, keeping active spot markets.
+
+        :param quote_currencies: Optional whitelist of currencies; markets whose base or quote is
+                                 not in it are skipped (keeps the cycle count manageable).
+        """
+        symbols, bases, quotes = [], [], []
+        allowed = set(quote_currencies) if quote_currencies else None
+        for symbol, market in markets.items():
+            if not market.get('spot') or market.get('active') is False:
+                continue
+            if allowed is not None and (market['base'] not in allowed or market['quote'] not in allowed):
+                continue
+            symbols.append(symbol)
+            bases.append(market['base'])
+            quotes.append(market['quote'])
+        return cls(symbols, bases, quotes, max_length=max_length, max_cycles=max_cycles, fee=fee)
+
+    # ---------------------------
+    # Precomputation
+    # ---------------------------
+    def _enumerate_cycles(self, max_length, max_cycles):
+        """
+        Lists every simple directed cycle of length 3 (and 4) once, starting from its
+        lowest-numbered currency. Returns an (n_cycles, max_length) matrix of edge ids.
+        """
+        adjacency = {}
+        for edge in range(len(self.edge_from)):
+            adjacency.setdefault(int(self.edge_from[edge]), []).append((int(self.edge_to[edge]), edge))
+        closing = {(int(self.edge_from[e]), int(self.edge_to[e])): e for e in range(len(self.edge_from))}
+
+        cycles = []
+        for a in sorted(adjacency):
+            for b, e1 in adjacency[a]:
+                if b <= a:
+                    continue
+                for c, e2 in adjacency.get(b, []):
+                    if c <= a or c == b:
+                        continue
+                    e3 = closing.get((c, a))
+                    if e3 is not None:
+                        cycles.append((e1, e2, e3) + (self.sentinel,) * (max_length - 3))
+                    if max_length == 4:
+                        for d, e3 in adjacency.get(c, []):
+                            if d <= a or d in (b, c):
+                                continue
+                            e4 = closing.get((d, a))
+                            if e4 is not None:
+                                cycles.append((e1, e2, e3, e4))
+                    if len(cycles) >= max_cycles:
+                        logger.warning(f"Cycle enumeration stopped at max_cycles={max_cycles}.")
+                        return np.array(cycles[:max_cycles], dtype=np.int64)
+        return np.array(cycles, dtype=np.int64).reshape(-1, max_length)
+
+    def _index_edges(self):
+        """
+        Maps every edge id to the array of cycle ids passing through it.
+        """
+        flat = self.cycle_edges.ravel()
+        cycle_ids = np.repeat(np.arange(len(self.cycle_edges)), self.cycle_edges.shape[1])
+        order = np.argsort(flat, kind='stable')
+        flat, cycle_ids = flat[order], cycle_ids[order]
+        bounds = np.searchsorted(flat, np.arange(self.sentinel + 2))
+        return [cycle_ids[bounds[e]:bounds[e + 1]] for e in range(self.sentinel)]
+
+    # ---------------------------
+    # Updates
+    # ---------------------------
+    def update_price(self, symbol, bid, ask=None):
+        """
+        Updates one market and re-scores only the cycles that use it.
+
+        :param bid: Best bid (or last price when ask is None).
+        :param ask: Best ask.
+        :return: Array of the re-scored cycle ids.
+        """
+        i = self.symbol_index.get(symbol)
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        ask = bid if ask is None else ask
+        buy_edge, sell_edge = 2 * i, 2 * i + 1
+        # buy: 1 QUOTE -> 1/ask BASE; sell: 1 BASE -> bid QUOTE
+        self.weights[buy_edge] = (math.log(ask) if ask and ask > 0 else np.nan) + self.fee_weight
+        self.weights[sell_edge] = (-math.log(bid) if bid and bid > 0 else np.nan) + self.fee_weight
+        affected = np.concatenate((self.edge_cycles[buy_edge], self.edge_cycles[sell_edge]))
+        if len(affected):
+            self.scores[affected] = self.weights[self.cycle_edges[affected]].sum(axis=1)
+        return affected
+
+    def update_from_tickers(self, tickers):
+        """
+        Applies a bulk fetch_tickers() result (bid/ask, falling back to last) and re-scores every cycle once.
+        """
+        for symbol, ticker in tickers.items():
+            i = self.symbol_index.get(symbol)
+            if i is None:
+                continue
+            bid = ticker.get('bid') or ticker.get('last')
+            ask = ticker.get('ask') or ticker.get('last')
+            self.weights[2 * i] = (math.log(ask) if ask else np.nan) + self.fee_weight
+            self.weights[2 * i + 1] = (-math.log(bid) if bid else np.nan) + self.fee_weight
+        if len(self.cycle_edges):
+            self.scores = self.weights[self.cycle_edges].sum(axis=1)
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+    def profitable_cycles(self, threshold=0.0, cycle_ids=None):
+        """
+        Returns the ids of cycles whose factor exceeds 1 + threshold, best first.
+
+        :param cycle_ids: Restrict the check to these cycles (e.g. the ids returned by update_price).
+        """
+        cycle_ids = np.arange(len(self.scores)) if cycle_ids is None else np.asarray(cycle_ids)
+        scores = self.scores[cycle_ids]
+        with np.errstate(invalid='ignore'):
+            hits = cycle_ids[scores < -math.log1p(threshold)]
+        return hits[np.argsort(self.scores[hits])]
+
+    def describe_cycle(self, cycle_id):
+        """
+        Returns the legs of a cycle as [(symbol, side, from_currency, to_currency), ...] and its factor.
+        """
+        legs = []
+        for edge in self.cycle_edges[cycle_id]:
+            if edge == self.sentinel:
+                continue
+            legs.append((self.symbols[edge // 2], 'buy' if edge % 2 == 0 else 'sell',
+                         self.currencies[self.edge_from[edge]], self.currencies[self.edge_to[edge]]))
+        return {"legs": legs, "factor": float(np.exp(-self.scores[cycle_id]))}
+
+    def find_negative_cycle(self):
+        """
+        Bellman-Ford over all priced edges (from a virtual source connected to every currency).
+        Returns a negative cycle of any length as a list of currencies, or None.
+        """
+        priced = ~np.isnan(self.weights[:self.sentinel])
+        src, dst, w = self.edge_from[priced], self.edge_to[priced], self.weights[:self.sentinel][priced]
+        n = len(self.currencies)
+        dist = np.zeros(n)
+        parent = np.full(n, -1, dtype=np.int64)
+        updated = None
+        for _ in range(n):
+            candidate = dist[src] + w
+            improve = candidate < dist[dst] - 1e-15
+            if not improve.any():
+                return None
+            # Apply the best improvement per destination: sort by (destination, candidate) and keep
+            # the first edge of each destination (assignment with repeated indices has no defined winner).
+            idx = np.nonzero(improve)[0]
+            idx = idx[np.lexsort((candidate[idx], dst[idx]))]
+            _, first = np.unique(dst[idx], return_index=True)
+            best = idx[first]
+            dist[dst[best]] = candidate[best]
+            parent[dst[best]] = src[best]
+            updated = dst[best[0]]
+        # Still relaxing after n rounds: walk back n steps to land inside the cycle.
+        node = int(updated)
+        for _ in range(n):
+            node = int(parent[node])
+        cycle, current = [node], int(parent[node])
+        while current != node:
+            cycle.append(current)
+            current = int(parent[current])
+        path = [self.currencies[c] for c in reversed(cycle)]
+        return path + [path[0]]
@@ -0,0 +1,511 @@
+"""
+event_backtester.py
+
+Event-driven, tick-level backtest of the BTC/USDT, ETH/USDT, ETH/BTC triangle.
+
+backtest_triangle_arbitrage_minute assumes every signal fills instantly at the
+minute close. Here the three legs are simulated the way they would trade:
+
+  - Market data is a TickStream (fake_exchange) of top-of-book quotes. The
+    executable cycle factors (touch prices, fee per leg, see book_evaluator)
+    are evaluated for every tick in vectorized chunks. Only the ticks where a
+    cycle clears the threshold become candidate signals.
+  - Signals and leg orders are merged by one priority-queue event loop. A
+    signal is acted on 'signal_latency' after its tick. Each leg reaches the
+    exchange after its own order latency (plus jitter) and is matched against
+    the book at that moment, not at the signal.
+  - Legs are market orders (depth slippage through the fill model), IOC limits
+    at the signal price (missed if the book moved away) or passive maker
+    orders. Maker orders join the queue behind the displayed size at their
+    price, move up as that size is consumed and fill on a trade-through. Any
+    remainder at 'maker_timeout' is hedged at market.
+  - Inventory a cycle leaves behind (missed or partial legs) is unwound at the
+    touch when the cycle completes, so PnL is what the account would really
+    end up with.
+
+Market data is never copied into per-event objects. Ticks stay in the
+stream's NumPy columns and the heap only holds (time, kind, sequence, order)
+tuples for slotted leg orders, so runs over tens of millions of ticks are
+bounded by the vectorized signal scan. latency_sweep reruns a configuration
+over a range of order latencies to show PnL as a function of end-to-end latency.
+"""
+
+import heapq
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from book_evaluator import CYCLE_LEGS
+from config import TAKER_FEE
+from fake_exchange import DepthFill
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+TRIANGLE_SYMBOLS = ("BTC/USDT", "ETH/USDT", "ETH/BTC")
+CURRENCIES = ("USDT", "BTC", "ETH")
+LEG_MODES = ("market", "ioc", "maker")
+MAKER_FEE = 0.0008  # OKX regular-tier spot maker fee (0.08%)
+SCAN_CHUNK = 1 << 20
+
+# Event kinds, in tie-break order at equal times
+EVENT_FILL = 0
+EVENT_ARRIVAL = 1
+
+
+class _LegOrder:
+    """
+    One leg of one cycle, from decision to fill.
+    """
+
+    __slots__ = ("trade", "leg", "symbol", "side", "amount", "limit", "mode", "hedge", "filled", "price", "fee",
+                 "sent", "arrived", "done_at")
+
+    def __init__(self, trade, leg, symbol, side, amount, limit, mode, hedge=False):
+        self.trade = trade
+        self.leg = leg
+        self.symbol = symbol
+        self.side = side
+        self.amount = amount
+        self.limit = limit
+        self.mode = mode
+        self.hedge = hedge
+        self.filled = 0.0
+        self.price = 0.0
+        self.fee = 0.0
+        self.sent = 0.0
+        self.arrived = 0.0
+        self.done_at = 0.0
+
+
+class _Cycle:
+    """
+    An in-flight triangle: balances per currency (USDT, BTC, ETH) and its leg orders.
+    """
+
+    __slots__ = ("id", "cycle", "signal_ms", "decision_ms", "notional", "factor", "balances", "legs", "pending")
+
+    def __init__(self, trade_id, cycle, signal_ms, decision_ms, notional, factor):
+        self.id = trade_id
+        self.cycle = cycle
+        self.signal_ms = signal_ms
+        self.decision_ms = decision_ms
+        self.notional = notional
+        self.factor = factor
+        self.balances = [notional, 0.0, 0.0]
+        self.legs = []
+        self.pending = 3
+
+
+def _currency_index(currency):
+    return CURRENCIES.index(currency)
+
+
+def scan_signals(ticks, threshold=0.0, fee=TAKER_FEE, chunk=SCAN_CHUNK):
+    """
+    Executable cycle factors at every tick (vectorized, chunk by chunk) and the ticks where one clears the threshold.
+
+    Cycle 1 buys BTC/USDT and ETH/BTC on the asks and sells ETH/USDT on the bids; cycle 2 is the reverse
+    (see book_evaluator). Each leg pays 'fee'. Rows before all three symbols have quoted never signal.
+
+    :param ticks: fake_exchange.TickStream with the three triangle symbols.
+    :param threshold: Minimum excess of the net cycle factor over 1.
+    :return: (rows, cycles, factors): tick indexes, cycle (1 or 2) and net factor of every candidate signal.
+    """
+    index = [ticks.symbols.index(sym) for sym in TRIANGLE_SYMBOLS]
+    carry = np.full(3, -1, dtype=np.int64)
+    keep = (1 - fee) ** 3
+    rows, cycles, factors = [], [], []
+    for start in range(0, len(ticks), chunk):
+        end = min(start + chunk, len(ticks))
+        positions = np.arange(start, end, dtype=np.int64)
+        symbols = ticks.symbol[start:end]
+        last = []
+        for k, s in enumerate(index):
+            # Row of the latest quote of symbol s at every tick (forward fill)
+            latest = np.maximum.accumulate(np.where(symbols == s, positions, -1))
+            latest[latest < 0] = carry[k]
+            carry[k] = latest[-1]
+            last.append(latest)
+        ready = (last[0] >= 0) & (last[1] >= 0) & (last[2] >= 0)
+        if not ready.any():
+            continue
+        btc, eth, cross = (np.where(ready, row, 0) for row in last)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cycle1 = ticks.bid[eth] / (ticks.ask[btc] * ticks.ask[cross]) * keep
+            cycle2 = ticks.bid[cross] * ticks.bid[btc] / ticks.ask[eth] * keep
+        best = np.where(cycle1 >= cycle2, cycle1, cycle2)
+        hits = np.flatnonzero(ready & (best > 1 + threshold))
+        rows.append(hits + start)
+        cycles.append(np.where(cycle1[hits] >= cycle2[hits], 1, 2).astype(np.int8))
+        factors.append(best[hits])
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8), np.empty(0)
+    return np.concatenate(rows), np.concatenate(cycles), np.concatenate(factors)
+
+
+class EventBacktester:
+    """
+    Priority-queue simulation of triangle cycles with signal/order latency, queue position and slippage.
+    """
+
+    def __init__(self, ticks, notional=1000.0, threshold=0.0, signal_latency=0.0, order_latency=0.0,
+                 report_latency=None, jitter=0.0, leg_mode="market", sequential=False, fill_model=None,
+                 fee=TAKER_FEE, maker_fee=MAKER_FEE, maker_timeout=1.0, max_open=1, cooldown=0.0, seed=0):
+        """
+        :param ticks: fake_exchange.TickStream with BTC/USDT, ETH/USDT and ETH/BTC quotes.
+        :param notional: USDT put through each cycle.
+        :param threshold: Minimum net (after fees) excess of the executable cycle factor over 1.
+        :param signal_latency: Seconds from a tick to the trading decision (feed + evaluation).
+        :param order_latency: Seconds from sending a leg to its arrival at the exchange; one value or one per leg.
+        :param report_latency: Seconds for a fill report to come back (sequential legs wait for it);
+                               defaults to the leg's order latency.
+        :param jitter: Extra uniform [0, jitter) seconds on every order latency.
+        :param leg_mode: "market", "ioc" (limit at the signal price) or "maker" (passive at the own-side touch).
+        :param sequential: Send each leg once the previous one has filled (sized from what it returned)
+                           instead of all three at the decision (sized from signal prices).
+        :param fill_model: Market/IOC fill model from fake_exchange (default DepthFill()).
+        :param fee: Taker fee per leg (also used by the signal).
+        :param maker_fee: Fee of maker fills.
+        :param maker_timeout: Seconds a maker leg rests before its remainder is hedged at market.
+        :param max_open: Maximum number of cycles in flight.
+        :param cooldown: Seconds after a signal before another one is taken.
+        :param seed: Seed of the latency jitter and fill-model randomness.
+        """
+        if leg_mode not in LEG_MODES:
+            raise ValueError(f"leg_mode must be one of {LEG_MODES}, got {leg_mode!r}")
+        self.ticks = ticks
+        self.notional = notional
+        self.threshold = threshold
+        self.signal_latency = signal_latency * 1000.0
+        latencies = order_latency if np.ndim(order_latency) else (order_latency,) * 3
+        self.order_latency = tuple(float(l) * 1000.0 for l in latencies)
+        self.report_latency = (self.order_latency if report_latency is None
+                               else (float(report_latency) * 1000.0,) * 3)
+        self.jitter = jitter * 1000.0
+        self.leg_mode = leg_mode
+        self.sequential = sequential
+        self.fill_model = fill_model or DepthFill()
+        self.fee = fee
+        self.maker_fee = maker_fee
+        self.maker_timeout = maker_timeout * 1000.0
+        self.max_open = max_open
+        self.cooldown = cooldown * 1000.0
+        self.rng = np.random.default_rng(seed)
+        self.symbol_index = {sym: ticks.symbols.index(sym) for sym in TRIANGLE_SYMBOLS}
+        self._heap = []
+        self._sequence = 0
+        self.events = 0
+
+    # ---------------------------
+    # Market state
+    # ---------------------------
+    def _ticks_through(self, t_ms):
+        """
+        Number of ticks with timestamp <= t_ms (event times are fractional milliseconds).
+        """
+        return int(np.searchsorted(self.ticks.timestamp, math.floor(t_ms), side='right'))
+
+    def _row_at(self, symbol, t_ms):
+        """
+        Index of the latest tick of 'symbol' at or before t_ms (None before its first quote).
+        """
+        s = self.symbol_index[symbol]
+        end = self._ticks_through(t_ms)
+        span = 64
+        while end > 0:
+            start = max(0, end - span)
+            hits = np.flatnonzero(self.ticks.symbol[start:end] == s)
+            if len(hits):
+                return start + int(hits[-1])
+            end, span = start, span * 4
+        return None
+
+    def _touch(self, symbol, side, t_ms):
+        """
+        (price, size) a 'side' order would trade against at t_ms: the ask for a buy, the bid for a sell.
+        """
+        row = self._row_at(symbol, t_ms)
+        if side == 'buy':
+            return float(self.ticks.ask[row]), float(self.ticks.ask_size[row])
+        return float(self.ticks.bid[row]), float(self.ticks.bid_size[row])
+
+    def _latency(self, leg):
+        return self.order_latency[leg] + (self.rng.uniform(0.0, self.jitter) if self.jitter else 0.0)
+
+    def _push(self, t_ms, kind, order):
+        self._sequence += 1
+        heapq.heappush(self._heap, (t_ms, kind, self._sequence, order))
+
+    # ---------------------------
+    # Orders
+    # ---------------------------
+    def _leg_amounts(self, cycle, t_ms):
+        """
+        Leg sizes for a cycle sent all at once, from the touch prices seen at the signal.
+        """
+        keep = 1 - self.fee
+        prices = {sym: (self._touch(sym, 'buy', t_ms)[0], self._touch(sym, 'sell', t_ms)[0])
+                  for sym in TRIANGLE_SYMBOLS}
+        amounts, limits = [], []
+        holding = self.notional
+        for symbol, side in CYCLE_LEGS[cycle]:
+            ask, bid = prices[symbol]
+            if side == 'buy':
+                amount = holding / ask
+                holding = amount * keep
+                limits.append(ask)
+            else:
+                amount = holding
+                holding = amount * bid * keep
+                limits.append(bid)
+            amounts.append(amount)
+        return amounts, limits
+
+    def _send(self, trade, leg, t_ms, amount=None, limit=None):
+        """
+        Sends one leg; returns False (nothing sent) when a sequential leg has nothing to spend.
+        """
+        symbol, side = CYCLE_LEGS[trade.cycle][leg]
+        if amount is None:
+            # Sequential: spend what the previous leg returned, priced at the current touch
+            base, quote = (_currency_index(c) for c in symbol.split('/'))
+            price = self._touch(symbol, side, t_ms)[0]
+            amount = trade.balances[quote] / price if side == 'buy' else trade.balances[base]
+            limit = price
+            if amount <= 0:
+                return False
+        order = _LegOrder(trade, leg, symbol, side, amount, limit, self.leg_mode)
+        order.sent = t_ms
+        trade.legs.append(order)
+        self._push(t_ms + self._latency(leg), EVENT_ARRIVAL, order)
+        return True
+
+    def _arrive(self, order, t_ms):
+        order.arrived = t_ms
+        if order.mode == "maker":
+            self._rest(order, t_ms)
+            return
+        touch, size = self._touch(order.symbol, order.side, t_ms)
+        if order.mode == "ioc":
+            worse = touch > order.limit if order.side == 'buy' else touch < order.limit
+            filled, price = (0.0, touch) if worse else self.fill_model.fill(order.side, order.amount, touch, size,
+                                                                            'limit', self.rng)
+        else:
+            filled, price = self.fill_model.fill(order.side, order.amount, touch, size, 'market', self.rng)
+        self._record_fill(order, filled, price, self.fee, t_ms)
+        self._push(t_ms, EVENT_FILL, order)
+
+    def _rest(self, order, t_ms):
+        """
+        Maker leg: queue behind the displayed size at the own-side touch, fill as the queue ahead is consumed.
+
+        The queue ahead shrinks by every decrease of the displayed size at the order's price (trades and
+        cancels ahead are not told apart); the order fills in full when the level is traded through (the
+        opposite side reaches its price or the own side drops below it). The unfilled remainder is hedged
+        at market 'maker_timeout' after arrival.
+        """
+        own = 'sell' if order.side == 'buy' else 'buy'
+        price, queue_ahead = self._touch(order.symbol, own, t_ms)
+        order.limit = price
+        start = self._ticks_through(t_ms)
+        end = self._ticks_through(t_ms + self.maker_timeout)
+        rows = start + np.flatnonzero(self.ticks.symbol[start:end] == self.symbol_index[order.symbol])
+        filled, done_at = 0.0, t_ms + self.maker_timeout
+        if len(rows):
+            if order.side == 'buy':
+                level, level_size, opposite = self.ticks.bid[rows], self.ticks.bid_size[rows], self.ticks.ask[rows]
+                through = (opposite <= price) | (level < price)
+            else:
+                level, level_size, opposite = self.ticks.ask[rows], self.ticks.ask_size[rows], self.ticks.bid[rows]
+                through = (opposite >= price) | (level > price)
+            at_price = level == price
+            previous = np.concatenate(([queue_ahead], np.where(at_price, level_size, 0.0)[:-1]))
+            consumed = np.cumsum(np.where(at_price, np.maximum(previous - level_size, 0.0), 0.0))
+            ours = np.clip(consumed - queue_ahead, 0.0, order.amount)
+            ours[np.maximum.accumulate(through)] = order.amount
+            complete = np.flatnonzero(ours >= order.amount)
+            if len(complete):
+                filled, done_at = order.amount, float(self.ticks.timestamp[rows[complete[0]]])
+            else:
+                filled = float(ours[-1])
+        self._record_fill(order, filled, price, self.maker_fee, done_at)
+        self._push(done_at, EVENT_FILL, order)
+
+    def _record_fill(self, order, filled, price, fee, t_ms):
+        trade = order.trade
+        base, quote = (_currency_index(c) for c in order.symbol.split('/'))
+        filled = max(0.0, min(filled, order.amount))
+        if order.side == 'buy':
+            trade.balances[quote] -= filled * price
+            trade.balances[base] += filled * (1 - fee)
+            order.fee += filled * price * fee
+        else:
+            trade.balances[base] -= filled
+            trade.balances[quote] += filled * price * (1 - fee)
+            order.fee += filled * price * fee
+        cost = order.filled * order.price + filled * price
+        order.filled += filled
+        order.price = cost / order.filled if order.filled else price
+        order.done_at = t_ms
+
+    def _on_fill(self, order, t_ms):
+        """
+        Handles a finished leg order; returns its cycle once every leg is done, else None.
+        """
+        trade = order.trade
+        remainder = order.amount - order.filled
+        if order.mode == "maker" and remainder > 1e-12:
+            # Hedge the unfilled part with a market order
+            hedge = _LegOrder(trade, order.leg, order.symbol, order.side, remainder, order.limit, "market", True)
+            hedge.sent = t_ms
+            trade.legs.append(hedge)
+            self._push(t_ms + self._latency(order.leg), EVENT_ARRIVAL, hedge)
+            return None
+        if self.sequential:
+            # The next leg spends what this one returned; a missed leg ends the cycle
+            if order.leg < 2 and self._send(trade, order.leg + 1, t_ms + self.report_latency[order.leg]):
+                return None
+            return trade
+        trade.pending -= 1
+        return trade if trade.pending == 0 else None
+
+    def _close(self, trade, t_ms):
+        """
+        Unwinds leftover BTC/ETH at the touch (taker fee) and returns the cycle's result row.
+        """
+        balances = list(trade.balances)
+        for currency, symbol in (("ETH", "ETH/USDT"), ("BTC", "BTC/USDT")):
+            amount = balances[_currency_index(currency)]
+            if abs(amount) < 1e-15:
+                continue
+            side = 'sell' if amount > 0 else 'buy'
+            price = self._touch(symbol, side, t_ms)[0]
+            balances[0] += amount * price * (1 - self.fee) if amount > 0 else amount * price * (1 + self.fee)
+        legs = trade.legs
+        primary = [order for order in legs if not order.hedge]
+        btc_price = self._touch("BTC/USDT", 'sell', t_ms)[0]
+        expected = trade.notional * (trade.factor - 1)
+        return {
+            "trade_id": trade.id,
+            "cycle": trade.cycle,
+            "signal_ms": trade.signal_ms,
+            "completed_ms": t_ms,
+            "duration_ms": t_ms - trade.signal_ms,
+            "notional": trade.notional,
+            "signal_factor": trade.factor,
+            "expected_pnl": expected,
+            "pnl": balances[0] - trade.notional,
+            "residual_btc": trade.balances[1],
+            "residual_eth": trade.balances[2],
+            "fill_ratio": sum(o.filled for o in primary) / sum(o.amount for o in primary),
+            "fees": sum(o.fee * (1.0 if o.symbol.endswith("/USDT") else btc_price) for o in legs),
+            "hedges": len(legs) - len(primary),
+            "missed_legs": 3 - sum(1 for o in primary if o.filled > 0)
+        }
+
+    # ---------------------------
+    # Event loop
+    # ---------------------------
+    def run(self):
+        """
+        Replays the whole stream.
+
+        :return: Dict with 'trades' (DataFrame, one row per cycle) and the summary statistics
+                 (trade_count, total/mean PnL, expected PnL at signal prices, hit rate, ticks, events, seconds).
+        """
+        started = time.perf_counter()
+        rows, cycles, factors = scan_signals(self.ticks, self.threshold, self.fee)
+        signal_times = self.ticks.timestamp[rows]
+        self._heap, self._sequence, self.events = [], 0, 0
+        results = []
+        open_trades = 0
+        trade_id = 0
+        now = -math.inf
+        taken_until = -math.inf
+        while True:
+            signal_at = math.inf
+            if open_trades < self.max_open:
+                # Signals decided while every slot was busy are gone; so are those inside the cooldown
+                earliest = max(taken_until, now - self.signal_latency)
+                candidate = 0 if earliest == -math.inf else int(np.searchsorted(signal_times, math.ceil(earliest),
+                                                                                side='left'))
+                if candidate < len(rows):
+                    signal_at = float(signal_times[candidate]) + self.signal_latency
+            event_at = self._heap[0][0] if self._heap else math.inf
+            if signal_at == math.inf and event_at == math.inf:
+                break
+            self.events += 1
+            if signal_at <= event_at:
+                now = signal_at
+                trade_id += 1
+                signal_ms = float(signal_times[candidate])
+                trade = _Cycle(trade_id, int(cycles[candidate]), signal_ms, signal_at, self.notional,
+                               float(factors[candidate]))
+                open_trades += 1
+                taken_until = signal_ms + max(self.cooldown, 1.0)
+                if self.sequential:
+                    self._send(trade, 0, signal_at)
+                else:
+                    amounts, limits = self._leg_amounts(trade.cycle, signal_ms)
+                    for leg in range(3):
+                        self._send(trade, leg, signal_at, amounts[leg], limits[leg])
+                continue
+            t_ms, kind, _, order = heapq.heappop(self._heap)
+            now = t_ms
+            if kind == EVENT_ARRIVAL:
+                self._arrive(order, t_ms)
+            elif kind == EVENT_FILL:
+                done = self._on_fill(order, t_ms)
+                if done is not None:
+                    open_trades -= 1
+                    results.append(self._close(done, t_ms))
+        trades = pd.DataFrame(results)
+        elapsed = time.perf_counter() - started
+        pnl = trades["pnl"].to_numpy() if len(trades) else np.empty(0)
+        summary = {
+            "trades": trades,
+            "trade_count": len(trades),
+            "signal_count": len(rows),
+            "total_pnl": float(pnl.sum()),
+            "mean_pnl": float(pnl.mean()) if len(pnl) else 0.0,
+            "expected_pnl": float(trades["expected_pnl"].sum()) if len(trades) else 0.0,
+            "hit_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+            "mean_duration_ms": float(trades["duration_ms"].mean()) if len(trades) else 0.0,
+            "ticks": len(self.ticks),
+            "events": len(self.ticks) + self.events,
+            "seconds": elapsed
+        }
+        logger.info(f"Event backtest: {summary['trade_count']} cycles over {len(self.ticks)} ticks, "
+                    f"total_pnl={summary['total_pnl']:.4f} (expected {summary['expected_pnl']:.4f}) "
+                    f"in {elapsed:.2f}s")
+        return summary
+
+
+def latency_sweep(ticks, latencies, **kwargs):
+    """
+    Runs EventBacktester once per order latency (same for every leg) with everything else fixed.
+
+    :param latencies: Order latencies in seconds.
+    :param kwargs: Other EventBacktester arguments (signal_latency, leg_mode, notional, ...).
+    :return: DataFrame indexed by end_to_end_latency (signal + order latency, seconds) with
+             trade_count, total_pnl, mean_pnl, expected_pnl, hit_rate and capture (total / expected PnL).
+    """
+    signal_latency = kwargs.get("signal_latency", 0.0)
+    rows = []
+    for latency in latencies:
+        result = EventBacktester(ticks, order_latency=latency, **kwargs).run()
+        rows.append({
+            "end_to_end_latency": signal_latency + latency,
+            "order_latency": latency,
+            "trade_count": result["trade_count"],
+            "total_pnl": result["total_pnl"],
+            "mean_pnl": result["mean_pnl"],
+            "expected_pnl": result["expected_pnl"],
+            "hit_rate": result["hit_rate"],
+            "capture": result["total_pnl"] / result["expected_pnl"] if result["expected_pnl"] else np.nan
+        })
+    return pd.DataFrame(rows).set_index("end_to_end_latency")
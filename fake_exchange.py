@@ -0,0 +1,827 @@
+"""
+fake_exchange.py
+
+An in-process stand-in for the ccxt OKX exchange object, used to exercise
+OKXTrader offline. It serves canned candles with an artificial per-request
+delay so that download paths can be timed without touching the network.
+AsyncFakeExchange exposes the same data through awaitable methods, mirroring
+ccxt.async_support.
+
+FakeOKXExchange replays a recorded or synthetic tick stream (TickStream) on a
+virtual clock, with per-request latency and jitter, OKX's per-endpoint rate
+limits and pluggable fill models. ReplayDriver steps a strategy through the
+stream, in real time, N times faster, or as fast as possible on a manual
+clock, so the full signal-to-order loop can be benchmarked reproducibly.
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from ccxt.base.errors import ArgumentsRequired, RateLimitExceeded
+
+from rate_limiter import OKX_ENDPOINT_LIMITS
+
+TRIANGLE_SYMBOLS = ("BTC/USDT", "ETH/USDT", "ETH/BTC")
+DEFAULT_PRICES = {"BTC/USDT": 50000.0, "ETH/USDT": 2500.0, "ETH/BTC": 0.05}
+# Retention of the OKX history endpoints by ccxt 'method' (None: the default 7-day order history)
+OKX_HISTORY_WINDOWS_MS = {None: 7 * 86_400_000, 'privateGetTradeOrdersHistory': 7 * 86_400_000,
+                          'privateGetTradeOrdersHistoryArchive': 90 * 86_400_000, 'fills': 90 * 86_400_000}
+OKX_PAGE_LIMIT = 100
+
+
+def synthetic_closed_orders(count: int, start_ms: int = None, seed: int = 0, symbols=("BTC/USDT", "ETH/USDT")):
+    """
+    Builds 'count' filled ccxt-style orders alternating buys and sells over the given symbols,
+    one per second from start_ms (default: ending now, inside OKX's history retention).
+    """
+    rng = np.random.default_rng(seed)
+    if start_ms is None:
+        start_ms = int(time.time() * 1000) - count * 1000
+    base_prices = DEFAULT_PRICES
+    orders = []
+    for i in range(count):
+        symbol = symbols[i % len(symbols)]
+        price = base_prices.get(symbol, 100.0) * (1 + rng.normal(0, 0.01))
+        amount = float(rng.uniform(0.001, 0.1))
+        cost = price * amount
+        orders.append({
+            'id': str(i), 'symbol': symbol, 'side': 'buy' if (i // len(symbols)) % 2 == 0 else 'sell',
+            'type': 'limit', 'status': 'closed', 'timestamp': start_ms + i * 1000,
+            'price': price, 'average': price, 'amount': amount, 'filled': amount, 'cost': cost,
+            'fee': {'cost': cost * 0.001, 'currency': 'USDT'}
+        })
+    return orders
+
+
+def synthetic_triangle_candles(start_ms: int, minutes: int, seed: int = 0, missing_ratio: float = 0.0):
+    """
+    Builds random-walk 1m OHLCV candles for BTC/USDT, ETH/USDT and ETH/BTC.
+
+    :param start_ms: Timestamp (ms) of the first candle.
+    :param minutes: Number of candles per symbol.
+    :param seed: Random seed, so runs are reproducible.
+    :param missing_ratio: Fraction of candles randomly dropped per symbol (to exercise alignment).
+    :return: Dict mapping symbol -> list of [timestamp, open, high, low, close, volume].
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = start_ms + np.arange(minutes, dtype=np.int64) * 60_000
+    btc = 50000.0 * np.exp(np.cumsum(rng.normal(0, 1e-3, minutes)))
+    eth = 2500.0 * np.exp(np.cumsum(rng.normal(0, 1e-3, minutes)))
+    eth_btc = eth / btc * (1 + rng.normal(0, 1e-3, minutes))
+    closes = {"BTC/USDT": btc, "ETH/USDT": eth, "ETH/BTC": eth_btc}
+
+    candles = {}
+    for sym, close in closes.items():
+        keep = rng.random(minutes) >= missing_ratio
+        rows = []
+        for ts, c in zip(timestamps[keep].tolist(), close[keep].tolist()):
+            rows.append([ts, c, c * 1.0005, c * 0.9995, c, 1.0])
+        candles[sym] = rows
+    return candles
+
+
+def _fake_market(symbol: str):
+    """
+    ccxt-style spot market entry with OKX-like precision and limits.
+    """
+    base, quote = symbol.split('/')
+    tick = {"USDT": 0.1 if base == "BTC" else 0.01}.get(quote, 0.00001)
+    return {
+        'id': f"{base}-{quote}", 'symbol': symbol, 'base': base, 'quote': quote, 'type': 'spot',
+        'spot': True, 'active': True,
+        'precision': {'amount': 1e-8, 'price': tick},
+        'limits': {'amount': {'min': 0.00001 if base == "BTC" else 0.0001, 'max': None}, 'cost': {'min': None}}
+    }
+
+
+class FakeExchange:
+    """
+    Minimal ccxt-compatible exchange serving canned data.
+
+    Only the methods OKXTrader relies on for construction, tickers, history download,
+    order-history PnL and order placement are implemented. Orders are matched
+    against the ticker: marketable orders fill (optionally partially, see
+    fill_ratios) at the touch, IOC remainders are canceled and resting limit orders stay open. Every request sleeps 'latency' seconds to simulate a round trip.
+    """
+
+    def __init__(self, candles=None, latency: float = 0.0, balance: dict = None, closed_orders=None, prices: dict = None,
+                 fill_ratios: dict = None, fee: float = 0.001):
+        """
+        :param candles: Dict mapping symbol -> list of OHLCV rows sorted by timestamp.
+        :param latency: Artificial delay per request, in seconds.
+        :param balance: 'total' balances returned by fetch_balance.
+        :param closed_orders: ccxt-style order dicts returned by fetch_closed_orders (their fills by fetch_my_trades).
+        :param prices: Last prices served by fetch_ticker(s) (default: last candle close, else a fixed quote).
+                       Symbols not in the triangle get a market too.
+        :param fill_ratios: Fraction of each marketable order filled per symbol (default 1.0, i.e. full fills).
+        :param fee: Taker fee charged on simulated fills.
+        """
+        self.candles = candles or {}
+        self.latency = latency
+        self.balance = balance or {'USDT': 10000.0}
+        self.closed_orders = closed_orders or []
+        self.prices = dict(DEFAULT_PRICES)
+        self.prices.update({sym: rows[-1][4] for sym, rows in (candles or {}).items() if rows})
+        self.prices.update(prices or {})
+        self.markets = {sym: _fake_market(sym) for sym in (*TRIANGLE_SYMBOLS, *(prices or {}))}
+        self.fill_ratios = fill_ratios or {}
+        self.fee = fee
+        self.orders = {}
+        self.order_listeners = []
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._history_cache = {}
+        # Timestamp index per symbol for O(log n) 'since' lookups.
+        self._timestamps = {sym: np.array([c[0] for c in rows], dtype=np.int64)
+                            for sym, rows in self.candles.items()}
+
+    def _request(self, method=None):
+        with self.lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _now_ms(self):
+        return int(time.time() * 1000)
+
+    @staticmethod
+    def parse8601(text):
+        if text is None:
+            return None
+        dt = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() * 1000)
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=100, params=None):
+        self._request('fetch_ohlcv')
+        rows = self.candles.get(symbol, [])
+        start = 0
+        if since is not None:
+            start = int(np.searchsorted(self._timestamps[symbol], since, side='left')) if rows else 0
+        return [list(row) for row in rows[start:start + limit]]
+
+    def load_markets(self, reload=False, params=None):
+        self._request('load_markets')
+        return self.markets
+
+    def _ticker(self, symbol):
+        last = self.prices[symbol]
+        spread = last * 0.0001
+        return {'symbol': symbol, 'timestamp': self._now_ms(), 'last': last,
+                'bid': last - spread / 2, 'ask': last + spread / 2, 'baseVolume': 1.0}
+
+    def fetch_ticker(self, symbol, params=None):
+        self._request('fetch_ticker')
+        return self._ticker(symbol)
+
+    def fetch_tickers(self, symbols=None, params=None):
+        self._request('fetch_tickers')
+        symbols = self.prices.keys() if symbols is None else symbols
+        return {sym: self._ticker(sym) for sym in symbols if sym in self.prices}
+
+    def fetch_balance(self, params=None):
+        self._request('fetch_balance')
+        return {'total': dict(self.balance)}
+
+    # ---------------------------
+    # Order simulation
+    # ---------------------------
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        self._request('create_order')
+        return self._match_order(symbol, type, side, amount, price, params)
+
+    def _match_order(self, symbol, type, side, amount, price=None, params=None):
+        params = params or {}
+        ticker = self._ticker(symbol)
+        touch = ticker['ask'] if side == 'buy' else ticker['bid']
+        marketable = type == 'market' or (price >= touch if side == 'buy' else price <= touch)
+        filled, touch = self._fill(symbol, type, side, float(amount), touch) if marketable else (0.0, touch)
+        if filled >= amount:
+            status = 'closed'
+        elif type == 'market' or params.get('timeInForce') == 'IOC':
+            status = 'canceled'
+        else:
+            status = 'open'
+        with self.lock:
+            order_id = str(len(self.orders) + 1)
+            order = {
+                'id': order_id, 'clientOrderId': params.get('clientOrderId'), 'symbol': symbol,
+                'type': type, 'side': side, 'status': status, 'timestamp': self._now_ms(),
+                'price': price if price is not None else touch, 'average': touch if filled else None,
+                'amount': float(amount), 'filled': filled, 'remaining': float(amount) - filled,
+                'cost': filled * touch, 'fee': {'cost': filled * touch * self.fee, 'currency': symbol.split('/')[1]}
+            }
+            self.orders[order_id] = order
+        self._publish(order)
+        # The REST acknowledgement carries no fill information, as on OKX.
+        return {'id': order_id, 'clientOrderId': order['clientOrderId'], 'symbol': symbol, 'status': None}
+
+    def _fill(self, symbol, type, side, amount, touch):
+        """
+        Fill of a marketable order: (filled amount, average price).
+        """
+        return amount * self.fill_ratios.get(symbol, 1.0), touch
+
+    def create_market_order(self, symbol, side, amount, price=None, params=None):
+        return self.create_order(symbol, 'market', side, amount, price, params)
+
+    def create_limit_order(self, symbol, side, amount, price, params=None):
+        return self.create_order(symbol, 'limit', side, amount, price, params)
+
+    def fetch_order(self, id, symbol=None, params=None):
+        self._request('fetch_order')
+        return dict(self.orders[id])
+
+    def cancel_order(self, id, symbol=None, params=None):
+        self._request('cancel_order')
+        order = self.orders[id]
+        if order['status'] == 'open':
+            order['status'] = 'canceled'
+            self._publish(order)
+        return dict(order)
+
+    def _symbol_for(self, inst_id):
+        return next(sym for sym, m in self.markets.items() if m['id'] == inst_id)
+
+    def private_post_trade_batch_orders(self, params):
+        """
+        OKX batch-orders: list of raw order requests, one response row per order.
+        """
+        self._request('private_post_trade_batch_orders')
+        if len(params) > 20:
+            raise ValueError("OKX batch-orders accepts at most 20 orders.")
+        rows = []
+        for request in params:
+            symbol = self._symbol_for(request['instId'])
+            price = float(request['px']) if request.get('px') else None
+            ack = self._match_order(symbol, request['ordType'], request['side'], float(request['sz']), price,
+                                    {'clientOrderId': request.get('clOrdId')})
+            rows.append({'ordId': ack['id'], 'clOrdId': request.get('clOrdId') or '', 'sCode': '0', 'sMsg': ''})
+        return {'code': '0', 'msg': '', 'data': rows}
+
+    def private_post_trade_cancel_batch_orders(self, params):
+        """
+        OKX cancel-batch-orders: list of {'instId', 'ordId'}, one response row per order.
+        """
+        self._request('private_post_trade_cancel_batch_orders')
+        if len(params) > 20:
+            raise ValueError("OKX cancel-batch-orders accepts at most 20 orders.")
+        rows = []
+        for request in params:
+            order = self.orders.get(request['ordId'])
+            if order is None or order['status'] != 'open':
+                rows.append({'ordId': request['ordId'], 'sCode': '51400', 'sMsg': 'Order does not exist or is not open'})
+                continue
+            order['status'] = 'canceled'
+            self._publish(order)
+            rows.append({'ordId': request['ordId'], 'sCode': '0', 'sMsg': ''})
+        return {'code': '0', 'msg': '', 'data': rows}
+
+    privatePostTradeBatchOrders = private_post_trade_batch_orders
+    privatePostTradeCancelBatchOrders = private_post_trade_cancel_batch_orders
+
+    def _publish(self, order):
+        for listener in list(self.order_listeners):
+            listener(dict(order))
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params=None):
+        self._request('fetch_open_orders')
+        return [dict(o) for o in self.orders.values()
+                if o['status'] == 'open' and (symbol is None or o['symbol'] == symbol)]
+
+    fetchOpenOrders = fetch_open_orders
+
+    def _history(self, kind, symbol):
+        """
+        Closed orders ('orders') or their fills ('trades') of one symbol (None: all) sorted by timestamp,
+        with their timestamp index; rebuilt when closed_orders is replaced or grows.
+        """
+        key = (kind, symbol, id(self.closed_orders), len(self.closed_orders))
+        cached = self._history_cache.get(key)
+        if cached is None:
+            items = [o for o in self.closed_orders if symbol is None or o['symbol'] == symbol]
+            if kind == 'trades':
+                items = [{'id': o['id'], 'order': o['id'], 'symbol': o['symbol'], 'side': o['side'],
+                          'timestamp': o['timestamp'], 'price': o.get('average') or o.get('price'),
+                          'amount': o.get('filled', o.get('amount')), 'cost': o.get('cost'), 'fee': o.get('fee')}
+                         for o in items if o.get('filled', o.get('amount'))]
+            items.sort(key=lambda item: item['timestamp'])
+            cached = (items, np.array([item['timestamp'] for item in items], dtype=np.int64))
+            self._history_cache[key] = cached
+        return cached
+
+    def _history_page(self, kind, symbol, since, limit, params, window_ms):
+        """
+        One page of history as ccxt okx returns it: OKX serves the newest 'limit' records created in
+        [since, until] within its retention window, and ccxt sorts them oldest first.
+        """
+        params = params or {}
+        if params.get('paginate') and since is None:
+            # ccxt okx paginates fetchClosedOrders forward, which needs a starting point.
+            raise ArgumentsRequired("okx pagination requires a since argument when paginationDirection set to forward")
+        floor = self._now_ms() - window_ms
+        since = floor if since is None else max(since, floor)
+        until = params.get('until')
+        items, timestamps = self._history(kind, symbol)
+        lo = int(np.searchsorted(timestamps, since, side='left'))
+        hi = len(items) if until is None else int(np.searchsorted(timestamps, until, side='right'))
+        if limit:
+            lo = max(lo, hi - min(limit, OKX_PAGE_LIMIT))
+        return [dict(item) for item in items[lo:hi]]
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params=None):
+        self._request('fetch_closed_orders')
+        params = params or {}
+        window = OKX_HISTORY_WINDOWS_MS.get(params.get('method'), OKX_HISTORY_WINDOWS_MS[None])
+        return self._history_page('orders', symbol, since, limit, params, window)
+
+    fetchClosedOrders = fetch_closed_orders
+
+    def fetch_my_trades(self, symbol=None, since=None, limit=None, params=None):
+        self._request('fetch_my_trades')
+        return self._history_page('trades', symbol, since, limit, params, OKX_HISTORY_WINDOWS_MS['fills'])
+
+    fetchMyTrades = fetch_my_trades
+
+
+class AsyncFakeExchange:
+    """
+    Awaitable wrapper around FakeExchange, mirroring ccxt.async_support (and ccxt.pro's watch_orders).
+
+    Request methods sleep 'latency' seconds with asyncio.sleep, so concurrent calls
+    overlap the way they do over a shared HTTP session. Order updates are delivered
+    through watch_orders 'fill_latency' seconds after the order reaches the fake matching engine.
+    """
+
+    REQUEST_METHODS = {
+        'fetch_ohlcv', 'load_markets', 'fetch_ticker', 'fetch_tickers', 'fetch_balance',
+        'fetch_open_orders', 'fetchOpenOrders', 'fetch_closed_orders', 'fetchClosedOrders',
+        'create_order', 'create_market_order', 'create_limit_order', 'fetch_order', 'cancel_order'
+    }
+
+    def __init__(self, latency: float = 0.0, fill_latency: float = 0.0, **kwargs):
+        """
+        :param latency: Artificial delay per request, in seconds.
+        :param fill_latency: Delay between a fill and its order-stream update, in seconds.
+        :param kwargs: Passed to FakeExchange (candles, balance, closed_orders, prices, fill_ratios, fee).
+        """
+        self.sync = FakeExchange(latency=0.0, **kwargs)
+        self.latency = latency
+        self.fill_latency = fill_latency
+        self.has = {'watchOrders': True}
+        self.closed = False
+        self._loop = None
+        self._updates = None
+        self._backlog = []
+        self.sync.order_listeners.append(self._on_order)
+
+    def _on_order(self, order):
+        # Called by the fake matching engine, possibly from another thread than the watcher's loop.
+        if self._loop is None:
+            self._backlog.append(order)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, order)
+
+    def _deliver(self, order):
+        self._loop.call_later(self.fill_latency, self._updates.put_nowait, order)
+
+    async def watch_orders(self, symbol=None, since=None, limit=None, params=None):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._updates = asyncio.Queue()
+            for order in self._backlog:
+                self._deliver(order)
+            self._backlog = []
+        updates = [await self._updates.get()]
+        while not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if name not in self.REQUEST_METHODS:
+            return attr
+
+        async def request(*args, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return attr(*args, **kwargs)
+        return request
+
+    async def close(self):
+        self.closed = True
+
+
+# ---------------------------
+# Deterministic market replay
+# ---------------------------
+class VirtualClock:
+    """
+    Exchange-side clock for replays.
+
+    With a numeric 'speed' virtual time runs that many times faster than the wall clock and
+    sleeps are shortened accordingly. With speed=None the clock is manual: it only moves
+    when advanced or slept on, so a single-threaded replay is fully deterministic and runs
+    as fast as the code allows.
+    """
+
+    def __init__(self, start_ms: int, speed: float = 1.0):
+        self.start = start_ms / 1000.0
+        self.speed = speed
+        self.offset = 0.0
+        self._t0 = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def manual(self):
+        return self.speed is None
+
+    def now(self) -> float:
+        if self.manual:
+            return self.start + self.offset
+        return self.start + (time.monotonic() - self._t0) * self.speed + self.offset
+
+    def now_ms(self) -> int:
+        return int(self.now() * 1000)
+
+    def sleep(self, seconds: float):
+        if seconds <= 0:
+            return
+        if self.manual:
+            with self.lock:
+                self.offset += seconds
+        else:
+            time.sleep(seconds / self.speed)
+
+    def advance_to(self, t: float):
+        """
+        Moves to virtual time 't' (seconds): a jump on a manual clock, a scaled wait otherwise.
+        """
+        if self.manual:
+            with self.lock:
+                self.offset = max(self.offset, t - self.start)
+        else:
+            self.sleep(t - self.now())
+
+
+class TickStream:
+    """
+    Columnar top-of-book stream: timestamp (ms), symbol index, bid, ask, bid size, ask size.
+    """
+
+    FIELDS = ("timestamp", "symbol", "bid", "ask", "bid_size", "ask_size")
+
+    def __init__(self, symbols, timestamp, symbol, bid, ask, bid_size=None, ask_size=None):
+        """
+        :param symbols: Symbol names; 'symbol' holds indexes into this list.
+        :param timestamp: int64 milliseconds, non-decreasing.
+        """
+        self.symbols = list(symbols)
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.symbol = np.asarray(symbol, dtype=np.int16)
+        self.bid = np.asarray(bid, dtype=np.float64)
+        self.ask = np.asarray(ask, dtype=np.float64)
+        self.bid_size = np.ones(len(self.bid)) if bid_size is None else np.asarray(bid_size, dtype=np.float64)
+        self.ask_size = np.ones(len(self.ask)) if ask_size is None else np.asarray(ask_size, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @classmethod
+    def from_candles(cls, candles, spread: float = 1e-4, size: float = 1.0):
+        """
+        One tick per candle close (bid/ask 'spread' apart), e.g. from synthetic_triangle_candles.
+        """
+        symbols = list(candles)
+        rows = [(c[0], i, c[4]) for i, sym in enumerate(symbols) for c in candles[sym]]
+        rows.sort(key=lambda row: row[0])
+        timestamp, symbol, close = (np.array(column) for column in zip(*rows))
+        half = close * spread / 2
+        return cls(symbols, timestamp, symbol, close - half, close + half,
+                   np.full(len(close), size), np.full(len(close), size))
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Loads a stream written by save() (a recorded or generated .npz file).
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return cls([str(s) for s in data["symbols"]], *(data[f] for f in cls.FIELDS))
+
+    def save(self, path: str):
+        np.savez_compressed(path, symbols=np.array(self.symbols), **{f: getattr(self, f) for f in self.FIELDS})
+
+
+def synthetic_ticks(start_ms: int = 1735689600000, seconds: float = 3600.0, ticks_per_second: float = 10.0,
+                    seed: int = 0, volatility: float = 2e-5, dislocation: float = 3e-3, dislocation_rate: float = 0.01,
+                    spread: float = 1e-4):
+    """
+    Random-walk BTC/USDT, ETH/USDT and ETH/BTC ticks with occasional ETH/BTC dislocations
+    (so triangle signals actually fire). Arrivals are Poisson; each tick updates one symbol.
+
+    :param volatility: Per-tick log-return standard deviation of BTC and ETH.
+    :param dislocation: Size of an ETH/BTC mispricing relative to the implied cross rate.
+    :param dislocation_rate: Fraction of ETH/BTC ticks that are mispriced.
+    :return: TickStream.
+    """
+    rng = np.random.default_rng(seed)
+    n = max(1, int(seconds * ticks_per_second))
+    timestamp = start_ms + np.cumsum(rng.exponential(1000.0 / ticks_per_second, n)).astype(np.int64)
+    symbol = rng.integers(0, len(TRIANGLE_SYMBOLS), n).astype(np.int16)
+    btc = DEFAULT_PRICES["BTC/USDT"] * np.exp(np.cumsum(rng.normal(0, volatility, n)))
+    eth = DEFAULT_PRICES["ETH/USDT"] * np.exp(np.cumsum(rng.normal(0, volatility, n)))
+    cross = eth / btc * (1 + rng.normal(0, spread / 4, n))
+    cross *= 1 + np.where(rng.random(n) < dislocation_rate, rng.choice((-1.0, 1.0), n) * dislocation, 0.0)
+    mid = np.choose(symbol, (btc, eth, cross))
+    half = mid * spread / 2
+    sizes = rng.lognormal(0, 0.5, (2, n)) * np.choose(symbol, (0.5, 5.0, 5.0))
+    return TickStream(TRIANGLE_SYMBOLS, timestamp, symbol, mid - half, mid + half, sizes[0], sizes[1])
+
+
+class TouchFill:
+    """
+    Every marketable order fills in full at the touch; market orders pay 'slippage_bps' on top.
+    """
+
+    def __init__(self, slippage_bps: float = 0.0):
+        self.slippage_bps = slippage_bps
+
+    def fill(self, side, amount, touch, size, order_type, rng):
+        sign = 1 if side == 'buy' else -1
+        price = touch * (1 + sign * self.slippage_bps / 1e4) if order_type == 'market' else touch
+        return amount, price
+
+
+class DepthFill:
+    """
+    Limit orders fill up to the displayed touch size. Market orders fill in full; the part above
+    the touch size walks the book, costing 'impact_bps' per multiple of the touch size.
+    """
+
+    def __init__(self, impact_bps: float = 5.0):
+        self.impact_bps = impact_bps
+
+    def fill(self, side, amount, touch, size, order_type, rng):
+        sign = 1 if side == 'buy' else -1
+        if order_type != 'market':
+            return min(amount, size), touch
+        excess = max(0.0, amount - size)
+        # Linear impact over the excess, averaged over the whole order
+        impact = self.impact_bps / 1e4 * (excess / size) * excess / (2 * amount) if size > 0 else 0.0
+        return amount, touch * (1 + sign * impact)
+
+
+class ProbabilisticFill:
+    """
+    Marketable orders fill in full with 'probability', otherwise a uniform random fraction fills
+    (limit orders) or the order fills with 'miss_slippage_bps' (market orders).
+    """
+
+    def __init__(self, probability: float = 0.9, miss_slippage_bps: float = 5.0):
+        self.probability = probability
+        self.miss_slippage_bps = miss_slippage_bps
+
+    def fill(self, side, amount, touch, size, order_type, rng):
+        if rng.random() < self.probability:
+            return amount, touch
+        if order_type == 'market':
+            sign = 1 if side == 'buy' else -1
+            return amount, touch * (1 + sign * self.miss_slippage_bps / 1e4)
+        return amount * rng.random(), touch
+
+
+class FakeOKXExchange(FakeExchange):
+    """
+    FakeExchange replaying a TickStream on a VirtualClock.
+
+    Tickers, order matching and resting-order fills follow the top of book at the current
+    virtual time. Every request is charged latency + uniform jitter on the virtual clock and
+    counted against OKX's per-endpoint limits (rate_limiter.OKX_ENDPOINT_LIMITS) in virtual
+    time; over-limit requests raise ccxt.RateLimitExceeded like the real API.
+    """
+
+    def __init__(self, ticks: TickStream, speed: float = 1.0, clock: VirtualClock = None, latency: float = 0.0,
+                 jitter: float = 0.0, rate_limits=None, fill_model=None, seed: int = 0, **kwargs):
+        """
+        :param ticks: Market data to replay.
+        :param speed: Virtual seconds per wall-clock second (None: manual clock, see VirtualClock).
+        :param clock: Shared VirtualClock (overrides 'speed').
+        :param latency: Round-trip latency per request, in virtual seconds.
+        :param jitter: Extra uniform [0, jitter) latency per request, in virtual seconds.
+        :param rate_limits: Method -> (endpoint, requests, window, priority); None for OKX's limits, False to disable.
+        :param fill_model: TouchFill (default), DepthFill, ProbabilisticFill or any object with the same fill().
+        :param seed: Seed of the jitter and fill randomness.
+        :param kwargs: Passed to FakeExchange (balance, closed_orders, fee).
+        """
+        first = {}
+        for i, sym in enumerate(ticks.symbols):
+            rows = np.flatnonzero(ticks.symbol == i)
+            if len(rows):
+                first[sym] = rows[0]
+        super().__init__(latency=0.0, prices={sym: float(ticks.bid[r] + ticks.ask[r]) / 2 for sym, r in first.items()},
+                         **kwargs)
+        self.ticks = ticks
+        self.clock = clock or VirtualClock(int(ticks.timestamp[0]) if len(ticks) else 0, speed)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = OKX_ENDPOINT_LIMITS if rate_limits is None else (rate_limits or {})
+        self.fill_model = fill_model or TouchFill()
+        self.rng = np.random.default_rng(seed)
+        self.book = {sym: self._row(r) for sym, r in first.items()}
+        self.tokens = {}
+        self.rate_limited = 0
+        self.resting = set()
+        self.cursor = 0
+        self.advance()
+
+    # ---------------------------
+    # Market data
+    # ---------------------------
+    def _now_ms(self):
+        return self.clock.now_ms()
+
+    def advance(self):
+        """
+        Applies every tick up to the current virtual time and fills crossed resting orders.
+
+        :return: Number of ticks applied.
+        """
+        now = self.clock.now_ms()
+        fills = []
+        with self.lock:
+            start = self.cursor
+            end = int(np.searchsorted(self.ticks.timestamp, now, side='right'))
+            if end <= start:
+                return 0
+            symbols = self.ticks.symbol[start:end]
+            # Last tick of every symbol in the window
+            present, first_from_end = np.unique(symbols[::-1], return_index=True)
+            for index, offset in zip(present, first_from_end):
+                row = end - 1 - offset
+                sym = self.ticks.symbols[index]
+                self.book[sym] = self._row(row)
+                self.prices[sym] = (self.book[sym][0] + self.book[sym][1]) / 2
+            if self.resting:
+                fills = self._cross_resting(start, end, symbols)
+            self.cursor = end
+        for order in fills:
+            self._publish(order)
+        return end - start
+
+    def _row(self, row):
+        return [float(self.ticks.bid[row]), float(self.ticks.ask[row]),
+                float(self.ticks.bid_size[row]), float(self.ticks.ask_size[row])]
+
+    def _cross_resting(self, start, end, symbols):
+        filled = []
+        for order_id in list(self.resting):
+            order = self.orders[order_id]
+            if order['status'] != 'open':
+                self.resting.discard(order_id)
+                continue
+            if order['symbol'] not in self.ticks.symbols:
+                continue
+            mask = symbols == self.ticks.symbols.index(order['symbol'])
+            if not mask.any():
+                continue
+            if order['side'] == 'buy':
+                crossed = self.ticks.ask[start:end][mask].min() <= order['price']
+                size = float(self.ticks.ask_size[start:end][mask].max())
+            else:
+                crossed = self.ticks.bid[start:end][mask].max() >= order['price']
+                size = float(self.ticks.bid_size[start:end][mask].max())
+            if not crossed:
+                continue
+            amount, price = self.fill_model.fill(order['side'], order['remaining'], order['price'], size, 'limit',
+                                                 self.rng)
+            cost = order['cost'] + amount * price
+            order['filled'] += amount
+            order['remaining'] = order['amount'] - order['filled']
+            order['cost'] = cost
+            order['average'] = cost / order['filled'] if order['filled'] else None
+            order['fee'] = {'cost': cost * self.fee, 'currency': order['symbol'].split('/')[1]}
+            order['lastUpdateTimestamp'] = self._now_ms()
+            if order['remaining'] <= 1e-12:
+                order['status'] = 'closed'
+                self.resting.discard(order_id)
+            filled.append(dict(order))
+        return filled
+
+    def _ticker(self, symbol):
+        bid, ask, bid_size, ask_size = self.book[symbol]
+        return {'symbol': symbol, 'timestamp': self._now_ms(), 'last': (bid + ask) / 2, 'bid': bid, 'ask': ask,
+                'bidVolume': bid_size, 'askVolume': ask_size, 'baseVolume': 1.0}
+
+    def fetch_order_book(self, symbol, limit=5, params=None):
+        """
+        Synthetic depth around the current touch: level i is i bp away and i + 1 times the touch size.
+        """
+        self._request('fetch_order_book')
+        bid, ask, bid_size, ask_size = self.book[symbol]
+        levels = range(limit or 5)
+        return {'symbol': symbol, 'timestamp': self._now_ms(),
+                'bids': [[bid * (1 - i * 1e-4), bid_size * (i + 1)] for i in levels],
+                'asks': [[ask * (1 + i * 1e-4), ask_size * (i + 1)] for i in levels]}
+
+    # ---------------------------
+    # Request model
+    # ---------------------------
+    def _request(self, method=None):
+        with self.lock:
+            self.request_count += 1
+            delay = self.latency + (self.rng.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        self._take_token(method)
+        self.clock.sleep(delay)
+        self.advance()
+
+    def _take_token(self, method):
+        limit = self.rate_limits.get(method)
+        if limit is None:
+            return
+        endpoint, requests, window, _ = limit
+        now = self.clock.now()
+        with self.lock:
+            tokens, stamp = self.tokens.get(endpoint, (float(requests), now))
+            tokens = min(float(requests), tokens + (now - stamp) * requests / window)
+            if tokens < 1.0:
+                self.tokens[endpoint] = (tokens, now)
+                self.rate_limited += 1
+                raise RateLimitExceeded(f"okx {endpoint}: Too Many Requests (fake, {requests}/{window}s)")
+            self.tokens[endpoint] = (tokens - 1.0, now)
+
+    # ---------------------------
+    # Order simulation
+    # ---------------------------
+    def _fill(self, symbol, type, side, amount, touch):
+        bid, ask, bid_size, ask_size = self.book[symbol]
+        return self.fill_model.fill(side, amount, touch, ask_size if side == 'buy' else bid_size, type, self.rng)
+
+    def _match_order(self, symbol, type, side, amount, price=None, params=None):
+        ack = super()._match_order(symbol, type, side, amount, price, params)
+        if self.orders[ack['id']]['status'] == 'open':
+            with self.lock:
+                self.resting.add(ack['id'])
+        return ack
+
+
+class ReplayDriver:
+    """
+    Runs a strategy callback against a FakeOKXExchange while replaying its tick stream,
+    event by event or on a fixed polling interval, as fast as the clock allows.
+    """
+
+    def __init__(self, exchange: FakeOKXExchange):
+        self.exchange = exchange
+        self.clock = exchange.clock
+
+    def run(self, callback, interval: float = None, until_ms: int = None, max_steps: int = None):
+        """
+        :param callback: Called as callback(now_ms) at every step; its requests advance virtual time.
+        :param interval: Virtual seconds between steps (None: one step per distinct tick timestamp).
+        :param until_ms: Stop at this virtual time (default: end of the stream).
+        :param max_steps: Stop after this many callbacks.
+        :return: Dict with step counts, virtual/real duration, achieved speed-up and histograms
+                 (virtual seconds) of callback duration and of lag behind the scheduled step time.
+        """
+        from metrics import LatencyHistogram
+
+        timestamps = self.exchange.ticks.timestamp
+        start_ms = self.clock.now_ms()
+        end_ms = until_ms if until_ms is not None else (int(timestamps[-1]) if len(timestamps) else start_ms)
+        if interval is None:
+            steps = np.unique(timestamps[(timestamps >= start_ms) & (timestamps <= end_ms)])
+        else:
+            steps = np.arange(start_ms, end_ms + 1, max(1, int(interval * 1000)))
+        durations, lags = LatencyHistogram(), LatencyHistogram()
+        done = skipped = 0
+        virtual_start, real_start = self.clock.now(), time.perf_counter()
+        for step_ms in steps:
+            if max_steps is not None and done >= max_steps:
+                break
+            if step_ms < self.clock.now_ms():
+                # The previous callback ran past this step, as a slow live loop would.
+                skipped += 1
+                continue
+            self.clock.advance_to(step_ms / 1000.0)
+            self.exchange.advance()
+            began = self.clock.now()
+            callback(self.clock.now_ms())
+            durations.record(self.clock.now() - began)
+            lags.record(began - step_ms / 1000.0)
+            done += 1
+        virtual_seconds = self.clock.now() - virtual_start
+        real_seconds = time.perf_counter() - real_start
+        return {
+            "steps": done,
+            "skipped": skipped,
+            "virtual_seconds": virtual_seconds,
+            "real_seconds": real_seconds,
+            "speedup": virtual_seconds / real_seconds if real_seconds > 0 else None,
+            "rate_limited": self.exchange.rate_limited,
+            "callback": durations.summary(),
+            "lag": lags.summary()
+        }
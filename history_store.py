@@ -0,0 +1,228 @@
+"""
+history_store.py
+
+Append-only, resumable on-disk store for merged triangle minute data.
+
+Data is partitioned by UTC day into memory-mappable NumPy files
+(<root>/<YYYY-MM-DD>.npy), each holding a (4, n) float64 array whose rows are
+the timestamp (ms) and the BTC/USDT, ETH/USDT and ETH/BTC close prices. Rows
+are contiguous, so every price column can be handed to the backtest as a
+zero-copy memmap view. An index file (<root>/index.json) records which time
+ranges have already been fetched, so a backfill only requests the gaps and can
+resume after a crash.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+COLUMNS = ("timestamp", "BTC/USDT", "ETH/USDT", "ETH/BTC")
+DAY_MS = 86_400_000
+
+
+def _atomic_write(path, write):
+    """
+    Calls write(tmp_path) and atomically moves the result to path.
+    """
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _to_epoch_ms(values):
+    """
+    Converts ISO timestamps (or datetimes) to int64 epoch milliseconds.
+    """
+    return pd.to_datetime(values, utc=True).dt.as_unit("ms").astype("int64").to_numpy()
+
+
+def _merge_ranges(ranges):
+    """
+    Merges overlapping or touching [start, end) ranges.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class TriangleHistoryStore:
+    """
+    Day-partitioned, memory-mappable store of merged triangle close prices.
+    """
+
+    def __init__(self, root: str = "triangle_history"):
+        """
+        :param root: Directory holding the day partitions and the index.
+        """
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.index_path = os.path.join(self.root, "index.json")
+        self.ranges = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.ranges = _merge_ranges(json.load(f).get("ranges", []))
+
+    # ---------------------------
+    # Index
+    # ---------------------------
+    def _save_index(self):
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump({"ranges": self.ranges}, f)
+        _atomic_write(self.index_path, write)
+
+    def mark_covered(self, start_ms: int, end_ms: int):
+        """
+        Records that [start_ms, end_ms) has been fetched (even if it held no data).
+        """
+        self.ranges = _merge_ranges(self.ranges + [[int(start_ms), int(end_ms)]])
+        self._save_index()
+
+    def missing_ranges(self, start_ms: int, end_ms: int):
+        """
+        Returns the [start, end) sub-ranges of [start_ms, end_ms) not yet covered by the store.
+        """
+        gaps = []
+        cursor = int(start_ms)
+        for start, end in self.ranges:
+            if end <= cursor:
+                continue
+            if start >= end_ms:
+                break
+            if start > cursor:
+                gaps.append((cursor, min(start, end_ms)))
+            cursor = max(cursor, end)
+            if cursor >= end_ms:
+                break
+        if cursor < end_ms:
+            gaps.append((cursor, int(end_ms)))
+        return gaps
+
+    # ---------------------------
+    # Writing
+    # ---------------------------
+    def _partition_path(self, day: str):
+        return os.path.join(self.root, f"{day}.npy")
+
+    def partitions(self):
+        """
+        Returns the sorted list of stored day keys (YYYY-MM-DD).
+        """
+        return sorted(name[:-4] for name in os.listdir(self.root) if name.endswith(".npy"))
+
+    def append_columns(self, timestamps, btc_usdt, eth_usdt, eth_btc, covered=None):
+        """
+        Appends rows to the day partitions. Rows already present (same timestamp) are replaced.
+
+        :param timestamps: Timestamps in ms (UTC).
+        :param btc_usdt, eth_usdt, eth_btc: Close prices aligned with timestamps.
+        :param covered: Optional (start_ms, end_ms) range to mark as fetched once the rows are on disk.
+        """
+        block = np.vstack([np.asarray(timestamps, dtype=np.float64),
+                           np.asarray(btc_usdt, dtype=np.float64),
+                           np.asarray(eth_usdt, dtype=np.float64),
+                           np.asarray(eth_btc, dtype=np.float64)])
+        if block.shape[1]:
+            days = block[0].astype(np.int64) // DAY_MS
+            for day_number in np.unique(days):
+                day = datetime.fromtimestamp(int(day_number) * DAY_MS / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+                self._write_partition(day, block[:, days == day_number])
+        if covered is not None:
+            self.mark_covered(*covered)
+
+    def append_records(self, records, covered=None):
+        """
+        Appends merged records as produced by the triangle downloader
+        ({"timestamp": ISO string, "BTC/USDT": ..., "ETH/USDT": ..., "ETH/BTC": ...}).
+        """
+        if records:
+            df = pd.DataFrame.from_records(records)
+            timestamps = _to_epoch_ms(df["timestamp"])
+            self.append_columns(timestamps, df["BTC/USDT"], df["ETH/USDT"], df["ETH/BTC"])
+        if covered is not None:
+            self.mark_covered(*covered)
+
+    def _write_partition(self, day, block):
+        path = self._partition_path(day)
+        if os.path.exists(path):
+            block = np.hstack([np.load(path), block])
+        # Keep the last occurrence of each timestamp, sorted by time.
+        reversed_ts = block[0, ::-1]
+        _, last_positions = np.unique(reversed_ts, return_index=True)
+        block = np.ascontiguousarray(block[:, block.shape[1] - 1 - last_positions])
+
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.save(f, block)
+        _atomic_write(path, write)
+
+    def import_json(self, filename: str = "triangle_market_data_historical.json"):
+        """
+        Imports a JSON array written by fetch_all_historical_triangle_data_incremental.
+        The span between its first and last record is marked as covered.
+        """
+        df = pd.read_json(filename, orient="records")
+        if df.empty:
+            return 0
+        timestamps = _to_epoch_ms(df["timestamp"])
+        self.append_columns(timestamps, df["BTC/USDT"], df["ETH/USDT"], df["ETH/BTC"],
+                            covered=(int(timestamps.min()), int(timestamps.max()) + 1))
+        logger.info(f"Imported {len(df)} records from {filename} into {self.root}.")
+        return len(df)
+
+    # ---------------------------
+    # Reading
+    # ---------------------------
+    def _day_range(self, start_ms, end_ms):
+        days = self.partitions()
+        if start_ms is not None:
+            first = datetime.fromtimestamp(start_ms // DAY_MS * DAY_MS / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+            days = [d for d in days if d >= first]
+        if end_ms is not None:
+            last = datetime.fromtimestamp((end_ms - 1) // DAY_MS * DAY_MS / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+            days = [d for d in days if d <= last]
+        return days
+
+    def iter_partitions(self, start_ms: int = None, end_ms: int = None):
+        """
+        Yields one column dict per day partition, with price columns as zero-copy memmap views.
+        Rows are restricted to [start_ms, end_ms).
+        """
+        for day in self._day_range(start_ms, end_ms):
+            block = np.load(self._partition_path(day), mmap_mode='r')
+            lo, hi = 0, block.shape[1]
+            if start_ms is not None:
+                lo = int(np.searchsorted(block[0], start_ms, side='left'))
+            if end_ms is not None:
+                hi = int(np.searchsorted(block[0], end_ms, side='left'))
+            if hi <= lo:
+                continue
+            columns = {"timestamp": block[0, lo:hi].astype(np.int64)}
+            for row, name in enumerate(COLUMNS[1:], start=1):
+                columns[name] = block[row, lo:hi]
+            yield columns
+
+    def load(self, start_ms: int = None, end_ms: int = None):
+        """
+        Loads [start_ms, end_ms) as a dict of contiguous columns ("timestamp" in ms plus the three
+        close prices), ready for OKXTrader.backtest_triangle_arbitrage_vectorized.
+        A single-day range is returned as memmap views without copying.
+        """
+        parts = list(self.iter_partitions(start_ms, end_ms))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return {name: np.empty(0, dtype=np.int64 if name == "timestamp" else np.float64) for name in COLUMNS}
+        return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
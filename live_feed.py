@@ -0,0 +1,307 @@
+"""
+live_feed.py
+
+Asyncio live signal engine for the BTC/USDT, ETH/USDT, ETH/BTC triangle.
+
+Instead of polling fetch_ticker three times per cycle, the engine subscribes
+to OKX's public ticker (or best bid/offer) stream for the three pairs, keeps an
+in-memory table of the latest quote per pair and re-evaluates both cycle
+factors on every update. The network layer is a pluggable transport: any
+object with an async 'stream(inst_ids)' generator yielding raw messages works,
+so ReplayTransport can stand in for OKX in tests. A dropped OKX connection is
+re-opened with exponential backoff and the three pairs are subscribed again.
+"""
+
+import asyncio
+import inspect
+import json
+import time
+from collections import deque
+
+from logger_config import setup_logger
+
+try:
+    import websockets
+except ImportError:  # Optional dependency, only needed for the live OKX transport.
+    websockets = None
+
+# Configure logging
+logger = setup_logger(__name__)
+
+OKX_PUBLIC_WS = "wss://ws.okx.com:8443/ws/v5/public"
+TRIANGLE_SYMBOLS = ("BTC/USDT", "ETH/USDT", "ETH/BTC")
+
+
+def to_inst_id(symbol: str) -> str:
+    """'BTC/USDT' -> 'BTC-USDT'"""
+    return symbol.replace('/', '-')
+
+
+def to_symbol(inst_id: str) -> str:
+    """'BTC-USDT' -> 'BTC/USDT'"""
+    return inst_id.replace('-', '/')
+
+
+class OKXWebSocketTransport:
+    """
+    Streams raw messages from the OKX public WebSocket API.
+    """
+
+    # The stream never ends on its own: a closed connection is a drop to recover from.
+    persistent = True
+
+    def __init__(self, url: str = OKX_PUBLIC_WS, channel: str = "tickers", ping_interval: float = 20.0):
+        """
+        :param url: Public WebSocket endpoint.
+        :param channel: "tickers" (last/bid/ask) or "bbo-tbt" (tick-by-tick best bid/offer).
+        :param ping_interval: Seconds between keep-alive pings.
+        """
+        self.url = url
+        self.channel = channel
+        self.ping_interval = ping_interval
+
+    async def stream(self, inst_ids):
+        """
+        Subscribes to the channel for inst_ids and yields every raw text message.
+        """
+        if websockets is None:
+            raise ImportError("The 'websockets' package is required for OKXWebSocketTransport.")
+        async with websockets.connect(self.url, ping_interval=self.ping_interval) as ws:
+            await ws.send(json.dumps({
+                "op": "subscribe",
+                "args": [{"channel": self.channel, "instId": inst_id} for inst_id in inst_ids]
+            }))
+            async for message in ws:
+                yield message
+
+
+class ReplayTransport:
+    """
+    Replays recorded messages (raw strings or already-decoded dicts) in place of OKX.
+    """
+
+    def __init__(self, messages, delay: float = 0.0):
+        """
+        :param messages: Iterable of recorded messages.
+        :param delay: Optional pause between messages, in seconds (0 yields control only).
+        """
+        self.messages = messages
+        self.delay = delay
+
+    @classmethod
+    def from_file(cls, filename: str, delay: float = 0.0):
+        """
+        Loads a JSON-lines recording (one raw OKX message per line).
+        """
+        with open(filename) as f:
+            return cls([line.strip() for line in f if line.strip()], delay=delay)
+
+    async def stream(self, inst_ids):
+        for message in self.messages:
+            yield message
+            await asyncio.sleep(self.delay)
+
+
+class LiveTriangleEngine:
+    """
+    Maintains the latest quote per triangle leg and emits a signal on every update.
+    """
+
+    def __init__(self, transport=None, threshold: float = 0.002, on_signal=None, latency_window: int = 10000,
+                 max_reconnects: int = None, max_backoff: float = 30.0):
+        """
+        :param transport: Message source (default: OKXWebSocketTransport()).
+        :param threshold: Minimum arbitrage excess over 1 to flag an opportunity (default 0.002).
+        :param on_signal: Optional callback (plain or async) called with every signal dict.
+        :param latency_window: Number of recent tick-to-signal latencies kept for statistics.
+        :param max_reconnects: Consecutive failed connections tolerated before run() gives up (None: never).
+        :param max_backoff: Upper bound of the doubling pause between reconnects, in seconds.
+        """
+        self.transport = transport or OKXWebSocketTransport()
+        self.max_reconnects = max_reconnects
+        self.max_backoff = max_backoff
+        self.reconnect_count = 0
+        self.threshold = threshold
+        self.on_signal = on_signal
+        self.quotes = {sym: None for sym in TRIANGLE_SYMBOLS}
+        self.last_signal = None
+        self.update_count = 0
+        self.signal_count = 0
+        self.latencies_ns = deque(maxlen=latency_window)
+        self._running = False
+
+    def _apply_message(self, message):
+        """
+        Updates the quote table from one OKX push message. Returns True if a quote changed.
+        """
+        if isinstance(message, (str, bytes)):
+            if message in ("pong", b"pong"):
+                return False
+            message = json.loads(message)
+        if "data" not in message:
+            if message.get("event") == "error":
+                logger.error(f"WebSocket error message: {message}")
+            return False
+
+        arg = message.get("arg", {})
+        updated = False
+        for item in message["data"]:
+            symbol = to_symbol(item.get("instId") or arg.get("instId", ""))
+            if symbol not in self.quotes:
+                continue
+            if "bids" in item:  # bbo-tbt / books payload
+                bid, bid_size = (float(item["bids"][0][0]), float(item["bids"][0][1])) if item["bids"] else (None, None)
+                ask, ask_size = (float(item["asks"][0][0]), float(item["asks"][0][1])) if item["asks"] else (None, None)
+                last = (bid + ask) / 2 if bid and ask else None
+            else:  # tickers payload
+                bid = float(item["bidPx"]) if item.get("bidPx") else None
+                ask = float(item["askPx"]) if item.get("askPx") else None
+                bid_size = float(item["bidSz"]) if item.get("bidSz") else None
+                ask_size = float(item["askSz"]) if item.get("askSz") else None
+                last = float(item["last"]) if item.get("last") else None
+            self.quotes[symbol] = {"last": last, "bid": bid, "ask": ask, "bid_size": bid_size,
+                                   "ask_size": ask_size, "ts": int(item.get("ts", 0))}
+            updated = True
+        return updated
+
+    def evaluate(self):
+        """
+        Computes both cycle factors from the current quote table, using the same formulas as
+        OKXTrader.check_triangle_arbitrage. Returns None until all three legs have a price.
+        """
+        btc, eth, eth_btc = (self.quotes[sym] for sym in TRIANGLE_SYMBOLS)
+        if not (btc and eth and eth_btc):
+            return None
+        btc_usdt, eth_usdt, eth_btc_px = btc["last"], eth["last"], eth_btc["last"]
+        if not (btc_usdt and eth_usdt and eth_btc_px):
+            return None
+        cycle1 = eth_usdt / (btc_usdt * eth_btc_px)
+        cycle2 = (btc_usdt * eth_btc_px) / eth_usdt
+        return {
+            "timestamp": max(btc["ts"], eth["ts"], eth_btc["ts"]),
+            "BTC/USDT": btc_usdt,
+            "ETH/USDT": eth_usdt,
+            "ETH/BTC": eth_btc_px,
+            "Cycle1_factor": cycle1,
+            "Cycle1_opportunity": cycle1 > (1 + self.threshold),
+            "Cycle2_factor": cycle2,
+            "Cycle2_opportunity": cycle2 > (1 + self.threshold),
+            "threshold": self.threshold
+        }
+
+    async def handle_message(self, message):
+        """
+        Processes one raw message: updates the quote table, re-evaluates the cycles and
+        dispatches the signal. Returns the signal dict (or None).
+        """
+        received_ns = time.perf_counter_ns()
+        if not self._apply_message(message):
+            return None
+        self.update_count += 1
+        signal = self.evaluate()
+        if signal is None:
+            return None
+        signal["latency_ns"] = time.perf_counter_ns() - received_ns
+        self.latencies_ns.append(signal["latency_ns"])
+        self.signal_count += 1
+        self.last_signal = signal
+        if self.on_signal is not None:
+            # A failing consumer must not take the feed down with it.
+            try:
+                outcome = self.on_signal(signal)
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except Exception as e:
+                logger.error(f"Error in live triangle signal callback: {e}")
+        return signal
+
+    async def run(self, max_messages: int = None):
+        """
+        Consumes the transport until it ends, stop() is called or max_messages have been processed.
+
+        On a persistent transport, a stream error or close re-opens the stream, which subscribes
+        again, after an exponential backoff; the quote table is cleared first so no signal mixes
+        quotes from before and after the gap. Only connection failures count towards max_reconnects:
+        a message that cannot be handled is logged and skipped. Other transports (e.g. a replay)
+        end run() on error instead of starting over.
+        """
+        self._running = True
+        processed = 0
+        backoff = 1.0
+        failures = 0
+        inst_ids = [to_inst_id(sym) for sym in TRIANGLE_SYMBOLS]
+        try:
+            while self._running:
+                try:
+                    async for message in self.transport.stream(inst_ids):
+                        backoff, failures = 1.0, 0
+                        try:
+                            await self.handle_message(message)
+                        except Exception as e:
+                            logger.error(f"Error handling live triangle message {message!r}: {e}")
+                        processed += 1
+                        if not self._running or (max_messages is not None and processed >= max_messages):
+                            return
+                    if not getattr(self.transport, 'persistent', False):
+                        return
+                    logger.warning("Live triangle feed closed by the server.")
+                except Exception as e:
+                    logger.error(f"Error in live triangle feed: {e}")
+                    if not getattr(self.transport, 'persistent', False):
+                        return
+                failures += 1
+                if self.max_reconnects is not None and failures > self.max_reconnects:
+                    logger.error(f"Live triangle feed stopped after {self.max_reconnects} failed reconnects.")
+                    return
+                if not self._running:
+                    return
+                logger.info(f"Reconnecting live triangle feed in {backoff:.1f}s...")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                self.quotes = {sym: None for sym in TRIANGLE_SYMBOLS}
+                self.reconnect_count += 1
+        finally:
+            self._running = False
+            logger.info(f"Live triangle feed processed {processed} messages, emitted {self.signal_count} signals.")
+
+    def stop(self):
+        """
+        Asks run() to return after the current message.
+        """
+        self._running = False
+
+    def latency_stats(self):
+        """
+        Returns tick-to-signal latency statistics (microseconds) over the recent window.
+        """
+        if not self.latencies_ns:
+            return {"count": 0}
+        samples = sorted(self.latencies_ns)
+        n = len(samples)
+        return {
+            "count": n,
+            "mean_us": sum(samples) / n / 1000,
+            "p50_us": samples[n // 2] / 1000,
+            "p99_us": samples[min(n - 1, int(n * 0.99))] / 1000,
+            "max_us": samples[-1] / 1000
+        }
+
+
+def main():
+    """
+    Prints live triangle signals from OKX until interrupted.
+    """
+    def print_signal(signal):
+        if signal["Cycle1_opportunity"] or signal["Cycle2_opportunity"]:
+            print(f"Opportunity: {signal}")
+
+    engine = LiveTriangleEngine(on_signal=print_signal)
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        pass
+    print(f"Tick-to-signal latency: {engine.latency_stats()}")
+
+
+if __name__ == "__main__":
+    main()
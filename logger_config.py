@@ -1,8 +1,154 @@
 # logger_config.py
+#
+# Every module logger hands its records to one in-process queue; a background
+# QueueListener thread formats them and does the console/file writes, so the
+# calling thread never blocks on I/O. Hot-path events (one per signal
+# evaluation or backtest record) go through log_event: they are sampled and
+# rate limited per logger and event, carried as structured fields and only
+# rendered (as JSON lines) on the writer thread. Backtest mode drops them
+# before a record is even created.
+import atexit
+import contextlib
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 
+LOG_DIR = 'logs'
+# Hot-path events per logger and event name allowed through per second (None = unlimited)
+DEFAULT_MAX_PER_SECOND = 50.0
+
+_queue = queue.SimpleQueue()
+_queue_handler = None
+_listener = None
+_setup_lock = threading.Lock()
+_backtest_mode = False
+_local = threading.local()
+_sampling = {}
+_samplers = {}
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched; the message is formatted on the writer thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class _Formatter(logging.Formatter):
+    """
+    Plain text for ordinary records, one JSON object per line for log_event records.
+    """
+
+    def format(self, record):
+        event = getattr(record, 'event', None)
+        if event is None:
+            return super().format(record)
+        payload = {"time": datetime.fromtimestamp(record.created).isoformat(timespec='microseconds'),
+                   "logger": record.name, "level": record.levelname, "event": event}
+        payload.update(record.fields)
+        if record.dropped:
+            payload["dropped"] = record.dropped
+        return json.dumps(payload, default=str)
+
+
+class _WriterHandler(logging.Handler):
+    """
+    Runs on the listener thread: WARNING and above to the console, everything to a per-module file.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.console = logging.StreamHandler()
+        self.console.setFormatter(logging.Formatter('%(name)s - %(levelname)s - %(message)s'))
+        self.console.setLevel(logging.WARNING)
+        self.formatter = _Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.files = {}
+
+    def _file(self, name):
+        handler = self.files.get(name)
+        if handler is None:
+            os.makedirs(LOG_DIR, exist_ok=True)  # Create logs directory before opening the file
+            handler = logging.FileHandler(
+                os.path.join(LOG_DIR, f'{name}_{datetime.now().strftime("%Y%m%d%H%M%S")}.log'))
+            handler.setFormatter(self.formatter)
+            self.files[name] = handler
+        return handler
+
+    def emit(self, record):
+        if record.levelno >= self.console.level:
+            self.console.handle(record)
+        self._file(record.name).handle(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+
+class _Sampler:
+    """
+    Keeps one in 'every' events, then at most 'max_per_second' of those (token bucket).
+    """
+
+    def __init__(self, every=1, max_per_second=DEFAULT_MAX_PER_SECOND):
+        self.every = max(1, int(every))
+        self.rate = max_per_second
+        self.tokens = max_per_second or 0.0
+        self.stamp = time.monotonic()
+        self.count = 0
+        self.dropped = 0
+
+    def allow(self):
+        self.count += 1
+        if self.count % self.every:
+            self.dropped += 1
+            return False
+        if self.rate is not None:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens < 1.0:
+                self.dropped += 1
+                return False
+            self.tokens -= 1.0
+        return True
+
+    def take_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+def _start():
+    global _queue_handler, _listener
+    with _setup_lock:
+        if _listener is None:
+            _queue_handler = _DeferredQueueHandler(_queue)
+            _listener = logging.handlers.QueueListener(_queue, _WriterHandler())
+            _listener.start()
+            atexit.register(shutdown_logging)
+    return _queue_handler
+
+
+def shutdown_logging():
+    """
+    Flushes the queue and stops the writer thread (registered with atexit).
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
 def setup_logger(name):
     # Create a custom logger
     logger = logging.getLogger(name)
@@ -10,23 +156,59 @@ def setup_logger(name):
     # Set the default log level
     logger.setLevel(logging.DEBUG)  # Debug will capture everything, adjust as needed
 
-    # Create handlers (console and file)
-    c_handler = logging.StreamHandler()
-    f_handler = logging.FileHandler(f'logs/{name}_{datetime.now().strftime("%Y%m%d%H%M%S")}.log')
-    os.makedirs('logs', exist_ok=True)  # Create logs directory if it doesn't exist
+    # Records are queued; console (warning and above) and file output happen on the writer thread
+    handler = _start()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
 
-    # Create formatters and add it to handlers
-    c_format = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
-    f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    c_handler.setFormatter(c_format)
-    f_handler.setFormatter(f_format)
+    return logger
 
-    # Set levels for handlers
-    c_handler.setLevel(logging.WARNING)  # Console handler for warning and above
-    f_handler.setLevel(logging.DEBUG)  # File handler for debug and above
 
-    # Add handlers to the logger
-    logger.addHandler(c_handler)
-    logger.addHandler(f_handler)
+def set_sampling(name, every=1, max_per_second=DEFAULT_MAX_PER_SECOND):
+    """
+    Sets the hot-path sampling of one logger: keep 1 in 'every' events, at most 'max_per_second'.
+    """
+    _sampling[name] = (every, max_per_second)
+    for key in [key for key in _samplers if key[0] == name]:
+        del _samplers[key]
 
-    return logger
+
+def set_backtest_mode(enabled=True):
+    """
+    Globally drops (or restores) every hot-path event.
+    """
+    global _backtest_mode
+    _backtest_mode = enabled
+
+
+@contextlib.contextmanager
+def backtest_mode():
+    """
+    Drops hot-path events made by this thread inside the block.
+    """
+    previous = getattr(_local, 'backtest', False)
+    _local.backtest = True
+    try:
+        yield
+    finally:
+        _local.backtest = previous
+
+
+def log_event(logger, event, fields=None, level=logging.INFO):
+    """
+    Logs a hot-path event as a structured record (written as a JSON line by the writer thread).
+
+    :param fields: Dict of values to record; it is copied, and rendered only when written.
+    :return: True if the event was queued, False if it was dropped (backtest mode, level or sampling).
+    """
+    if _backtest_mode or getattr(_local, 'backtest', False) or not logger.isEnabledFor(level):
+        return False
+    key = (logger.name, event)
+    sampler = _samplers.get(key)
+    if sampler is None:
+        sampler = _samplers[key] = _Sampler(*_sampling.get(logger.name, (1, DEFAULT_MAX_PER_SECOND)))
+    if not sampler.allow():
+        return False
+    logger.log(level, event, extra={'event': event, 'fields': dict(fields or {}),
+                                    'dropped': sampler.take_dropped()})
+    return True
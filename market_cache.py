@@ -0,0 +1,242 @@
+"""
+market_cache.py
+
+Cached market metadata (precision, lot size, minimum notional) for OKXTrader.
+
+load_markets() downloads every OKX instrument, so it should not sit on the
+order path. MarketMetadataCache keeps a persistent JSON snapshot of the
+markets, serves precomputed per-symbol tables from memory and refreshes them
+on a background thread once the snapshot is older than its TTL. With a
+snapshot on disk, start-up never waits on the network. Snapshots are keyed by
+exchange id and demo-trading mode, so a demo or offline run never seeds the
+markets of a live one.
+"""
+
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from decimal import Decimal
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+
+def _normalize(symbol: str) -> str:
+    """'BTC-USDT' -> 'BTC/USDT' (both spellings are used across OKXTrader)."""
+    return symbol.replace('-', '/')
+
+
+def _multiple_of(count: int, step: float) -> float:
+    """count * step computed in decimal, so the result is an exact multiple of steps like 0.25 or 0.001."""
+    return float(Decimal(count) * Decimal(str(step)))
+
+
+def snapshot_key(exchange) -> str:
+    """
+    Identifies whose markets a snapshot holds: '<exchange id>' or '<exchange id>_demo'.
+    """
+    exchange_id = getattr(exchange, 'id', None) or type(exchange).__name__
+    demo = bool(getattr(exchange, 'isSandboxModeEnabled', False)) or \
+        (getattr(exchange, 'headers', None) or {}).get('x-simulated-trading') == '1'
+    return f"{exchange_id}_demo" if demo else exchange_id
+
+
+def snapshot_path(exchange, directory: str = ".") -> str:
+    """
+    Default snapshot file of an exchange: market_cache_<snapshot key>.json.
+    """
+    return os.path.join(directory, f"market_cache_{snapshot_key(exchange)}.json")
+
+
+class MarketMetadataCache:
+    """
+    In-memory precision / lot-size / min-notional tables backed by an on-disk snapshot.
+    """
+
+    def __init__(self, exchange, path: str = None, ttl: float = 3600.0,
+                 background: bool = True, cold_start_timeout: float = 30.0, persist: bool = True):
+        """
+        :param exchange: ccxt exchange used for refreshes (and warmed with set_markets).
+        :param path: Snapshot file (default: snapshot_path(exchange)).
+        :param ttl: Seconds after which the metadata is refreshed in the background.
+        :param background: Refresh on a daemon thread (otherwise only refresh() refreshes).
+        :param cold_start_timeout: Maximum wait for the first download when no snapshot exists.
+        :param persist: Read and write the snapshot file; False keeps the metadata in memory only
+                        (for injected / fake exchanges).
+        """
+        self.exchange = exchange
+        self.path = path or snapshot_path(exchange)
+        self.persist = persist
+        self.snapshot_key = snapshot_key(exchange)
+        self.ttl = ttl
+        self.cold_start_timeout = cold_start_timeout
+        self.tables = {}
+        self.updated_at = 0.0
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # ccxt.async_support exchanges are refreshed with refresh_async(), never from refresh() or a thread
+        self.is_async = inspect.iscoroutinefunction(getattr(exchange, 'load_markets', None))
+
+        self._load_snapshot()
+        if background and not self.is_async:
+            self._thread = threading.Thread(target=self._refresh_loop, name="market-cache-refresh", daemon=True)
+            self._thread.start()
+
+    # ---------------------------
+    # Snapshot and refresh
+    # ---------------------------
+    def _load_snapshot(self):
+        if not self.persist or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+            if snapshot.get("exchange") != self.snapshot_key:
+                logger.warning(f"Ignoring market metadata snapshot {self.path}: written for "
+                               f"{snapshot.get('exchange')}, not {self.snapshot_key}.")
+                return
+            self._install(snapshot["markets"], snapshot.get("updated_at", 0.0))
+            logger.info(f"Loaded market metadata snapshot ({len(self.tables)} markets) from {self.path}.")
+        except Exception as e:
+            logger.error(f"Error loading market metadata snapshot: {e}")
+
+    def _install(self, markets, updated_at):
+        tables = {symbol: self._build_entry(market) for symbol, market in markets.items()}
+        if hasattr(self.exchange, 'set_markets'):
+            # Lets ccxt helpers (market_id, amount_to_precision, ...) work without load_markets().
+            self.exchange.set_markets(markets)
+        with self.lock:
+            self.tables = tables
+            self.updated_at = updated_at
+        self.ready.set()
+
+    @staticmethod
+    def _build_entry(market):
+        precision = market.get('precision') or {}
+        limits = market.get('limits') or {}
+        amount_step = precision.get('amount')
+        price_step = precision.get('price')
+        return {
+            'id': market.get('id'),
+            'base': market.get('base'),
+            'quote': market.get('quote'),
+            'lot_size': float(amount_step) if amount_step else None,
+            'tick_size': float(price_step) if price_step else None,
+            'min_amount': float((limits.get('amount') or {}).get('min') or 0.0),
+            'max_amount': (limits.get('amount') or {}).get('max'),
+            'min_cost': float((limits.get('cost') or {}).get('min') or 0.0),
+        }
+
+    def refresh(self):
+        """
+        Downloads the markets, rebuilds the tables and rewrites the snapshot.
+        """
+        if self.is_async:
+            raise RuntimeError("Market metadata of an async exchange is refreshed with refresh_async().")
+        try:
+            self.update(self.exchange.load_markets(True))
+            logger.info(f"Refreshed market metadata ({len(self.tables)} markets).")
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing market metadata: {e}")
+            return False
+
+    async def refresh_async(self):
+        """
+        refresh() for ccxt.async_support exchanges (load_markets is awaited).
+        """
+        try:
+            self.update(await self.exchange.load_markets(True))
+            logger.info(f"Refreshed market metadata ({len(self.tables)} markets).")
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing market metadata: {e}")
+            return False
+
+    def update(self, markets):
+        """
+        Installs markets loaded elsewhere (e.g. by an async exchange) and rewrites the snapshot.
+        """
+        now = time.time()
+        self._install(markets, now)
+        if not self.persist:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"exchange": self.snapshot_key, "updated_at": now, "markets": markets}, f, default=str)
+        os.replace(tmp_path, self.path)
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            age = time.time() - self.updated_at
+            if age >= self.ttl:
+                if not self.refresh():
+                    # Retry sooner after a failure.
+                    self._stop.wait(min(60.0, self.ttl))
+                    continue
+                age = 0.0
+            self._stop.wait(self.ttl - age)
+
+    def stop(self):
+        """
+        Stops the background refresh thread.
+        """
+        self._stop.set()
+
+    # ---------------------------
+    # Lookups (pure in-memory)
+    # ---------------------------
+    def get(self, symbol: str):
+        """
+        Returns the metadata entry for a symbol ('BTC/USDT' or 'BTC-USDT').
+        Only blocks on a cold start without snapshot, until the first download completes.
+        """
+        if not self.ready.is_set():
+            if self.is_async:
+                raise RuntimeError("Market metadata not loaded yet: await initialize() (or refresh_async()) first.")
+            if self._thread is None:
+                self.refresh()
+            elif not self.ready.wait(self.cold_start_timeout):
+                raise TimeoutError("Market metadata not available yet.")
+        entry = self.tables.get(_normalize(symbol))
+        if entry is None:
+            raise KeyError(f"Unknown market {symbol}")
+        return entry
+
+    def amount_to_precision(self, symbol: str, amount: float) -> float:
+        """
+        Truncates an amount to the market's lot size (same rounding as ccxt for amounts).
+        """
+        step = self.get(symbol)['lot_size']
+        if not step:
+            return float(amount)
+        return _multiple_of(math.floor(amount / step + 1e-9), step)
+
+    def price_to_precision(self, symbol: str, price: float) -> float:
+        """
+        Rounds a price to the market's tick size (same rounding as ccxt for prices).
+        """
+        step = self.get(symbol)['tick_size']
+        if not step:
+            return float(price)
+        return _multiple_of(round(price / step), step)
+
+    def min_order_size(self, symbol: str) -> float:
+        """
+        Minimum order amount in base currency.
+        """
+        return self.get(symbol)['min_amount']
+
+    def min_order_value(self, symbol: str, price: float) -> float:
+        """
+        Minimum order value in quote currency at the given price.
+        """
+        entry = self.get(symbol)
+        return max(entry['min_amount'] * price, entry['min_cost'])
@@ -0,0 +1,297 @@
+"""
+metrics.py
+
+Low-overhead latency and counter instrumentation.
+
+LatencyHistogram is an HDR-style log-linear histogram: every power of two of
+microseconds is split into 2**SUB_BITS equal buckets, so a value is recorded
+with one bit_length, one shift and one list increment, and any quantile is read
+back within about 3% relative error over the whole range from 1 us to hours.
+MetricsRegistry holds labelled histograms and counters and exports them as
+Prometheus text, served by a small http.server endpoint, and as JSON snapshots
+written periodically to disk. REGISTRY is the process-wide default that
+RequestScheduler (per-endpoint request latency, errors and rate-limit waits)
+and OKXTrader (signal evaluation) report to.
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS
+EXACT_LIMIT = SUB_BUCKETS << 1
+BUCKET_COUNT = EXACT_LIMIT + (64 - SUB_BITS - 1) * SUB_BUCKETS
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _bucket_index(value):
+    """
+    Bucket of a non-negative integer: exact below 2 * SUB_BUCKETS, log-linear above.
+    """
+    if value < EXACT_LIMIT:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return EXACT_LIMIT + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def _bucket_midpoint(index):
+    if index < EXACT_LIMIT:
+        return float(index)
+    shift = (index - EXACT_LIMIT) // SUB_BUCKETS + 1
+    mantissa = SUB_BUCKETS + (index - EXACT_LIMIT) % SUB_BUCKETS
+    return ((mantissa << shift) + ((mantissa + 1) << shift) - 1) / 2.0
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations, stored in whole microseconds.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        micros = int(seconds * 1e6) if seconds > 0 else 0
+        index = _bucket_index(micros)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the q-quantile in seconds (0.0 if empty).
+        """
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, int(q * self.count + 0.5))
+            seen = 0
+            for index, n in enumerate(self.counts):
+                seen += n
+                if n and seen >= rank:
+                    return min(_bucket_midpoint(index) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Returns count, sum, mean, max and the QUANTILES (seconds).
+        """
+        with self.lock:
+            count, total, peak = self.count, self.total, self.max
+        report = {"count": count, "sum": total, "mean": total / count if count else 0.0, "max": peak}
+        for q in QUANTILES:
+            report[f"p{q * 100:g}"] = self.quantile(q)
+        return report
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + list(extra or ())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Labelled latency histograms and counters with Prometheus and JSON export.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self.lock = threading.Lock()
+        self._server = None
+        self._stop = threading.Event()
+
+    def describe(self, name: str, text: str):
+        """
+        Sets the HELP line of a metric.
+        """
+        self.help[name] = text
+
+    def histogram(self, name: str, **labels) -> LatencyHistogram:
+        key = (name, _label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, LatencyHistogram())
+        return histogram
+
+    def observe(self, name: str, seconds: float, **labels):
+        """
+        Records a duration (seconds) in the histogram 'name' with the given labels.
+        """
+        self.histogram(name, **labels).record(seconds)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Adds 'value' to the counter 'name' with the given labels.
+        """
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, name: str, **labels):
+        """
+        Context manager recording the duration of its block.
+        """
+        return _Timer(self.histogram(name, **labels))
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    # ---------------------------
+    # Export
+    # ---------------------------
+    def snapshot(self):
+        """
+        Returns {'timestamp', 'histograms': [...], 'counters': [...]} with label dicts and summaries.
+        """
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+        return {
+            "timestamp": time.time(),
+            "histograms": [{"name": name, "labels": dict(key), **histogram.summary()}
+                           for (name, key), histogram in sorted(histograms, key=lambda item: item[0])],
+            "counters": [{"name": name, "labels": dict(key), "value": value}
+                         for (name, key), value in sorted(counters, key=lambda item: item[0])]
+        }
+
+    def render_prometheus(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format (histograms as summaries).
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            counters = sorted(self.counters.items(), key=lambda item: item[0])
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), histogram in histograms:
+            header(name, "summary")
+            summary = histogram.summary()
+            for q in QUANTILES:
+                lines.append(f"{name}{_format_labels(key, [('quantile', q)])} {summary[f'p{q * 100:g}']:.9g}")
+            lines.append(f"{name}_sum{_format_labels(key)} {summary['sum']:.9g}")
+            lines.append(f"{name}_count{_format_labels(key)} {summary['count']}")
+        for (name, key), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(key)} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path: str = "metrics_snapshot.json"):
+        """
+        Writes snapshot() to 'path' atomically (temporary file + rename).
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def start_snapshot_writer(self, path: str = "metrics_snapshot.json", interval: float = 60.0):
+        """
+        Writes a snapshot every 'interval' seconds on a daemon thread until stop() is called.
+        """
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.write_snapshot(path)
+                except Exception as e:
+                    logger.error(f"Error writing metrics snapshot: {e}")
+
+        self._stop.clear()
+        threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+    def start_http_server(self, port: int = 9108, host: str = "127.0.0.1"):
+        """
+        Serves render_prometheus() at http://host:port/metrics on a daemon thread.
+
+        :return: The ThreadingHTTPServer (its server_address holds the bound port).
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"metrics endpoint: {format % args}")
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Metrics endpoint listening on http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server
+
+    def stop(self):
+        """
+        Stops the snapshot writer and the HTTP endpoint.
+        """
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("okx_request_seconds", "Exchange request latency (excluding rate-limit queueing).")
+REGISTRY.describe("okx_rate_limit_wait_seconds", "Time spent waiting for a rate-limit token.")
+REGISTRY.describe("okx_requests_total", "Exchange requests sent.")
+REGISTRY.describe("okx_request_errors_total", "Exchange requests that raised, by error type.")
+REGISTRY.describe("okx_rate_limit_rejected_total", "Requests rejected locally after waiting too long for a token.")
+REGISTRY.describe("triangle_signal_seconds", "check_triangle_arbitrage evaluation time (excluding data fetch).")
+REGISTRY.describe("triangle_signals_total", "Triangle arbitrage evaluations, by outcome.")
@@ -0,0 +1,452 @@
+"""
+ohlcv_lake.py
+
+Local multi-symbol, multi-timeframe OHLCV data lake.
+
+Full candles are kept per symbol and timeframe in monthly compressed columnar
+partitions (<root>/<BASE-QUOTE>/<timeframe>/<YYYY-MM>.npz holding int64
+timestamp and float64 open, high, low, close and volume arrays). As in
+history_store, an index per symbol and timeframe records the ranges already
+downloaded, so a backfill only requests the gaps.
+
+Higher timeframes never need a download: read() and query() derive them, or
+the parts of them not covered yet, by resampling the finest stored timeframe
+that divides them (first open, max high, min low, last close, summed volume),
+and materialize() writes the result back as ordinary partitions. query() returns a frame of several
+symbols aligned on one time index, e.g. the close-price frame that
+OKXTrader.backtest_triangle_arbitrage_vectorized takes. Decompressed
+partitions are kept in a small LRU cache so repeated range queries over the
+same months are served from memory.
+"""
+
+import collections
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from history_store import _atomic_write, _merge_ranges
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+FIELDS = ("open", "high", "low", "close", "volume")
+TIMEFRAME_UNITS = {"s": 1_000, "m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+# Weekly candles start on Monday; the epoch (1970-01-01) was a Thursday.
+WEEK_OFFSET_MS = 4 * 86_400_000
+
+
+def timeframe_ms(timeframe: str) -> int:
+    """
+    Length of a ccxt timeframe string ('1m', '15m', '4h', '1d', '1w') in milliseconds.
+    """
+    unit = timeframe[-1:]
+    if unit not in TIMEFRAME_UNITS or not timeframe[:-1].isdigit():
+        raise ValueError(f"Unsupported timeframe: {timeframe!r}")
+    return int(timeframe[:-1]) * TIMEFRAME_UNITS[unit]
+
+
+def _bucket_start(timestamps, timeframe):
+    """
+    Start of the 'timeframe' candle containing each timestamp (ms).
+    """
+    step = timeframe_ms(timeframe)
+    offset = WEEK_OFFSET_MS if timeframe.endswith("w") else 0
+    return (timestamps - offset) // step * step + offset
+
+
+def _to_ms(value):
+    """
+    Epoch milliseconds from an int (already ms), a datetime or an ISO string (naive = UTC).
+    """
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.value // 1_000_000)
+
+
+def _empty_columns():
+    columns = {"timestamp": np.empty(0, dtype=np.int64)}
+    columns.update({field: np.empty(0, dtype=np.float64) for field in FIELDS})
+    return columns
+
+
+def resample_columns(columns, timeframe):
+    """
+    Aggregates OHLCV columns (sorted by timestamp) into 'timeframe' candles.
+
+    :return: Column dict with one row per non-empty bucket, stamped with the bucket start.
+    """
+    timestamps = columns["timestamp"]
+    if not len(timestamps):
+        return _empty_columns()
+    buckets = _bucket_start(timestamps, timeframe)
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [len(timestamps)])) - 1
+    return {
+        "timestamp": buckets[starts],
+        "open": columns["open"][starts],
+        "high": np.maximum.reduceat(columns["high"], starts),
+        "low": np.minimum.reduceat(columns["low"], starts),
+        "close": columns["close"][ends],
+        "volume": np.add.reduceat(columns["volume"], starts)
+    }
+
+
+class OHLCVLake:
+    """
+    Month-partitioned, compressed columnar store of full OHLCV candles for any symbol and timeframe.
+    """
+
+    def __init__(self, root: str = "ohlcv_lake", cache_partitions: int = 64):
+        """
+        :param root: Directory holding one sub-directory per symbol.
+        :param cache_partitions: Number of decompressed month partitions kept in memory.
+        """
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self.cache_partitions = cache_partitions
+        self._cache = collections.OrderedDict()
+        self._indexes = {}
+        self.lock = threading.RLock()
+
+    # ---------------------------
+    # Layout
+    # ---------------------------
+    def _directory(self, symbol, timeframe):
+        return os.path.join(self.root, symbol.replace("/", "-"), timeframe)
+
+    def symbols(self):
+        """
+        Returns the sorted list of stored symbols.
+        """
+        return sorted(name.replace("-", "/", 1) for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)))
+
+    def timeframes(self, symbol: str):
+        """
+        Returns the timeframes stored for 'symbol', shortest first.
+        """
+        directory = os.path.join(self.root, symbol.replace("/", "-"))
+        if not os.path.isdir(directory):
+            return []
+        return sorted((name for name in os.listdir(directory) if self.partitions(symbol, name)), key=timeframe_ms)
+
+    def partitions(self, symbol: str, timeframe: str):
+        """
+        Returns the sorted month keys (YYYY-MM) stored for a symbol and timeframe.
+        """
+        directory = self._directory(symbol, timeframe)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".npz"))
+
+    # ---------------------------
+    # Index
+    # ---------------------------
+    def _index_path(self, symbol, timeframe):
+        return os.path.join(self._directory(symbol, timeframe), "index.json")
+
+    def covered_ranges(self, symbol: str, timeframe: str):
+        """
+        Returns the merged [start, end) ranges (ms) already fetched for a symbol and timeframe.
+        """
+        key = (symbol, timeframe)
+        with self.lock:
+            if key not in self._indexes:
+                path = self._index_path(symbol, timeframe)
+                ranges = []
+                if os.path.exists(path):
+                    with open(path) as f:
+                        ranges = _merge_ranges(json.load(f).get("ranges", []))
+                self._indexes[key] = ranges
+            return self._indexes[key]
+
+    def mark_covered(self, symbol: str, timeframe: str, start_ms, end_ms: int = None):
+        """
+        Records that [start_ms, end_ms) has been fetched (even if it held no candles).
+        A list of (start, end) ranges can be passed as 'start_ms' instead.
+        """
+        added = [[int(start_ms), int(end_ms)]] if end_ms is not None else [[int(a), int(b)] for a, b in start_ms]
+        with self.lock:
+            ranges = _merge_ranges(self.covered_ranges(symbol, timeframe) + added)
+            self._indexes[(symbol, timeframe)] = ranges
+            os.makedirs(self._directory(symbol, timeframe), exist_ok=True)
+
+            def write(tmp_path):
+                with open(tmp_path, 'w') as f:
+                    json.dump({"ranges": ranges}, f)
+            _atomic_write(self._index_path(symbol, timeframe), write)
+
+    def missing_ranges(self, symbol: str, timeframe: str, start_ms: int, end_ms: int):
+        """
+        Returns the [start, end) sub-ranges of [start_ms, end_ms) not yet covered for a symbol and timeframe.
+        """
+        gaps = []
+        cursor = int(start_ms)
+        for start, end in self.covered_ranges(symbol, timeframe):
+            if end <= cursor:
+                continue
+            if start >= end_ms:
+                break
+            if start > cursor:
+                gaps.append((cursor, min(start, end_ms)))
+            cursor = max(cursor, end)
+            if cursor >= end_ms:
+                break
+        if cursor < end_ms:
+            gaps.append((cursor, int(end_ms)))
+        return gaps
+
+    # ---------------------------
+    # Writing
+    # ---------------------------
+    def append(self, symbol: str, timeframe: str, candles, covered=None):
+        """
+        Stores candles; rows already present (same timestamp) are replaced.
+
+        :param candles: ccxt fetch_ohlcv rows [timestamp, open, high, low, close, volume], an (n, 6) array
+                        or a column dict with "timestamp" and the FIELDS.
+        :param covered: Optional (start_ms, end_ms) range, or list of ranges, to mark as fetched once the
+                        rows are on disk.
+        :return: Number of candles written.
+        """
+        if isinstance(candles, dict):
+            columns = {"timestamp": np.asarray(candles["timestamp"], dtype=np.int64)}
+            columns.update({field: np.asarray(candles[field], dtype=np.float64) for field in FIELDS})
+        else:
+            block = np.asarray(candles, dtype=np.float64).reshape(-1, 6)
+            columns = {"timestamp": block[:, 0].astype(np.int64)}
+            columns.update({field: block[:, i] for i, field in enumerate(FIELDS, start=1)})
+        count = len(columns["timestamp"])
+        if count:
+            months = columns["timestamp"].astype("datetime64[ms]").astype("datetime64[M]")
+            for month in np.unique(months):
+                mask = months == month
+                self._write_partition(symbol, timeframe, str(month), {k: v[mask] for k, v in columns.items()})
+        if covered is not None:
+            self.mark_covered(symbol, timeframe, [covered] if np.ndim(covered) == 1 else covered)
+        return count
+
+    def _partition_path(self, symbol, timeframe, month):
+        return os.path.join(self._directory(symbol, timeframe), f"{month}.npz")
+
+    def _write_partition(self, symbol, timeframe, month, columns):
+        path = self._partition_path(symbol, timeframe, month)
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                existing = self._load_partition(path)
+                columns = {k: np.concatenate([existing[k], columns[k]]) for k in columns}
+            # Keep the last occurrence of each timestamp, sorted by time.
+            _, last_positions = np.unique(columns["timestamp"][::-1], return_index=True)
+            order = len(columns["timestamp"]) - 1 - last_positions
+            columns = {k: np.ascontiguousarray(v[order]) for k, v in columns.items()}
+
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as f:
+                    np.savez_compressed(f, **columns)
+            _atomic_write(path, write)
+            self._cache[path] = columns
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_partitions:
+                self._cache.popitem(last=False)
+
+    def materialize(self, symbol: str, timeframe: str, source: str = None):
+        """
+        Resamples a finer stored timeframe into 'timeframe' and stores it, so later reads need no resampling.
+        Only buckets whose whole span is covered by the source are written (and marked covered).
+
+        :param source: Timeframe to derive from (default: the finest stored one that divides 'timeframe').
+        :return: Number of candles written.
+        """
+        source = source or self._source_timeframe(symbol, timeframe)
+        if source is None:
+            raise ValueError(f"No stored timeframe of {symbol} divides {timeframe}.")
+        step = timeframe_ms(timeframe)
+        written = 0
+        for start, end in self.covered_ranges(symbol, source):
+            first = int(_bucket_start(np.int64(start + step - 1), timeframe))
+            last = int(_bucket_start(np.int64(end), timeframe))
+            if last <= first:
+                continue
+            columns = resample_columns(self._read_stored(symbol, source, first, last), timeframe)
+            written += self.append(symbol, timeframe, columns, covered=(first, last))
+        logger.info(f"Materialized {written} {timeframe} candles of {symbol} from {source}.")
+        return written
+
+    # ---------------------------
+    # Reading
+    # ---------------------------
+    def _load_partition(self, path):
+        with self.lock:
+            columns = self._cache.get(path)
+            if columns is not None:
+                self._cache.move_to_end(path)
+                return columns
+        with np.load(path, allow_pickle=False) as data:
+            columns = {name: data[name] for name in ("timestamp",) + FIELDS}
+        with self.lock:
+            self._cache[path] = columns
+            while len(self._cache) > self.cache_partitions:
+                self._cache.popitem(last=False)
+        return columns
+
+    def _read_stored(self, symbol, timeframe, start_ms, end_ms):
+        months = self.partitions(symbol, timeframe)
+        if start_ms is not None:
+            first = str(np.datetime64(int(start_ms), "ms").astype("datetime64[M]"))
+            months = [m for m in months if m >= first]
+        if end_ms is not None:
+            last = str(np.datetime64(int(end_ms) - 1, "ms").astype("datetime64[M]"))
+            months = [m for m in months if m <= last]
+        parts = []
+        for month in months:
+            columns = self._load_partition(self._partition_path(symbol, timeframe, month))
+            timestamps = columns["timestamp"]
+            lo = 0 if start_ms is None else int(np.searchsorted(timestamps, start_ms, side='left'))
+            hi = len(timestamps) if end_ms is None else int(np.searchsorted(timestamps, end_ms, side='left'))
+            if hi > lo:
+                parts.append({k: v[lo:hi] for k, v in columns.items()})
+        if not parts:
+            return _empty_columns()
+        if len(parts) == 1:
+            return parts[0]
+        return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    def _source_timeframe(self, symbol, timeframe):
+        step = timeframe_ms(timeframe)
+        weekly = timeframe.endswith("w")
+        for candidate in self.timeframes(symbol):
+            size = timeframe_ms(candidate)
+            # Sub-daily candles fit a Monday-aligned week only if they also divide a day
+            if size < step and step % size == 0 and (not weekly or TIMEFRAME_UNITS["d"] % size == 0):
+                return candidate
+        return None
+
+    def read_columns(self, symbol: str, timeframe: str, start=None, end=None):
+        """
+        Candles of one symbol with start <= timestamp < end as a column dict ("timestamp" in ms plus FIELDS).
+
+        Stored candles are read only inside the ranges covered for 'timeframe'; the rest of the span
+        is resampled from the finest stored timeframe that divides it, limited to the buckets that
+        timeframe covers completely. A timeframe stored without any
+        covered index (e.g. appended without 'covered') is read as stored.
+
+        :param start, end: Epoch ms, datetimes or ISO strings (UTC); None for unbounded.
+        """
+        start_ms, end_ms = _to_ms(start), _to_ms(end)
+        ranges = self.covered_ranges(symbol, timeframe)
+        if not ranges and self.partitions(symbol, timeframe):
+            return self._read_stored(symbol, timeframe, start_ms, end_ms)
+        lower = -np.inf if start_ms is None else start_ms
+        upper = np.inf if end_ms is None else end_ms
+        source = self._source_timeframe(symbol, timeframe)
+        parts, cursor = [], lower
+        for covered_start, covered_end in ranges:
+            if covered_end <= cursor:
+                continue
+            if covered_start >= upper:
+                break
+            if covered_start > cursor and source is not None:
+                parts.append(self._resample_span(symbol, timeframe, source, cursor, covered_start))
+            cursor = max(cursor, covered_start)
+            stop = min(covered_end, upper)
+            parts.append(self._read_stored(symbol, timeframe, cursor, stop))
+            cursor = stop
+        if cursor < upper and source is not None:
+            parts.append(self._resample_span(symbol, timeframe, source, cursor, upper))
+        parts = [p for p in parts if len(p["timestamp"])]
+        if not parts:
+            return _empty_columns()
+        if len(parts) == 1:
+            return parts[0]
+        return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    def _resample_span(self, symbol, timeframe, source, start_ms, end_ms):
+        """
+        'timeframe' candles stamped in [start_ms, end_ms) resampled from 'source' (bounds may be +-inf).
+        As in materialize(), only buckets whose whole span is covered by the source are returned, so a
+        partly downloaded (or still forming) bucket never passes for a complete candle.
+        """
+        step = timeframe_ms(timeframe)
+
+        def ceil(t):
+            return int(_bucket_start(np.int64(t + step - 1), timeframe))
+        parts = []
+        for covered_start, covered_end in self.covered_ranges(symbol, source):
+            first, last = ceil(covered_start), int(_bucket_start(np.int64(covered_end), timeframe))
+            if not np.isinf(start_ms):
+                first = max(first, ceil(start_ms))
+            if not np.isinf(end_ms):
+                # Buckets stamped before end_ms, read in full
+                last = min(last, ceil(end_ms))
+            if last > first:
+                parts.append(resample_columns(self._read_stored(symbol, source, first, last), timeframe))
+        if not parts:
+            return _empty_columns()
+        return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    def read(self, symbol: str, timeframe: str, start=None, end=None):
+        """
+        Candles of one symbol as a DataFrame indexed by UTC timestamp with the FIELDS as columns.
+        """
+        columns = self.read_columns(symbol, timeframe, start, end)
+        index = pd.DatetimeIndex(pd.to_datetime(columns["timestamp"], unit="ms", utc=True), name="timestamp")
+        return pd.DataFrame({field: columns[field] for field in FIELDS}, index=index)
+
+    def query(self, symbols, timeframe: str, start=None, end=None, fields="close", how: str = "inner",
+              fill: bool = False):
+        """
+        Aligned multi-symbol range query.
+
+        :param symbols: Symbols to load.
+        :param fields: One field name (columns are then the symbols) or several (columns are a
+                       (field, symbol) MultiIndex).
+        :param how: "inner" keeps the timestamps every symbol has, "outer" keeps all of them.
+        :param fill: With how="outer", carry the last close into gaps (open/high/low = close, volume = 0).
+        :return: DataFrame indexed by UTC timestamp.
+        """
+        single = isinstance(fields, str)
+        fields = (fields,) if single else tuple(fields)
+        data = {symbol: self.read_columns(symbol, timeframe, start, end) for symbol in symbols}
+        stamps = [columns["timestamp"] for columns in data.values()]
+        if not stamps:
+            timestamps = np.empty(0, dtype=np.int64)
+        elif how == "inner":
+            timestamps = stamps[0]
+            for other in stamps[1:]:
+                timestamps = np.intersect1d(timestamps, other, assume_unique=True)
+        elif how == "outer":
+            timestamps = np.unique(np.concatenate(stamps))
+        else:
+            raise ValueError(f"how must be 'inner' or 'outer', got {how!r}")
+
+        aligned = {}
+        for symbol, columns in data.items():
+            positions = np.searchsorted(columns["timestamp"], timestamps)
+            present = positions < len(columns["timestamp"])
+            present[present] = columns["timestamp"][positions[present]] == timestamps[present]
+            close = None
+            if fill and len(columns["timestamp"]):
+                # Index of the latest candle at or before each timestamp
+                latest = np.searchsorted(columns["timestamp"], timestamps, side='right') - 1
+                close = np.where(latest >= 0, columns["close"][np.maximum(latest, 0)], np.nan)
+            for field in fields:
+                values = np.full(len(timestamps), np.nan)
+                values[present] = columns[field][positions[present]]
+                if close is not None:
+                    values = np.where(present, values, 0.0 if field == "volume" else close)
+                aligned[(field, symbol)] = values
+        index = pd.DatetimeIndex(pd.to_datetime(timestamps, unit="ms", utc=True), name="timestamp")
+        frame = pd.DataFrame(aligned, index=index)
+        if single:
+            frame.columns = [symbol for _, symbol in frame.columns]
+        else:
+            frame.columns = pd.MultiIndex.from_tuples(frame.columns, names=["field", "symbol"])
+        return frame
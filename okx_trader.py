@@ -7,11 +7,14 @@ including account management, order execution, and synchronization.
 
 import os
 import json
+import contextlib
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import ccxt
 
@@ -19,8 +22,23 @@ import ccxt
 load_dotenv()
 
 # Import SAFE_MARGIN from config
-from config import SAFE_MARGIN, IS_SIMULATION, COIN_LIST
-from logger_config import setup_logger
+from config import SAFE_MARGIN, IS_SIMULATION, COIN_LIST, TAKER_FEE
+from logger_config import setup_logger, log_event, backtest_mode
+from backtest_engine import to_price_arrays, run_vectorized_backtest, run_streaming_backtest
+from event_backtester import EventBacktester, latency_sweep
+from rate_limiter import TokenBucket, RequestScheduler, ScheduledExchange, PRIORITY_BACKFILL, PRIORITY_REPORTING
+from history_store import TriangleHistoryStore
+from ohlcv_lake import timeframe_ms
+from book_evaluator import evaluate_books
+from cycle_graph import CurrencyGraph
+from basis_scanner import BasisScanner
+from market_cache import MarketMetadataCache
+from price_snapshot import PriceSnapshot
+from order_state import OrderStateManager
+from order_history import OrderHistoryStore
+from metrics import REGISTRY
+from pnl_engine import PnLEngine, to_fill_table
+from portfolio import PortfolioValuator
 
 # Configure logging
 logger = setup_logger(__name__)
@@ -31,10 +49,17 @@ class OKXTrader:
     order placement, cancellation, and synchronization with the OKX exchange via CCXT.
     """
 
-    def __init__(self):
+    def __init__(self, exchange=None, scheduler=None, order_history=None):
         """
         Initializes the trader instance with authentication credentials and sets up internal attributes.
         Loads credentials from environment variables if not provided explicitly.
+
+        :param exchange: Optional pre-built ccxt-compatible exchange (e.g. fake_exchange.FakeExchange
+                         for offline runs). Defaults to the OKX exchange configured below.
+        :param scheduler: Optional RequestScheduler. The default OKX exchange is always routed through
+                          one (per-endpoint OKX limits); a pre-built exchange only when a scheduler is given.
+        :param order_history: Optional OrderHistoryStore. The default OKX exchange uses the on-disk
+                              order_history.db; a pre-built exchange gets an in-memory store.
         """
 
         # Load credentials from environment if not provided
@@ -49,25 +74,109 @@ class OKXTrader:
 
         # Initialize CCXT OKX exchange instance
         # For demonstration, we override the default OKX base URLs with https://my.okx.com/
-        self.exchange = ccxt.myokx({
-            'apiKey': self.api_key,
-            'secret': self.api_secret,
-            'password': self.passphrase,  # OKX passphrase -> 'password' in CCXT
-            'enableRateLimit': True,
-            'urls': {
-                'api': {
-                    'public': 'https://my.okx.com',
-                    'private': 'https://my.okx.com',
+        # Throttling is done per endpoint by the RequestScheduler instead of ccxt's global rate limiter.
+        persist_markets = exchange is None
+        if exchange is None:
+            exchange = ccxt.myokx({
+                'apiKey': self.api_key,
+                'secret': self.api_secret,
+                'password': self.passphrase,  # OKX passphrase -> 'password' in CCXT
+                'enableRateLimit': False,
+                'urls': {
+                    'api': {
+                        'public': 'https://my.okx.com',
+                        'private': 'https://my.okx.com',
+                    }
                 }
-            }
-        })
-        # Initialize balance, holdings, and active_orders
+            })
+            scheduler = scheduler or RequestScheduler()
+            order_history = order_history or OrderHistoryStore()
+        if isinstance(exchange, ScheduledExchange):
+            scheduler = exchange.scheduler
+        elif scheduler is not None:
+            exchange = ScheduledExchange(exchange, scheduler)
+        self.exchange = exchange
+        self.scheduler = scheduler or RequestScheduler()
+        # Closed-order history served locally; only orders newer than the cursor are downloaded
+        self.order_history = order_history or OrderHistoryStore(":memory:")
+        # Market metadata (precision, lot size, min notional) served from a cached snapshot;
+        # injected (fake or test) exchanges keep theirs in memory so they never seed a live run
+        self.market_cache = MarketMetadataCache(self.exchange, persist=persist_markets)
+
+        # Bulk ticker snapshot shared by every price lookup (one fetch_tickers per refresh)
+        self.price_snapshot = PriceSnapshot(self.exchange, symbols=self.TRIANGLE_SYMBOLS + COIN_LIST)
+        # Portfolio valuation: balance, prices and fills fetched concurrently, cost basis from the fill cache
+        self.portfolio = PortfolioValuator(self.exchange, self.price_snapshot, self.order_history, self.scheduler)
+        # PnL engine fed only the orders each history sync adds (see update_pnl)
+        self.pnl_engine = PnLEngine()
+        self.pnl_fills = None
+        self._pnl_rowid = 0
+        self._pnl_order_ids = set()
+        self._pnl_lock = threading.Lock()
+
+        # Initialize balance, holdings, and the open-order book
+        self.order_state = OrderStateManager()
         self.balance = self.get_account_balance()
-        self.active_orders = self.get_open_orders()
+        self.reconcile_open_orders()
 
         # Log initialization
         logger.info("OKXTrader initialized with API credentials.")
 
+    @property
+    def active_orders(self):
+        """
+        Open orders as a list (backed by the indexed OrderStateManager).
+        """
+        return self.order_state.open_orders()
+
+    @active_orders.setter
+    def active_orders(self, orders):
+        self.order_state.reconcile(orders)
+
+    def reconcile_open_orders(self):
+        """
+        Replaces the open-order book with a REST snapshot. A failed fetch leaves the book untouched
+        (get_open_orders() would report it as an empty list, which would erase the book).
+
+        :return: True if the book was reconciled.
+        """
+        try:
+            fetched_at = time.time()
+            self.order_state.reconcile(self.exchange.fetch_open_orders(), fetched_at=fetched_at)
+            return True
+        except Exception as e:
+            logger.error(f"Error reconciling open orders, keeping the current book: {e}")
+            return False
+
+    def start_order_stream(self, ws_exchange=None, reconcile_interval=30.0, safety_interval=600.0):
+        """
+        Keeps the open-order book current from the private orders WebSocket stream, falling back
+        to REST reconciliation while the stream is down.
+
+        :param ws_exchange: ccxt.pro exchange with watch_orders (default: authenticated ccxt.pro OKX).
+        """
+        if ws_exchange is None:
+            import ccxt.pro as ccxtpro
+            ws_exchange = ccxtpro.myokx({
+                'apiKey': self.api_key,
+                'secret': self.api_secret,
+                'password': self.passphrase,
+            })
+        self.order_state.start(ws_exchange, lambda: self.exchange.fetch_open_orders(),
+                               reconcile_interval=reconcile_interval, safety_interval=safety_interval)
+        logger.info("Order stream started.")
+
+    def start_metrics_export(self, port: int = 9108, snapshot_path: str = "metrics_snapshot.json",
+                             interval: float = 60.0):
+        """
+        Exposes request and signal metrics at http://127.0.0.1:<port>/metrics and writes a JSON
+        snapshot every 'interval' seconds. Either output can be disabled by passing None.
+        """
+        if port is not None:
+            REGISTRY.start_http_server(port)
+        if snapshot_path is not None:
+            REGISTRY.start_snapshot_writer(snapshot_path, interval)
+
     def get_account_balance(self):
         """
         Retrieves and returns the current account balance.
@@ -116,21 +225,32 @@ class OKXTrader:
         """
         logger.info("Fetching closed orders...")
         try:
-            since = None
-            if start_date:
-                since = self.exchange.parse8601(start_date)
-
-            closed_orders = self.exchange.fetchClosedOrders(symbol=None, since=since)
-            # If needed, filter by end_date
-            if end_date:
-                end_timestamp = self.exchange.parse8601(end_date)
-                closed_orders = [order for order in closed_orders if order['timestamp'] <= end_timestamp]
-
-            return closed_orders
+            self.sync_order_history()
+            since = self.exchange.parse8601(start_date) if start_date else None
+            end_timestamp = self.exchange.parse8601(end_date) if end_date else None
+            return self.order_history.orders(since, end_timestamp)
         except Exception as e:
             logger.error(f"Error fetching closed orders: {e}")
             return []
 
+    def sync_order_history(self, max_age: float = 60.0):
+        """
+        Brings the local order history up to date (only orders newer than its cursor are
+        downloaded; the first call pages through the 3 months OKX keeps). Skipped when the last
+        sync is more recent than max_age seconds.
+
+        :return: Number of orders received, or None if skipped or on error.
+        """
+        synced_at = self.order_history.synced_at()
+        if synced_at is not None and time.time() - synced_at < max_age:
+            return None
+        try:
+            with self.scheduler.priority(PRIORITY_REPORTING):
+                return self.order_history.sync_orders(self.exchange)
+        except Exception as e:
+            logger.error(f"Error syncing order history: {e}")
+            return None
+
     def get_last_closed_order(self, instrument_id: str, start_date: str = None, end_date: str = None):
         """
         Get the last closed order for a specific instrument.
@@ -183,9 +303,9 @@ class OKXTrader:
         #logger.info("Placing limit order...")
         try:
             side = 'buy' if order_type.lower() == 'buy' else 'sell'
-            quantity = float(self.exchange.amount_to_precision(instrument_id, quantity))
+            quantity = self.market_cache.amount_to_precision(instrument_id, quantity)
             if price:
-                price = float(self.exchange.price_to_precision(instrument_id, price))
+                price = self.market_cache.price_to_precision(instrument_id, price)
             #print(f"Placing order with: {instrument_id}, {quantity}, {side}, {price}")
             # Check if we have enough balance (minus SAFE_MARGIN) - simplistic check
             if self.balance < (price * quantity if price else 0) + SAFE_MARGIN:
@@ -203,7 +323,7 @@ class OKXTrader:
                 params={}
             )
             # Update active orders and log
-            self.active_orders.append(order)
+            self.order_state.upsert(order)
             logger.info(f"Placed limit order: {order}")
             return order
         except Exception as e:
@@ -215,8 +335,6 @@ class OKXTrader:
         Place a limit order.
         """
         logger.info("Placing limit order...")
-        time.sleep(0.1)
-
         return self._internal_place_order(order_type, instrument_id, quantity, price)
     
     def place_market_order(self, side: str, symbol: str, size: float) -> dict:
@@ -243,8 +361,7 @@ class OKXTrader:
             size = float(f"{size:.6f}")
             
             # Get current price for logging purposes
-            ticker = self.exchange.fetch_ticker(symbol)
-            current_price = ticker['last'] if ticker and 'last' in ticker else None
+            current_price = self.price_snapshot.last(symbol)
             
             if current_price is None:
                 logger.warning(f"Could not fetch current price for {symbol}")
@@ -259,7 +376,6 @@ class OKXTrader:
             
             # For market orders, we may need to fetch the filled details
             filled_order = self.exchange.fetch_order(order_id, symbol)
-            time.sleep(0.1)
             
             # Extract relevant information
             result = {
@@ -274,7 +390,7 @@ class OKXTrader:
             
             # Add to active orders if it's not fully filled
             if filled_order.get('status') != 'closed':
-                self.active_orders.append(result)
+                self.order_state.upsert(result)
             
             logger.info(f"Market {side.upper()} order placed: {result}")
             return result
@@ -294,7 +410,7 @@ class OKXTrader:
             return None
         logger.info("Placing stop loss order...")
         try:
-            quantity = float(self.exchange.amount_to_precision(instrument_id, quantity))
+            quantity = self.market_cache.amount_to_precision(instrument_id, quantity)
             if slTriggerPx is None:
                 logger.warning("No slTriggerPx provided; not placing a stop loss.")
                 return None
@@ -307,7 +423,7 @@ class OKXTrader:
                 "tdMode": "cash",
                 "stopPx": slTriggerPx
             }
-            slOrdPrice = float(self.exchange.price_to_precision(instrument_id, slTriggerPx*0.999))
+            slOrdPrice = self.market_cache.price_to_precision(instrument_id, slTriggerPx*0.999)
             params["px"] = slOrdPrice
 
             # We'll place a "dummy" limit order with trigger parameters
@@ -320,7 +436,7 @@ class OKXTrader:
                 price=slOrdPrice if slOrdPrice else slTriggerPx,  # fallback
                 params=params
             )
-            self.active_orders.append(order)
+            self.order_state.upsert(order)
             logger.info(f"Placed stop loss order: {order}")
             return order
         except Exception as e:
@@ -337,7 +453,7 @@ class OKXTrader:
             return None
         logger.info("Placing take profit order...")
         try:
-            quantity = float(self.exchange.amount_to_precision(instrument_id, quantity))
+            quantity = self.market_cache.amount_to_precision(instrument_id, quantity)
             if tpTriggerPx is None:
                 logger.warning("No tpTriggerPx provided; not placing a take profit.")
                 return None
@@ -350,7 +466,7 @@ class OKXTrader:
                 "tdMode": "cross",
                 "tpTriggerPx": str(tpTriggerPx)
             }
-            formatted_price = float(self.exchange.price_to_precision(instrument_id, tpTriggerPx*1.001))
+            formatted_price = self.market_cache.price_to_precision(instrument_id, tpTriggerPx*1.001)
             tpOrdPrice = formatted_price
             params["tpOrdPx"] = str(tpOrdPrice)
 
@@ -363,7 +479,7 @@ class OKXTrader:
                 price=tpOrdPrice if tpOrdPrice else tpTriggerPx,  # fallback
                 params=params
             )
-            self.active_orders.append(order)
+            self.order_state.upsert(order)
             logger.info(f"Placed take profit order: {order}")
             return order
         except Exception as e:
@@ -401,15 +517,15 @@ class OKXTrader:
                 orders = self.exchange.fetch_open_orders(symbol=None, since=since)
                 all_orders.extend(orders)
 
-            # fetchClosedOrders for 'closed' or any
-            if status in [None, 'closed']:
-                orders = self.exchange.fetch_closed_orders(symbol=None, since=since)
-                all_orders.extend(orders)
-
             if end_date:
                 end_timestamp = self.exchange.parse8601(end_date)
                 all_orders = [o for o in all_orders if o['timestamp'] <= end_timestamp]
 
+            # Closed orders come from the local history (index range query)
+            if status in [None, 'closed']:
+                self.sync_order_history()
+                all_orders.extend(self.order_history.orders(since, self.exchange.parse8601(end_date) if end_date else None))
+
             return all_orders
         except Exception as e:
             logger.error(f"Error fetching orders by date: {e}")
@@ -419,14 +535,13 @@ class OKXTrader:
         """
         Cancels a single order using its order ID.
         """
-        time.sleep(0.1)
         logger.info(f"Cancelling order {order_id}...")
         try:
-            # Find the order in active_orders to get its symbol
-            order_info = next((o for o in self.active_orders if o.get('id') == order_id), None)
+            # Find the order in the open-order book to get its symbol
+            order_info = self.order_state.get(order_id)
             
             if not order_info:
-                # If not found in active_orders, try to fetch it from the exchange
+                # If not found in the book, try to fetch it from the exchange
                 try:
                     # Note: This might fail if the order doesn't exist anymore
                     order_info = self.exchange.fetch_order(order_id)
@@ -442,54 +557,165 @@ class OKXTrader:
             
             response = self.exchange.cancel_order(order_id, symbol)
             logger.info(f"Cancelled order {order_id}: {response}")
-            # Remove from active_orders
-            self.active_orders = [o for o in self.active_orders if o.get('id') != order_id]
+            # Remove from the open-order book
+            self.order_state.remove(order_id)
             return response
         except Exception as e:
             logger.error(f"Error cancelling order {order_id}: {e}")
             return None
 
-    def cancel_all_orders(self):
+    BATCH_SIZE = 20  # OKX batch-orders / cancel-batch-orders accept at most 20 orders per request
+
+    def _run_batches(self, method, requests, max_workers=8):
+        """
+        Splits raw OKX requests into chunks of BATCH_SIZE, sends the chunks concurrently
+        through 'method' and returns the per-order response rows in request order.
+        A chunk that fails as a whole yields one error row per order.
+        """
+        chunks = [requests[i:i + self.BATCH_SIZE] for i in range(0, len(requests), self.BATCH_SIZE)]
+
+        def send(chunk):
+            try:
+                return method(chunk).get('data', [])
+            except Exception as e:
+                logger.error(f"Error sending batch of {len(chunk)} orders: {e}")
+                return [{'sCode': 'error', 'sMsg': str(e)} for _ in chunk]
+
+        if not chunks:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            return [row for rows in executor.map(send, chunks) for row in rows]
+
+    def place_orders_batch(self, orders, max_workers=8):
+        """
+        Places many orders through OKX's batch-orders endpoint (20 per request, chunks sent concurrently).
+
+        :param orders: List of dicts with 'symbol', 'side' ('buy'/'sell'), 'amount' (base units) and
+                       optionally 'price' (limit order; market otherwise), 'type' and 'clientOrderId'.
+        :param max_workers: Maximum number of chunks in flight.
+        :return: Per-order results in input order: id, clientOrderId, symbol, side, amount, price,
+                 success, code, message. None in simulation mode.
+        """
+        if IS_SIMULATION:
+            print(f"[SIMULATION] calling OKXTrader.place_orders_batch({len(orders)} orders)")
+            return None
+        logger.info(f"Placing {len(orders)} orders in batches...")
+        try:
+            requests = []
+            for order in orders:
+                symbol = order['symbol'].replace('-', '/')
+                price = order.get('price')
+                order_type = order.get('type') or ('limit' if price else 'market')
+                request = {
+                    'instId': self.market_cache.get(symbol)['id'],
+                    'tdMode': 'cash',
+                    'side': order['side'].lower(),
+                    'ordType': order_type,
+                    'sz': str(self.market_cache.amount_to_precision(symbol, order['amount'])),
+                }
+                if price:
+                    request['px'] = str(self.market_cache.price_to_precision(symbol, price))
+                if order_type == 'market':
+                    # Size market orders in base currency (OKX defaults market buys to quote currency).
+                    request['tgtCcy'] = 'base_ccy'
+                if order.get('clientOrderId'):
+                    request['clOrdId'] = order['clientOrderId']
+                requests.append(request)
+
+            rows = self._run_batches(self.exchange.private_post_trade_batch_orders, requests, max_workers)
+            results = []
+            for order, request, row in zip(orders, requests, rows):
+                result = {
+                    'id': row.get('ordId') or None,
+                    'clientOrderId': row.get('clOrdId') or request.get('clOrdId'),
+                    'symbol': order['symbol'].replace('-', '/'),
+                    'side': request['side'],
+                    'amount': float(request['sz']),
+                    'price': float(request['px']) if 'px' in request else None,
+                    'success': row.get('sCode') == '0',
+                    'code': row.get('sCode'),
+                    'message': row.get('sMsg')
+                }
+                if result['success']:
+                    self.order_state.upsert({**result, 'status': 'open'})
+                results.append(result)
+            placed = sum(r['success'] for r in results)
+            batches = (len(requests) + self.BATCH_SIZE - 1) // self.BATCH_SIZE
+            logger.info(f"Placed {placed} of {len(orders)} orders in {batches} requests.")
+            return results
+        except Exception as e:
+            logger.error(f"Error placing orders batch: {e}")
+            return None
+
+    def cancel_orders_batch(self, orders, max_workers=8):
         """
-        Cancels all active orders.
+        Cancels many orders through OKX's cancel-batch-orders endpoint (20 per request, chunks sent concurrently).
+
+        :param orders: List of ccxt orders (or dicts with 'id' and 'symbol').
+        :param max_workers: Maximum number of chunks in flight.
+        :return: Per-order results in input order: id, symbol, success, code, message.
+        """
+        logger.info(f"Cancelling {len(orders)} orders in batches...")
+        try:
+            requests = [{'instId': self.market_cache.get(o['symbol'])['id'], 'ordId': str(o['id'])} for o in orders]
+            rows = self._run_batches(self.exchange.private_post_trade_cancel_batch_orders, requests, max_workers)
+            results = [{'id': o['id'], 'symbol': o['symbol'], 'success': row.get('sCode') == '0',
+                        'code': row.get('sCode'), 'message': row.get('sMsg')}
+                       for o, row in zip(orders, rows)]
+            cancelled = [r['id'] for r in results if r['success']]
+            for order_id in cancelled:
+                self.order_state.remove(order_id)
+            logger.info(f"Cancelled {len(cancelled)} of {len(orders)} orders.")
+            return results
+        except Exception as e:
+            logger.error(f"Error cancelling orders batch: {e}")
+            return None
+
+    def cancel_all_orders(self, max_rounds=10):
+        """
+        Cancels all open orders with batch cancellation requests.
+
+        OKX returns at most 100 open orders per request, so open orders are fetched and cancelled
+        round by round until the exchange reports none left (at most 'max_rounds' rounds). Only
+        orders whose cancellation succeeded are removed from the local order book.
+
+        :return: True once fetch_open_orders comes back empty, False if orders remain or a request failed.
         """
         logger.info("Cancelling all active orders...")
         try:
-            # fetch open orders from the exchange
-            open_orders = self.get_open_orders()
             cancelled_count = 0
-            failed_count = 0
-            
-            for order in open_orders:
-                order_id = order['id']
-                symbol = order.get('symbol')
-                
-                if not symbol:
-                    logger.info(f"Cannot cancel order {order_id}: missing symbol information")
-                    failed_count += 1
-                    continue
-                
-                try:
-                    self.exchange.cancel_order(order_id, symbol)
-                    cancelled_count += 1
-                    print(f"Cancelled order {order_id}")
-                except Exception as e:
-                    logger.info(f"Failed to cancel order {order_id}: {e}")
-                    failed_count += 1
-
-            # Clear local active_orders
-            self.active_orders.clear()
-            logger.info(f"Cancelled {cancelled_count} orders, failed to cancel {failed_count} orders.")
-            
-            # Get the open orders again, now should be empty
-            open_orders = self.get_open_orders()
-            if len(open_orders) == 0:
-                logger.info("All active orders have been cancelled.")
-            else:
-                logger.warning(f"{len(open_orders)} orders still remain active.")
-            return True
+            for _ in range(max_rounds):
+                # fetch open orders from the exchange (errors abort: the state is unknown)
+                open_orders = self.exchange.fetch_open_orders()
+                if not open_orders:
+                    logger.info(f"All active orders have been cancelled ({cancelled_count} cancelled).")
+                    return True
+                cancellable = [o for o in open_orders if o.get('symbol')]
+                for order in open_orders:
+                    if not order.get('symbol'):
+                        logger.info(f"Cannot cancel order {order['id']}: missing symbol information")
+                if not cancellable:
+                    break
+
+                results = self.cancel_orders_batch(cancellable)
+                if results is None:
+                    return False
+                failed = [r for r in results if not r['success']]
+                for r in failed:
+                    logger.info(f"Failed to cancel order {r['id']}: {r['code']} {r['message']}")
+                cancelled_count += len(results) - len(failed)
+                if len(failed) == len(results):
+                    # Nothing could be cancelled this round; another round would not change that
+                    break
+
+            remaining = self.exchange.fetch_open_orders()
+            if not remaining:
+                logger.info(f"All active orders have been cancelled ({cancelled_count} cancelled).")
+                return True
+            logger.warning(f"Cancelled {cancelled_count} orders; {len(remaining)} orders still remain active.")
+            return False
         except Exception as e:
-            logger.info(f"Error cancelling all orders: {e}")
+            logger.error(f"Error cancelling all orders: {e}")
             return False
 
     def sync_account_info(self):
@@ -504,8 +730,9 @@ class OKXTrader:
             self.holdings = balance_info.get('total', {})
             self.balance = self.holdings.get('USDT', 0.0) or self.holdings.get('USD', 0.0)
 
-            open_orders = self.get_open_orders()
-            self.active_orders = open_orders
+            # With a live order stream the book is already current; otherwise reconcile over REST.
+            if not self.order_state.stream_connected:
+                self.reconcile_open_orders()
 
             logger.info(f"Synchronized account: balance={self.balance}, holdings={self.holdings}")
         except Exception as e:
@@ -546,12 +773,9 @@ class OKXTrader:
         #market = self.exchange.load_market(coin)
         #replace - with /
         coin = coin.replace('-', '/')
-        markets=self.exchange.load_markets()
-        market = markets[coin]
-        min_order_size = float(market['limits']['amount']['min'])
-        ticker = self.exchange.fetch_ticker(coin)
-        
-        current_price = ticker['last']
+        market = self.market_cache.get(coin)
+        min_order_size = market['min_amount']
+        current_price = self.price_snapshot.last(coin)
 
         # Calculate the minimum order value in the quote currency
         min_order_value = min_order_size * current_price
@@ -564,6 +788,8 @@ class OKXTrader:
     def get_minimum_investment_by_coin_list(self) -> float:
         #to record the max of the minimum investment among all coins
         min_investment =0
+        # Warm the snapshot for every coin with a single request
+        self.price_snapshot.get_tickers(COIN_LIST)
         for coin in COIN_LIST:
             min_investment = max(min_investment, self.get_minimum_investment_by_coin(coin))
         return min_investment
@@ -572,15 +798,47 @@ class OKXTrader:
         """
         Get the current price of a coin.
         """
-        ticker = self.exchange.fetch_ticker(coin)
-        return float(ticker['last'])
+        return self.price_snapshot.last(coin)
     
-    def calculate_pnl(self, start_date: str, end_date: str):
+    def update_pnl(self):
+        """
+        Syncs the order history and feeds pnl_engine the orders stored since the last update.
+
+        A fill older than the last one the engine has for its symbol (an order that rested across
+        the sync cursor) cannot be applied after it, so the engine is then rebuilt from the store.
+
+        :return: Per-fill PnL of the whole stored history (pnl_fills).
+        """
+        self.sync_order_history()
+        with self._pnl_lock:
+            frame, rowid = self.order_history.orders_written_after(self._pnl_rowid)
+            frame = frame[~frame['id'].isin(self._pnl_order_ids)]
+            fills = to_fill_table(frame)
+            first = fills.groupby('symbol')['timestamp'].min()
+            if any(ts < self.pnl_engine.last_timestamps.get(symbol, float('-inf')) for symbol, ts in first.items()):
+                logger.info("Order history sync added fills older than the PnL engine state; rebuilding it.")
+                self.pnl_engine, self.pnl_fills, self._pnl_order_ids = PnLEngine(), None, set()
+                frame, rowid = self.order_history.orders_written_after(0)
+                fills = to_fill_table(frame)
+            if self.pnl_fills is None or not fills.empty:
+                result = self.pnl_engine.update(fills)
+                self.pnl_fills = result if self.pnl_fills is None else pd.concat([self.pnl_fills, result],
+                                                                                 ignore_index=True)
+            self._pnl_rowid = rowid
+            self._pnl_order_ids.update(frame['id'])
+            return self.pnl_fills
+
+    def calculate_pnl(self, start_date: str, end_date: str, method: str = "fifo"):
         """
         Calculate profit and loss for transactions between start_date and end_date.
         
+        Fills are matched against the whole stored history (pnl_engine, updated incrementally by
+        update_pnl), so sells in the range are costed against the lots actually bought, including
+        earlier ones.
+        
         :param start_date: Start date in ISO format (e.g., "2023-01-01T00:00:00Z")
         :param end_date: End date in ISO format (e.g., "2023-12-31T23:59:59Z")
+        :param method: "fifo" or "average" cost basis for the realized PnL
         :return: Dictionary with PnL information by coin and total
         """
         logger.info(f"Calculating transactions PnL from {start_date} to {end_date}...")
@@ -589,58 +847,28 @@ class OKXTrader:
             # Convert dates to milliseconds timestamp for OKX API
             start_timestamp = int(datetime.fromisoformat(start_date.replace('Z', '+00:00')).timestamp() * 1000)
             end_timestamp = int(datetime.fromisoformat(end_date.replace('Z', '+00:00')).timestamp() * 1000)
+            realized_column = {"fifo": "realized_fifo", "average": "realized_avg"}[method]
             
-            filled_orders = self.get_closed_orders(start_date, end_date)
-            
-            # Filter to only include filled/closed orders
+            # Exact per-fill PnL over the local history, then aggregated per coin for the range
+            fills = self.update_pnl()
+            fills = fills[(fills['timestamp'] >= start_timestamp) & (fills['timestamp'] <= end_timestamp)]
+            totals = fills.assign(coin=fills['symbol'].str.split('/').str[0]).groupby('coin')[
+                ['buy_volume', 'buy_value', 'sell_volume', 'sell_value', 'fee', 'turnover',
+                 'realized_fifo', 'realized_avg', 'unmatched']].sum()
             
-            
-            # Calculate PnL by coin
             pnl_by_coin = {}
-            for order in filled_orders:
-                symbol = order['symbol']
-                coin = symbol.split('/')[0]  # Extract base currency (e.g., BTC from BTC/USDT)
-                
-                if coin not in pnl_by_coin:
-                    pnl_by_coin[coin] = {
-                        'buy_volume': 0.0,
-                        'buy_value': 0.0,
-                        'sell_volume': 0.0,
-                        'sell_value': 0.0,
-                        'fee': 0.0,
-                        'realized_pnl': 0.0
-                    }
-                
-                # Add order data to the coin's records
-                side = order['side']
-                price = float(order['price'])
-                amount = float(order['amount'])
-                cost = float(order['cost'])
-                fee = float(order.get('fee', {}).get('cost', 0))
-                
-                if side == 'buy':
-                    pnl_by_coin[coin]['buy_volume'] += amount
-                    pnl_by_coin[coin]['buy_value'] += cost
-                elif side == 'sell':
-                    pnl_by_coin[coin]['sell_volume'] += amount
-                    pnl_by_coin[coin]['sell_value'] += cost
-                
-                pnl_by_coin[coin]['fee'] += fee
-            
-            # Calculate realized PnL for each coin
             total_pnl = 0.0
-            for coin, data in pnl_by_coin.items():
-                # Calculate average buy and sell prices
+            for coin, row in totals.iterrows():
+                data = {key: float(value) for key, value in row.items()}
                 avg_buy_price = data['buy_value'] / data['buy_volume'] if data['buy_volume'] > 0 else 0
                 avg_sell_price = data['sell_value'] / data['sell_volume'] if data['sell_volume'] > 0 else 0
                 
-                # Calculate realized PnL (from closed positions)
-                min_volume = min(data['buy_volume'], data['sell_volume'])
-                data['realized_pnl'] = (avg_sell_price - avg_buy_price) * min_volume - data['fee']
-                data['realized_pnl'] = data['realized_pnl'] - data['fee']
+                # Realized PnL of the sells in the range, net of all fees paid in the range
+                data['realized_pnl'] = data[realized_column] - data['fee']
                 #percentage of pnl
-                data['pnl_percent'] = (data['realized_pnl'] / data['buy_value']) * 100
-
+                data['pnl_percent'] = (data['realized_pnl'] / data['buy_value']) * 100 if data['buy_value'] > 0 else 0
+                pnl_by_coin[coin] = data
+                
                 total_pnl += data['realized_pnl']
                 print(f"PnL for {coin}: {data['realized_pnl']}, fee: {data['fee']}, buy_volume: {data['buy_volume']}, sell_volume: {data['sell_volume']}, avg_buy_price: {avg_buy_price}, avg_sell_price: {avg_sell_price}, pnl_percent: {data['pnl_percent']}")
             
@@ -654,6 +882,27 @@ class OKXTrader:
             logger.error(f"Error calculating PnL: {e}")
             return {'error': str(e)}
 
+    def calculate_pnl_buckets(self, start_date: str, end_date: str, freq: str = "1D"):
+        """
+        Realized FIFO / average-cost PnL, fees, turnover and volumes per symbol and time bucket,
+        for the buckets from the one holding start_date to the one holding end_date.
+
+        :param freq: Bucket size, one of pnl_engine.bucket_freqs ("1h" or "1D").
+        :return: DataFrame indexed by (symbol, bucket), or None on error.
+        """
+        try:
+            start_timestamp = int(datetime.fromisoformat(start_date.replace('Z', '+00:00')).timestamp() * 1000)
+            end_timestamp = int(datetime.fromisoformat(end_date.replace('Z', '+00:00')).timestamp() * 1000)
+            self.update_pnl()
+            buckets = self.pnl_engine.bucket_pnl(freq)
+            start = pd.Timestamp(start_timestamp, unit='ms', tz='UTC').floor(freq)
+            end = pd.Timestamp(end_timestamp, unit='ms', tz='UTC').floor(freq)
+            bucket = buckets.index.get_level_values('bucket')
+            return buckets[(bucket >= start) & (bucket <= end)]
+        except Exception as e:
+            logger.error(f"Error calculating bucketed PnL: {e}")
+            return None
+
     def print_portfolio_pnl(self):
         """
         Print the profit and loss for each coin in the portfolio and the total portfolio PnL.
@@ -663,92 +912,13 @@ class OKXTrader:
         logger.info("Calculating current portfolio PnL...")
         
         try:
-            # Get current balances
-            self.sync_account_info()
-            
-            # Get current market prices
-            portfolio_pnl = {}
-            total_portfolio_value = 0.0
-            total_cost_basis = 0.0
-            
-            # Calculate PnL for each coin with non-zero balance
-            for currency, balance in self.holdings.items():
-                if currency == 'USDT' or currency == 'USD' or currency == 'USDC' or currency == 'SGD' or float(balance) <= 0:
-                    continue
-                    
-                symbol = f"{currency}/USDT"
-                okx_symbol = f"{currency}-USDT"  # OKX format
-                
-                if symbol not in self.exchange.markets:
-                    continue
-                    
-                try:
-                    # Get current market price
-                    ticker = self.exchange.fetch_ticker(symbol)
-                    current_price = float(ticker['last'])
-                    
-                    # Get position cost basis (if available)
-                    cost_basis = 0.0
-                    
-                    # For OKX, we'll estimate cost basis from recent orders instead of positions
-                    try:
-                        # Use the unified CCXT API to get orders
-                        orders = self.exchange.fetch_my_trades(symbol, limit=100)
-                        buy_orders = [o for o in orders if o['side'] == 'buy']
-                        
-                        if buy_orders:
-                            # Calculate weighted average cost
-                            total_cost = sum(float(o['cost']) for o in buy_orders)
-                            total_amount = sum(float(o['amount']) for o in buy_orders)
-                            avg_price = total_cost / total_amount if total_amount > 0 else 0
-                            cost_basis = avg_price * float(balance)
-                        else:
-                            # If no buy orders found, use current price as estimate
-                            cost_basis = current_price * float(balance)
-                        
-                        logger.debug(f"Cost basis for {currency}: {cost_basis}")
-                    except Exception as e:
-                        logger.debug(f"Could not fetch trades for {currency}: {e}")
-                        # If we can't get cost basis, use current price as estimate
-                        cost_basis = current_price * float(balance)
-                    
-                    print(f"Cost basis for {currency}: {cost_basis}")
-                    # Calculate current value and unrealized PnL
-                    current_value = current_price * float(balance)
-                    unrealized_pnl = current_value - cost_basis
-                    pnl_percent = (unrealized_pnl / cost_basis * 100) if cost_basis > 0 else 0
-                    
-                    portfolio_pnl[currency] = {
-                        'balance': float(balance),
-                        'current_price': current_price,
-                        'cost_basis': cost_basis,
-                        'current_value': current_value,
-                        'unrealized_pnl': unrealized_pnl,
-                        'pnl_percent': pnl_percent
-                    }
-                    
-                    total_portfolio_value += current_value
-                    total_cost_basis += cost_basis
-                    
-                except Exception as e:
-                    logger.warning(f"Could not calculate PnL for {currency}: {e}")
-            
-            # Add USDT balance
-            usdt_balance = float(self.holdings.get('USDT', 0))
-            total_portfolio_value += usdt_balance
-            total_cost_basis += usdt_balance
-            
-            # Calculate total portfolio PnL
-            total_unrealized_pnl = total_portfolio_value - total_cost_basis
-            total_pnl_percent = (total_unrealized_pnl / total_cost_basis * 100) if total_cost_basis > 0 else 0
-            
-            portfolio_pnl['TOTAL'] = {
-                'usdt_balance': usdt_balance,
-                'portfolio_value': total_portfolio_value,
-                'cost_basis': total_cost_basis,
-                'unrealized_pnl': total_unrealized_pnl,
-                'pnl_percent': total_pnl_percent
-            }
+            # Balance, prices and fill history are fetched concurrently by the valuator
+            portfolio_pnl = self.portfolio.value()
+            if portfolio_pnl is None:
+                raise RuntimeError("portfolio valuation failed")
+            self.holdings = self.portfolio.holdings
+            self.balance = self.holdings.get('USDT', 0.0) or self.holdings.get('USD', 0.0)
+            usdt_balance = portfolio_pnl['TOTAL']['usdt_balance']
             
             # Print the results
             print("\n===== PORTFOLIO PNL SUMMARY =====")
@@ -782,9 +952,11 @@ class OKXTrader:
           - A timestamp indicating when the data was fetched.
         """
         try:
-            ticker_btc_usdt = self.exchange.fetch_ticker("BTC/USDT")
-            ticker_eth_usdt = self.exchange.fetch_ticker("ETH/USDT")
-            ticker_eth_btc = self.exchange.fetch_ticker("ETH/BTC")
+            # One bulk request so all three legs are sampled at the same moment
+            tickers = self.price_snapshot.get_tickers(self.TRIANGLE_SYMBOLS)
+            ticker_btc_usdt = tickers["BTC/USDT"]
+            ticker_eth_usdt = tickers["ETH/USDT"]
+            ticker_eth_btc = tickers["ETH/BTC"]
             
             data = {
                 "timestamp": datetime.now().isoformat(),
@@ -850,6 +1022,8 @@ class OKXTrader:
                 logger.error("Expected data to be a dictionary but got a different type.")
                 return None
 
+            started = time.perf_counter()
+
             # For live data, values might be dicts with a "last" key.
             def get_price(val):
                 return val.get("last") if isinstance(val, dict) else val
@@ -860,6 +1034,7 @@ class OKXTrader:
 
             if not (btc_usdt and eth_usdt and eth_btc):
                 logger.error("Missing one or more ticker prices in the fetched data.")
+                REGISTRY.inc("triangle_signals_total", outcome="missing_data")
                 return None
 
             cycle1 = eth_usdt / (btc_usdt * eth_btc)
@@ -876,16 +1051,161 @@ class OKXTrader:
                 "Cycle2_opportunity": cycle2 > (1 + threshold),
                 "threshold": threshold
             }
-            logger.info(f"Triangle arbitrage signal: {result}")
+            REGISTRY.observe("triangle_signal_seconds", time.perf_counter() - started)
+            REGISTRY.inc("triangle_signals_total", outcome="opportunity" if (result["Cycle1_opportunity"] or
+                                                                             result["Cycle2_opportunity"]) else "none")
+            log_event(logger, "triangle_signal", result)
             return result
         except Exception as e:
             logger.error(f"Error checking triangle arbitrage: {e}")
             return None
 
 
+    def fetch_triangle_order_books(self, depth=5):
+        """
+        Fetches the top 'depth' levels of the BTC/USDT, ETH/USDT and ETH/BTC order books.
+        Returns a dict symbol -> ccxt order book, or None on error.
+        """
+        try:
+            return {sym: self.exchange.fetch_order_book(sym, limit=depth) for sym in ["BTC/USDT", "ETH/USDT", "ETH/BTC"]}
+        except Exception as e:
+            logger.error(f"Error fetching triangle order books: {e}")
+            return None
+
+    def check_triangle_arbitrage_executable(self, notional, threshold=0.002, books=None, depth=5, fee=TAKER_FEE):
+        """
+        Checks for triangle arbitrage using executable prices: each leg crosses the spread,
+        walks the order book for the given USDT notional and pays the taker fee.
+        If 'books' is provided, it is used; otherwise live order books are fetched.
+
+        Returns a dictionary with executable cycle factors, opportunity flags and the
+        maximum profitable size (USDT) per cycle.
+        """
+        try:
+            if books is None:
+                books = self.fetch_triangle_order_books(depth)
+                if books is None:
+                    logger.error("No order book data available for executable arbitrage check.")
+                    return None
+            result = evaluate_books(books, notional, threshold=threshold, fee=fee)
+            log_event(logger, "executable_triangle_signal", result)
+            return result
+        except Exception as e:
+            logger.error(f"Error checking executable triangle arbitrage: {e}")
+            return None
+
+    def build_cycle_graph(self, currencies=None, max_length=3, max_cycles=200000, fee=TAKER_FEE):
+        """
+        Builds a CurrencyGraph of every active spot market (optionally restricted to 'currencies')
+        with all cycles up to max_length legs precomputed.
+        """
+        try:
+            markets = self.exchange.load_markets()
+            return CurrencyGraph.from_markets(markets, quote_currencies=currencies, max_length=max_length,
+                                              max_cycles=max_cycles, fee=fee)
+        except Exception as e:
+            logger.error(f"Error building cycle graph: {e}")
+            return None
+
+    def scan_cycle_arbitrage(self, graph, threshold=0.0, top=10):
+        """
+        Refreshes every market of the graph with one fetch_tickers call and returns the
+        'top' most profitable cycles (factor > 1 + threshold after fees).
+        """
+        try:
+            graph.update_from_tickers(self.exchange.fetch_tickers(graph.symbols))
+            opportunities = [graph.describe_cycle(cycle_id) for cycle_id in graph.profitable_cycles(threshold)[:top]]
+            logger.info(f"Cycle scan found {len(opportunities)} opportunities: {opportunities}")
+            return opportunities
+        except Exception as e:
+            logger.error(f"Error scanning cycle arbitrage: {e}")
+            return None
+
+    def scan_basis_opportunities(self, all_usdt_pairs=False, top=20, min_abs_carry=0.0):
+        """
+        Ranks spot-vs-futures basis and funding carry opportunities for COIN_LIST
+        (or every USDT spot pair) against their OKX perpetual swaps and dated futures.
+        Returns a DataFrame (see basis_scanner.compute_basis), or None on error.
+        """
+        try:
+            # Reuse the scanner (and its pair table) across calls with the same universe.
+            scanner = getattr(self, 'basis_scanner', None)
+            if scanner is None or (scanner.spot_symbols is None) != all_usdt_pairs:
+                self.basis_scanner = BasisScanner(self.exchange, all_usdt_pairs=all_usdt_pairs)
+            ranked = self.basis_scanner.scan(top=top, min_abs_carry=min_abs_carry)
+            logger.info(f"Basis scan ranked {len(ranked)} opportunities.")
+            return ranked
+        except Exception as e:
+            logger.error(f"Error scanning basis opportunities: {e}")
+            return None
+
      # ---------------------------
     # Historical Data Functions (Single Function for Entire Period)
     # ---------------------------
+    TRIANGLE_SYMBOLS = ["BTC/USDT", "ETH/USDT", "ETH/BTC"]
+
+    def _fetch_ohlcv_window(self, sym, since, end_timestamp, timeframe="1m", limit=100, bucket=None):
+        """
+        Pages through fetch_ohlcv for one symbol and returns every candle with
+        since <= timestamp < end_timestamp. If a TokenBucket is given, one token is
+        taken before each request. Requests are scheduled at backfill priority.
+        """
+        candles = []
+        while since < end_timestamp:
+            if bucket is not None:
+                bucket.acquire()
+            with self.scheduler.priority(PRIORITY_BACKFILL):
+                batch = self.exchange.fetch_ohlcv(sym, timeframe=timeframe, since=since, limit=limit)
+            if not batch:
+                break
+            for candle in batch:
+                if candle[0] >= end_timestamp:
+                    break
+                candles.append(candle)
+            since = batch[-1][0] + 1
+            if len(batch) < limit:
+                break
+        return candles
+
+    def _merge_triangle_window(self, candles_by_symbol):
+        """
+        Maps each symbol's candles to close prices and merges them on the timestamps
+        common to all three symbols. Returns the merged records sorted by timestamp.
+        """
+        symbols = self.TRIANGLE_SYMBOLS
+        data_by_symbol = {}
+        for sym in symbols:
+            # Map each candle's timestamp to its close price.
+            data_by_symbol[sym] = {datetime.utcfromtimestamp(candle[0]/1000).isoformat() + "Z": candle[4]
+                                   for candle in candles_by_symbol[sym]}
+        # Find common timestamps across all symbols.
+        common_ts = set(data_by_symbol[symbols[0]].keys())
+        for sym in symbols[1:]:
+            common_ts = common_ts.intersection(set(data_by_symbol[sym].keys()))
+        # For each common timestamp, merge the data.
+        records = []
+        for ts in sorted(common_ts):
+            record = {"timestamp": ts}
+            for sym in symbols:
+                record[sym] = data_by_symbol[sym][ts]
+            records.append(record)
+        return records
+
+    def _triangle_windows(self, start_dt, end_dt, chunk_minutes):
+        """
+        Splits [start_dt, end_dt) into chunk_minutes windows, returned as (since, end_timestamp) in ms.
+        """
+        windows = []
+        current_start = start_dt
+        while current_start < end_dt:
+            current_end = current_start + timedelta(minutes=chunk_minutes)
+            if current_end > end_dt:
+                current_end = end_dt
+            windows.append((self.exchange.parse8601(current_start.isoformat() + "Z"),
+                            self.exchange.parse8601(current_end.isoformat() + "Z")))
+            current_start = current_end
+        return windows
+
     def fetch_all_historical_triangle_data_incremental(self, start_dt, end_dt, timeframe="1m", limit=100, chunk_minutes=100, filename="triangle_market_data_historical.json"):
         """
         Incrementally fetches historical triangle data for BTC/USDT, ETH/USDT, and ETH/BTC from start_dt until end_dt.
@@ -905,65 +1225,213 @@ class OKXTrader:
             None. Data is written to the specified JSON file.
         """
         try:
-            symbols = ["BTC/USDT", "ETH/USDT", "ETH/BTC"]
+            started = time.perf_counter()
             # Open file and write the opening bracket for a JSON array.
             with open(filename, 'w') as f:
                 f.write("[\n")
                 first_record = True  # For proper comma handling.
-                current_start = start_dt
-                while current_start < end_dt:
-                    current_end = current_start + timedelta(minutes=chunk_minutes)
-                    if current_end > end_dt:
-                        current_end = end_dt
-                    logger.info(f"Fetching data from {current_start.isoformat()} to {current_end.isoformat()}")
+                for since, end_timestamp in self._triangle_windows(start_dt, end_dt, chunk_minutes):
+                    logger.info(f"Fetching data from {datetime.utcfromtimestamp(since/1000).isoformat()} "
+                                f"to {datetime.utcfromtimestamp(end_timestamp/1000).isoformat()}")
                     # For each symbol, fetch candles within this window.
-                    data_by_symbol = {}
-                    for sym in symbols:
-                        candles = []
-                        since = self.exchange.parse8601(current_start.isoformat() + "Z")
-                        end_timestamp = self.exchange.parse8601(current_end.isoformat() + "Z")
-                        while since < end_timestamp:
-                            batch = self.exchange.fetch_ohlcv(sym, timeframe=timeframe, since=since, limit=limit)
-                            if not batch:
-                                break
-                            for candle in batch:
-                                if candle[0] >= end_timestamp:
-                                    break
-                                candles.append(candle)
-                            since = batch[-1][0] + 1
-                            if len(batch) < limit:
-                                break
-                        # Map each candle's timestamp to its close price.
-                        rec_dict = {datetime.utcfromtimestamp(candle[0]/1000).isoformat() + "Z": candle[4] for candle in candles}
-                        data_by_symbol[sym] = rec_dict
-                        logger.info(f"Fetched {len(rec_dict)} candles for {sym} in this window.")
-                    # Find common timestamps across all symbols.
-                    common_ts = set(data_by_symbol[symbols[0]].keys())
-                    for sym in symbols[1:]:
-                        common_ts = common_ts.intersection(set(data_by_symbol[sym].keys()))
-                    common_ts = sorted(common_ts)
-                    # For each common timestamp, merge the data.
-                    for ts in common_ts:
-                        record = {"timestamp": ts}
-                        for sym in symbols:
-                            record[sym] = data_by_symbol[sym][ts]
+                    candles_by_symbol = {}
+                    for sym in self.TRIANGLE_SYMBOLS:
+                        candles_by_symbol[sym] = self._fetch_ohlcv_window(sym, since, end_timestamp, timeframe, limit)
+                        logger.info(f"Fetched {len(candles_by_symbol[sym])} candles for {sym} in this window.")
+                    for record in self._merge_triangle_window(candles_by_symbol):
                         # Write record as a JSON object. If it's not the first record, prepend a comma.
                         if not first_record:
                             f.write(",\n")
                         else:
                             first_record = False
                         json.dump(record, f, indent=4)
-                    current_start = current_end
                 # Close the JSON array.
                 f.write("\n]")
-            logger.info(f"All historical triangle data has been saved to {filename}.")
+            logger.info(f"All historical triangle data has been saved to {filename} "
+                        f"in {time.perf_counter() - started:.2f}s.")
         except Exception as e:
             logger.error(f"Error fetching all historical triangle data incrementally: {e}")
 
+    def fetch_all_historical_triangle_data_concurrent(self, start_dt, end_dt, timeframe="1m", limit=100, chunk_minutes=100,
+                                                      filename="triangle_market_data_historical.json", max_workers=8,
+                                                      requests_per_second=10.0):
+        """
+        Concurrent variant of fetch_all_historical_triangle_data_incremental.
+
+        Every (symbol, time window) pair is downloaded by a bounded thread pool, while a shared
+        token bucket caps the overall request rate at 'requests_per_second' across all threads.
+        Windows are merged and written in chronological order, so the output file is identical
+        to the sequential version's.
+
+        Parameters:
+            start_dt, end_dt, timeframe, limit, chunk_minutes, filename: As in
+                fetch_all_historical_triangle_data_incremental.
+            max_workers (int): Maximum number of concurrent requests (default 8).
+            requests_per_second (float): Overall request budget (default 10, OKX's history-candles limit).
+
+        Returns:
+            int: Number of merged records written, or None on error.
+        """
+        try:
+            started = time.perf_counter()
+            windows = self._triangle_windows(start_dt, end_dt, chunk_minutes)
+            bucket = TokenBucket(requests_per_second)
+            record_count = 0
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [{sym: executor.submit(self._fetch_ohlcv_window, sym, since, end_timestamp,
+                                                 timeframe, limit, bucket)
+                            for sym in self.TRIANGLE_SYMBOLS}
+                           for since, end_timestamp in windows]
+                with open(filename, 'w') as f:
+                    f.write("[\n")
+                    first_record = True
+                    for window_futures in futures:
+                        candles_by_symbol = {sym: fut.result() for sym, fut in window_futures.items()}
+                        for record in self._merge_triangle_window(candles_by_symbol):
+                            if not first_record:
+                                f.write(",\n")
+                            else:
+                                first_record = False
+                            json.dump(record, f, indent=4)
+                            record_count += 1
+                    f.write("\n]")
+            logger.info(f"Concurrently saved {record_count} triangle records from {len(windows)} windows to {filename} "
+                        f"in {time.perf_counter() - started:.2f}s.")
+            return record_count
+        except Exception as e:
+            logger.error(f"Error fetching historical triangle data concurrently: {e}")
+            return None
+
+    @staticmethod
+    def _closed_until(timeframe):
+        """
+        Open time (ms) of the candle still forming: candles before it are final, so only ranges up to
+        here may be marked covered (later windows are empty or partial and must be fetched again).
+        """
+        step = timeframe_ms(timeframe)
+        return int(time.time() * 1000) // step * step
+
+    def backfill_triangle_history(self, store, start_dt, end_dt, timeframe="1m", limit=100, chunk_minutes=100,
+                                  max_workers=8, requests_per_second=10.0):
+        """
+        Fills a TriangleHistoryStore for [start_dt, end_dt), fetching only the ranges its index
+        reports as missing. Windows are downloaded concurrently (as in
+        fetch_all_historical_triangle_data_concurrent) and committed to the store in order,
+        so an interrupted backfill resumes where it stopped. Only closed candles are stored and
+        marked covered, so a period reaching into the present is completed by the next backfill.
+
+        Parameters:
+            store (TriangleHistoryStore): Destination store.
+            start_dt, end_dt (datetime): Period to cover (UTC).
+            timeframe, limit, chunk_minutes, max_workers, requests_per_second: As in
+                fetch_all_historical_triangle_data_concurrent.
+
+        Returns:
+            int: Number of merged records added, or None on error.
+        """
+        try:
+            started = time.perf_counter()
+            start_ms = self.exchange.parse8601(start_dt.isoformat() + "Z")
+            end_ms = self.exchange.parse8601(end_dt.isoformat() + "Z")
+            windows = []
+            for gap_start, gap_end in store.missing_ranges(start_ms, end_ms):
+                for since in range(gap_start, gap_end, chunk_minutes * 60_000):
+                    windows.append((since, min(since + chunk_minutes * 60_000, gap_end)))
+            if not windows:
+                logger.info("Triangle history store already covers the requested period.")
+                return 0
+
+            bucket = TokenBucket(requests_per_second)
+            closed_until = self._closed_until(timeframe)
+            record_count = 0
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [{sym: executor.submit(self._fetch_ohlcv_window, sym, since, end_timestamp,
+                                                 timeframe, limit, bucket)
+                            for sym in self.TRIANGLE_SYMBOLS}
+                           for since, end_timestamp in windows]
+                for (since, end_timestamp), window_futures in zip(windows, futures):
+                    candles_by_symbol = {sym: [c for c in fut.result() if c[0] < closed_until]
+                                         for sym, fut in window_futures.items()}
+                    records = self._merge_triangle_window(candles_by_symbol)
+                    covered_end = min(end_timestamp, closed_until)
+                    store.append_records(records, covered=(since, covered_end) if covered_end > since else None)
+                    record_count += len(records)
+            logger.info(f"Backfilled {record_count} triangle records in {len(windows)} windows "
+                        f"in {time.perf_counter() - started:.2f}s.")
+            return record_count
+        except Exception as e:
+            logger.error(f"Error backfilling triangle history: {e}")
+            return None
+
+    def backfill_ohlcv(self, lake, symbols, start_dt, end_dt, timeframe="1m", limit=100, max_workers=8,
+                       requests_per_second=10.0, commit_candles=50000):
+        """
+        Downloads full OHLCV candles of any symbols into an OHLCVLake for [start_dt, end_dt), fetching
+        only the ranges its index reports as missing. Each window is one fetch_ohlcv page ('limit'
+        candles); windows are downloaded concurrently and each symbol's windows are committed in order,
+        in batches of about 'commit_candles' (a commit rewrites a compressed month partition), so an
+        interrupted backfill resumes after the last committed batch. As in backfill_triangle_history, only
+        closed candles are stored and marked covered. Higher timeframes can then be derived locally
+        (OHLCVLake.read / materialize) instead of being downloaded again.
+
+        Parameters:
+            lake (OHLCVLake): Destination lake.
+            symbols (list): Symbols to backfill, e.g. ["BTC/USDT", "SOL/USDT"].
+            start_dt, end_dt (datetime): Period to cover (UTC).
+            timeframe (str): Timeframe to download (default "1m").
+            limit, max_workers, requests_per_second: As in fetch_all_historical_triangle_data_concurrent.
+            commit_candles (int): Candles buffered per symbol before they are written.
+
+        Returns:
+            int: Number of candles stored, or None on error.
+        """
+        try:
+            started = time.perf_counter()
+            start_ms = self.exchange.parse8601(start_dt.isoformat() + "Z")
+            end_ms = self.exchange.parse8601(end_dt.isoformat() + "Z")
+            window_ms = timeframe_ms(timeframe) * limit
+            windows = [(sym, since, min(since + window_ms, gap_end))
+                       for sym in symbols
+                       for gap_start, gap_end in lake.missing_ranges(sym, timeframe, start_ms, end_ms)
+                       for since in range(gap_start, gap_end, window_ms)]
+            if not windows:
+                logger.info("OHLCV lake already covers the requested period.")
+                return 0
+
+            bucket = TokenBucket(requests_per_second)
+            closed_until = self._closed_until(timeframe)
+            candle_count = 0
+            pending = {sym: ([], []) for sym in symbols}
+
+            def commit(sym):
+                candles, covered = pending[sym]
+                pending[sym] = ([], [])
+                return lake.append(sym, timeframe, candles, covered=covered) if covered else 0
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(self._fetch_ohlcv_window, sym, since, end_timestamp, timeframe, limit,
+                                           bucket)
+                           for sym, since, end_timestamp in windows]
+                for (sym, since, end_timestamp), future in zip(windows, futures):
+                    candles, covered = pending[sym]
+                    candles.extend(c for c in future.result() if c[0] < closed_until)
+                    if min(end_timestamp, closed_until) > since:
+                        covered.append((since, min(end_timestamp, closed_until)))
+                    if len(candles) >= commit_candles:
+                        candle_count += commit(sym)
+            for sym in symbols:
+                candle_count += commit(sym)
+            logger.info(f"Backfilled {candle_count} {timeframe} candles of {len(symbols)} symbols in "
+                        f"{len(windows)} windows in {time.perf_counter() - started:.2f}s.")
+            return candle_count
+        except Exception as e:
+            logger.error(f"Error backfilling OHLCV lake: {e}")
+            return None
+
     # ---------------------------
     # Backtesting Function
     # ---------------------------
-    def backtest_triangle_arbitrage_minute(self, historical_data, trade_fraction=0.1, threshold=0.002):
+    def backtest_triangle_arbitrage_minute(self, historical_data, trade_fraction=0.1, threshold=0.002, log_records=False):
         """
         Backtests triangle arbitrage using historical minute data.
         
@@ -972,6 +1440,8 @@ class OKXTrader:
                 "timestamp", "BTC/USDT", "ETH/USDT", "ETH/BTC" (values are the close prices).
             trade_fraction (float): Fraction of the portfolio to use per trade (default 0.1).
             threshold (float): Minimum arbitrage excess over 1 required to trigger a trade (default 0.002, or 0.2%).
+            log_records (bool): Log every signal and record as sampled JSON events; by default the loop
+                runs in backtest logging mode and only the result is logged.
         
         Simulation:
             - Start with an initial portfolio (e.g., 10,000 USDT).
@@ -998,34 +1468,36 @@ class OKXTrader:
             current_portfolio = initial_portfolio
             portfolio_history = [current_portfolio]
             trade_returns = []
-
-            for i, record in enumerate(historical_data):
-                arb_signal = self.check_triangle_arbitrage(threshold=threshold, data=record)
-                if arb_signal is None:
-                    logger.warning(f"Record {i}: No arbitrage signal (data issue).")
-                    trade_returns.append(0)
+            # Per-record events are dropped before any formatting unless explicitly requested
+            with contextlib.nullcontext() if log_records else backtest_mode():
+                for i, record in enumerate(historical_data):
+                    arb_signal = self.check_triangle_arbitrage(threshold=threshold, data=record)
+                    if arb_signal is None:
+                        logger.warning(f"Record {i}: No arbitrage signal (data issue).")
+                        trade_returns.append(0)
+                        portfolio_history.append(current_portfolio)
+                        continue
+
+                    cycle1 = arb_signal.get("Cycle1_factor", 0)
+                    cycle2 = arb_signal.get("Cycle2_factor", 0)
+                    opp1 = arb_signal.get("Cycle1_opportunity", False)
+                    opp2 = arb_signal.get("Cycle2_opportunity", False)
+
+                    if opp1 or opp2:
+                        selected_factor = max(cycle1 if opp1 else 0, cycle2 if opp2 else 0)
+                        profit_pct = selected_factor - 1.0
+                        trade_profit = current_portfolio * trade_fraction * profit_pct
+                        current_portfolio += trade_profit
+                        risked = current_portfolio - trade_profit if (current_portfolio - trade_profit) != 0 else 1
+                        trade_return = trade_profit / risked
+                        log_event(logger, "backtest_trade", {"record": i, "factor": selected_factor,
+                                                             "profit_pct": profit_pct, "portfolio": current_portfolio})
+                    else:
+                        trade_return = 0
+                        log_event(logger, "backtest_no_opportunity", {"record": i})
+                    
+                    trade_returns.append(trade_return)
                     portfolio_history.append(current_portfolio)
-                    continue
-
-                cycle1 = arb_signal.get("Cycle1_factor", 0)
-                cycle2 = arb_signal.get("Cycle2_factor", 0)
-                opp1 = arb_signal.get("Cycle1_opportunity", False)
-                opp2 = arb_signal.get("Cycle2_opportunity", False)
-
-                if opp1 or opp2:
-                    selected_factor = max(cycle1 if opp1 else 0, cycle2 if opp2 else 0)
-                    profit_pct = selected_factor - 1.0
-                    trade_profit = current_portfolio * trade_fraction * profit_pct
-                    current_portfolio += trade_profit
-                    risked = current_portfolio - trade_profit if (current_portfolio - trade_profit) != 0 else 1
-                    trade_return = trade_profit / risked
-                    logger.info(f"Record {i}: Trade executed (factor: {selected_factor:.4f}, profit_pct: {profit_pct:.4f}), new portfolio: {current_portfolio:.2f}")
-                else:
-                    trade_return = 0
-                    logger.info(f"Record {i}: No arbitrage opportunity detected.")
-                
-                trade_returns.append(trade_return)
-                portfolio_history.append(current_portfolio)
 
             cumulative_return = (current_portfolio / initial_portfolio) - 1
             avg_return = sum(trade_returns) / len(trade_returns) if trade_returns else 0
@@ -1054,6 +1526,106 @@ class OKXTrader:
             logger.error(f"Error during backtesting: {e}")
             return None
 
+    def backtest_triangle_arbitrage_vectorized(self, historical_data, trade_fraction=0.1, threshold=0.002):
+        """
+        Columnar version of backtest_triangle_arbitrage_minute.
+
+        Parameters:
+            historical_data: A pandas DataFrame or a mapping of column name to array with
+                "BTC/USDT", "ETH/USDT" and "ETH/BTC" close prices (the list of records used by
+                backtest_triangle_arbitrage_minute is accepted as well).
+            trade_fraction (float): Fraction of the portfolio to use per trade (default 0.1).
+            threshold (float): Minimum arbitrage excess over 1 required to trigger a trade (default 0.002).
+
+        Returns:
+            dict: Same statistics as backtest_triangle_arbitrage_minute (equal up to floating-point
+            rounding), with portfolio_history as a NumPy array and an extra "trade_count".
+            No per-record logging is done.
+        """
+        try:
+            if historical_data is None or len(historical_data) == 0:
+                logger.error("No historical data provided for backtesting.")
+                return None
+
+            btc_usdt, eth_usdt, eth_btc = to_price_arrays(historical_data)
+            result = run_vectorized_backtest(btc_usdt, eth_usdt, eth_btc,
+                                             trade_fraction=trade_fraction, threshold=threshold)
+            logger.info(f"Vectorized backtest over {len(btc_usdt)} records: "
+                        f"cumulative_return={result['cumulative_return']}, sharpe_ratio={result['sharpe_ratio']}, "
+                        f"max_drawdown={result['max_drawdown']}, trades={result['trade_count']}")
+            return result
+        except Exception as e:
+            logger.error(f"Error during vectorized backtesting: {e}")
+            return None
+
+    def backtest_triangle_arbitrage_streaming(self, batches, trade_fraction=0.1, threshold=0.002, equity_every=None):
+        """
+        Streaming version of backtest_triangle_arbitrage_minute for histories larger than RAM.
+
+        Parameters:
+            batches (iterable): Record batches (DataFrames, column mappings or lists of records),
+                e.g. TriangleHistoryStore.iter_partitions().
+            trade_fraction (float): Fraction of the portfolio to use per trade (default 0.1).
+            threshold (float): Minimum arbitrage excess over 1 required to trigger a trade (default 0.002).
+            equity_every (int): Keep every n-th portfolio value in portfolio_history (default None: no curve).
+
+        Returns:
+            dict: Same statistics as backtest_triangle_arbitrage_minute, computed in constant memory.
+        """
+        try:
+            result = run_streaming_backtest(batches, trade_fraction=trade_fraction, threshold=threshold,
+                                            equity_every=equity_every)
+            if result["record_count"] == 0:
+                logger.error("No historical data provided for backtesting.")
+                return None
+            logger.info(f"Streaming backtest over {result['record_count']} records: "
+                        f"cumulative_return={result['cumulative_return']}, sharpe_ratio={result['sharpe_ratio']}, "
+                        f"max_drawdown={result['max_drawdown']}, trades={result['trade_count']}")
+            return result
+        except Exception as e:
+            logger.error(f"Error during streaming backtesting: {e}")
+            return None
+
+    def backtest_triangle_arbitrage_ticks(self, ticks, **kwargs):
+        """
+        Event-driven tick-level backtest with signal/order latency, queue position and slippage.
+
+        Parameters:
+            ticks: fake_exchange.TickStream of BTC/USDT, ETH/USDT and ETH/BTC quotes
+                (recorded with TickStream.save / load, or fake_exchange.synthetic_ticks).
+            kwargs: event_backtester.EventBacktester options (notional, threshold, signal_latency,
+                order_latency, jitter, leg_mode, sequential, maker_timeout, ...).
+
+        Returns:
+            dict: 'trades' (DataFrame, one row per cycle with realized and at-signal PnL) and summary
+            statistics (trade_count, total_pnl, expected_pnl, hit_rate, ...), or None on error.
+        """
+        try:
+            if ticks is None or len(ticks) == 0:
+                logger.error("No tick data provided for backtesting.")
+                return None
+            return EventBacktester(ticks, **kwargs).run()
+        except Exception as e:
+            logger.error(f"Error during event-driven backtesting: {e}")
+            return None
+
+    def backtest_triangle_latency_sweep(self, ticks, latencies=(0.0, 0.005, 0.01, 0.05, 0.1, 0.5), **kwargs):
+        """
+        Reruns backtest_triangle_arbitrage_ticks once per order latency (seconds).
+
+        Returns:
+            DataFrame: PnL, trade count, hit rate and capture (realized / at-signal PnL) indexed by
+            end-to-end latency, or None on error.
+        """
+        try:
+            if ticks is None or len(ticks) == 0:
+                logger.error("No tick data provided for backtesting.")
+                return None
+            return latency_sweep(ticks, latencies, **kwargs)
+        except Exception as e:
+            logger.error(f"Error during latency sweep: {e}")
+            return None
+
 def main():
     """
     Main function to fetch essential account details and orders.
@@ -1110,18 +1682,24 @@ def main():
     #     filename="triangle_market_data_historical.json"
     # )
     
-    # Load the stored data from JSON for backtesting.
+    # Or keep a resumable columnar store up to date (only missing ranges are fetched):
+    # store = TriangleHistoryStore("triangle_history")
+    # trader.backfill_triangle_history(store, start_dt=start_dt, end_dt=end_dt)
+
+    # Load the stored data for backtesting, preferring the columnar store over the JSON file.
     try:
-        historical_data = pd.read_json("triangle_market_data_historical.json", orient="records")
-        historical_data = historical_data.to_dict(orient="records")
+        if os.path.exists(os.path.join("triangle_history", "index.json")):
+            historical_data = pd.DataFrame(TriangleHistoryStore("triangle_history").load())
+        else:
+            historical_data = pd.read_json("triangle_market_data_historical.json", orient="records")
         print("Historical Triangle Market Data (first 5 records):")
-        print(pd.DataFrame(historical_data).head())
+        print(historical_data.head())
     except Exception as e:
         logger.error(f"Error reading historical triangle data from JSON: {e}")
         return
 
     # Run backtest using the fetched historical data.
-    backtest_result = trader.backtest_triangle_arbitrage_minute(
+    backtest_result = trader.backtest_triangle_arbitrage_vectorized(
         historical_data=historical_data,
         trade_fraction=0.1,
         threshold=0.002
@@ -0,0 +1,349 @@
+"""
+order_history.py
+
+Local SQLite cache of closed orders and fills.
+
+The full OKX order history (the 3-month archive endpoint) is paged through
+once, newest first, as OKX serves it. After that, each sync only asks for orders from shortly before the
+stored cursor, which is the newest update time (uTime) already seen. OKX
+filters closed orders on creation time, so the overlap is what brings in a
+resting order that was created before the cursor and closed after it. Fills
+never change once made and use their own timestamp as the cursor.
+
+Rows are indexed by timestamp and by (symbol, timestamp), so date-range
+queries and per-coin PnL aggregates are answered locally without touching the
+API. Full ccxt order dicts are kept as JSON next to the numeric columns, so
+queries can return the same structures the exchange would.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+# ccxt okx fetch_closed_orders endpoints: last 7 days, last 3 months
+RECENT_ORDERS_METHOD = 'privateGetTradeOrdersHistory'
+ARCHIVE_ORDERS_METHOD = 'privateGetTradeOrdersHistoryArchive'
+RECENT_ORDERS_WINDOW_MS = 7 * 86_400_000
+# Re-requested span before the orders cursor; covers orders resting up to this long before they close
+DEFAULT_ORDER_OVERLAP_MS = 86_400_000
+# How far back the archive order and fill endpoints reach, and their maximum page size
+HISTORY_WINDOW_MS = 90 * 86_400_000
+OKX_PAGE_LIMIT = 100
+
+# Bumped whenever SCHEMA changes; stored in PRAGMA user_version and upgraded by _migrate().
+# 1: initial orders/trades/sync_state tables, 2: fee_currency columns.
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    symbol TEXT,
+    side TEXT,
+    status TEXT,
+    timestamp INTEGER,
+    price REAL,
+    average REAL,
+    amount REAL,
+    filled REAL,
+    cost REAL,
+    fee REAL,
+    fee_currency TEXT,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_timestamp ON orders (timestamp);
+CREATE INDEX IF NOT EXISTS orders_symbol_timestamp ON orders (symbol, timestamp);
+CREATE TABLE IF NOT EXISTS trades (
+    id TEXT,
+    symbol TEXT,
+    order_id TEXT,
+    side TEXT,
+    timestamp INTEGER,
+    price REAL,
+    amount REAL,
+    cost REAL,
+    fee REAL,
+    fee_currency TEXT,
+    raw TEXT,
+    PRIMARY KEY (symbol, id)
+);
+CREATE INDEX IF NOT EXISTS trades_symbol_timestamp ON trades (symbol, timestamp);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    cursor INTEGER,
+    synced_at REAL
+);
+"""
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _fee_cost(item):
+    return float((item.get('fee') or {}).get('cost') or 0.0)
+
+
+def _fee_currency(item):
+    return (item.get('fee') or {}).get('currency')
+
+
+class OrderHistoryStore:
+    """
+    SQLite-backed order and fill history with incremental, cursor-based sync.
+    """
+
+    def __init__(self, path: str = "order_history.db"):
+        """
+        :param path: SQLite database file (":memory:" for a process-local cache).
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.connection.close()
+
+    def _migrate(self):
+        """
+        Upgrades a database written by an older version of this module to SCHEMA_VERSION.
+        CREATE TABLE IF NOT EXISTS leaves existing tables alone, so new columns are added here.
+        """
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with self.connection:
+            for table in ("orders", "trades"):
+                columns = {row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+                if "fee_currency" not in columns:
+                    self.connection.execute(f"ALTER TABLE {table} ADD COLUMN fee_currency TEXT")
+                    self.connection.execute(
+                        f"UPDATE {table} SET fee_currency = json_extract(raw, '$.fee.currency')")
+                    logger.info(f"Order history: added fee_currency to {table} in {self.path}.")
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    # ---------------------------
+    # Cursor bookkeeping
+    # ---------------------------
+    def _state(self, key):
+        row = self.connection.execute("SELECT cursor, synced_at FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row if row else (None, None)
+
+    def _set_state(self, key, cursor):
+        self.connection.execute(
+            "INSERT INTO sync_state (key, cursor, synced_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET cursor = excluded.cursor, synced_at = excluded.synced_at",
+            (key, cursor, time.time()))
+
+    def cursor(self, key: str = "orders"):
+        """
+        Newest update time (ms) already stored for 'orders', newest fill timestamp for 'trades:<symbol>', or None.
+        """
+        with self.lock:
+            return self._state(key)[0]
+
+    def synced_at(self, key: str = "orders"):
+        """
+        Wall-clock time of the last sync of 'key', or None.
+        """
+        with self.lock:
+            return self._state(key)[1]
+
+    # ---------------------------
+    # Sync
+    # ---------------------------
+    def _start(self, key, since, overlap):
+        """
+        Oldest creation time (ms) a sync of 'key' asks for: 'since', else 'overlap' before the cursor,
+        else the start of what OKX still serves.
+        """
+        if since is not None:
+            return int(since)
+        with self.lock:
+            cursor, _ = self._state(key)
+        if cursor is None:
+            return int(time.time() * 1000) - HISTORY_WINDOW_MS
+        return max(0, cursor - overlap)
+
+    def _page(self, fetch, key, since, limit, max_pages, store, stamp=None):
+        """
+        Pages backwards from now down to 'since', the way OKX serves history: each response holds the
+        newest 'limit' records created in [since, until], and the next request ends at the oldest of
+        them (inclusive, so records sharing the boundary millisecond are kept; duplicates collapse on
+        the primary key). The cursor only moves once the walk reaches 'since', so an interrupted sync
+        is repeated instead of leaving a gap below the records it did store.
+
+        :param fetch: Callable (since, until, limit) -> list of ccxt dicts; until=None means now.
+        :param stamp: Cursor value of an item (default: its 'timestamp'); paging itself always
+                      moves on 'timestamp', which is what the exchange filters on.
+        """
+        stamp = stamp or (lambda item: item['timestamp'])
+        with self.lock:
+            cursor, _ = self._state(key)
+        until = None
+        total = 0
+        previous = set()
+        for _ in range(max_pages):
+            batch = fetch(since, until, limit)
+            # Records of the boundary millisecond come back on the next page too.
+            fresh = [item for item in batch if item['id'] not in previous]
+            if fresh:
+                with self.lock, self.connection:
+                    store(fresh)
+                cursor = max(cursor or 0, max(stamp(item) for item in fresh))
+                total += len(fresh)
+            previous = {item['id'] for item in batch}
+            if len(batch) < limit:
+                break
+            oldest = min(item['timestamp'] for item in batch)
+            # A full page within one millisecond cannot be split further; step past it.
+            until = oldest if until is None or oldest < until else until - 1
+        else:
+            logger.warning(f"Order history sync of {key} stopped after {max_pages} pages; cursor left unchanged.")
+            return total
+        with self.lock, self.connection:
+            self._set_state(key, cursor)
+        return total
+
+    def sync_orders(self, exchange, since=None, limit=100, max_pages=10000, overlap=DEFAULT_ORDER_OVERLAP_MS):
+        """
+        Downloads closed orders updated since the cursor (the last 3 months on first run).
+
+        Syncs starting further back than the 7-day endpoint reaches (including the first one) go
+        through the 3-month archive endpoint.
+
+        :param exchange: ccxt exchange (pages are requested explicitly with since / until).
+        :param since: Override of the starting creation timestamp (ms).
+        :param limit: Page size (OKX serves at most 100).
+        :param overlap: Milliseconds re-requested before the cursor (see the module docstring).
+        :return: Number of orders received.
+        """
+        start = self._start("orders", since, overlap)
+        recent = start >= time.time() * 1000 - RECENT_ORDERS_WINDOW_MS
+        method = RECENT_ORDERS_METHOD if recent else ARCHIVE_ORDERS_METHOD
+
+        def fetch(begin, until, page_limit):
+            params = {'method': method}
+            if until is not None:
+                params['until'] = until
+            return exchange.fetch_closed_orders(symbol=None, since=begin, limit=page_limit, params=params)
+        count = self._page(fetch, "orders", start, min(limit, OKX_PAGE_LIMIT), max_pages, self._store_orders,
+                           stamp=lambda o: o.get('lastUpdateTimestamp') or o['timestamp'])
+        logger.info(f"Order history sync received {count} orders (cursor={self.cursor()}).")
+        return count
+
+    def sync_trades(self, exchange, symbol, since=None, limit=100, max_pages=10000):
+        """
+        Downloads fills of one symbol newer than its cursor (the last 3 months on first run).
+
+        :return: Number of fills received.
+        """
+        start = self._start(f"trades:{symbol}", since, 0)
+
+        def fetch(begin, until, page_limit):
+            params = {} if until is None else {'until': until}
+            return exchange.fetch_my_trades(symbol, since=begin, limit=page_limit, params=params)
+        return self._page(fetch, f"trades:{symbol}", start, min(limit, OKX_PAGE_LIMIT), max_pages,
+                          self._store_trades)
+
+    def _store_orders(self, orders):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO orders (id, symbol, side, status, timestamp, price, average, amount, filled, "
+            "cost, fee, fee_currency, raw) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(o['id']), o.get('symbol'), o.get('side'), o.get('status'), o.get('timestamp'),
+              _float(o.get('price')), _float(o.get('average')), _float(o.get('amount')), _float(o.get('filled')),
+              _float(o.get('cost')), _fee_cost(o), _fee_currency(o), json.dumps(o, default=str)) for o in orders])
+
+    def _store_trades(self, trades):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO trades (id, symbol, order_id, side, timestamp, price, amount, cost, fee, "
+            "fee_currency, raw) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(t['id']), t.get('symbol'), t.get('order'), t.get('side'), t.get('timestamp'),
+              _float(t.get('price')), _float(t.get('amount')), _float(t.get('cost')), _fee_cost(t),
+              _fee_currency(t), json.dumps(t, default=str)) for t in trades])
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+    @staticmethod
+    def _where(start_ms, end_ms, symbol, side):
+        clauses, params = [], []
+        if symbol is not None:
+            clauses.append("symbol = ?")
+            params.append(symbol)
+        if side is not None:
+            clauses.append("side = ?")
+            params.append(side)
+        if start_ms is not None:
+            clauses.append("timestamp >= ?")
+            params.append(int(start_ms))
+        if end_ms is not None:
+            clauses.append("timestamp <= ?")
+            params.append(int(end_ms))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def orders(self, start_ms=None, end_ms=None, symbol=None, side=None):
+        """
+        Returns the stored ccxt order dicts in [start_ms, end_ms], oldest first.
+        """
+        where, params = self._where(start_ms, end_ms, symbol, side)
+        with self.lock:
+            rows = self.connection.execute(f"SELECT raw FROM orders{where} ORDER BY timestamp, id", params).fetchall()
+        return [json.loads(raw) for (raw,) in rows]
+
+    def orders_frame(self, start_ms=None, end_ms=None, symbol=None, side=None):
+        """
+        Returns the numeric order columns in [start_ms, end_ms] as a DataFrame (no JSON decoding).
+        """
+        where, params = self._where(start_ms, end_ms, symbol, side)
+        with self.lock:
+            return pd.read_sql_query(
+                f"SELECT id, symbol, side, status, timestamp, price, average, amount, filled, cost, fee, fee_currency "
+                f"FROM orders{where} ORDER BY timestamp, id", self.connection, params=params)
+
+    def orders_written_after(self, rowid: int = 0):
+        """
+        Returns the numeric order columns of the rows written after SQLite rowid 'rowid', oldest
+        first, and the newest rowid, so a consumer can pick up only what later syncs stored. Orders
+        stored again (the cursor overlap) are rewritten under a new rowid; consumers dedupe on id.
+
+        :return: (DataFrame, newest rowid).
+        """
+        with self.lock:
+            frame = pd.read_sql_query(
+                "SELECT rowid AS row, id, symbol, side, status, timestamp, price, average, amount, filled, cost, "
+                "fee, fee_currency FROM orders WHERE rowid > ? ORDER BY timestamp, id", self.connection,
+                params=(int(rowid),))
+        newest = int(frame['row'].max()) if len(frame) else int(rowid)
+        return frame.drop(columns='row'), newest
+
+    def trades_frame(self, symbol=None, start_ms=None, end_ms=None):
+        """
+        Returns stored fills as a DataFrame, oldest first.
+        """
+        where, params = self._where(start_ms, end_ms, symbol, None)
+        with self.lock:
+            return pd.read_sql_query(
+                f"SELECT id, symbol, order_id, side, timestamp, price, amount, cost, fee, fee_currency "
+                f"FROM trades{where} ORDER BY timestamp, id", self.connection, params=params)
+
+    def side_totals(self, start_ms=None, end_ms=None):
+        """
+        Per symbol and side totals of amount, cost and fee in [start_ms, end_ms], aggregated in SQLite.
+
+        :return: List of (symbol, side, amount, cost, fee) tuples.
+        """
+        where, params = self._where(start_ms, end_ms, None, None)
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT symbol, side, SUM(amount), SUM(cost), SUM(fee) FROM orders{where} "
+                f"GROUP BY symbol, side", params).fetchall()
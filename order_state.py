@@ -0,0 +1,249 @@
+"""
+order_state.py
+
+Local book of open orders for OKXTrader.
+
+Open orders are indexed by exchange order id, by client order id and by
+symbol, so lookups and removals are O(1). The book is updated incrementally
+from the private orders WebSocket stream (ccxt.pro watch_orders). A REST
+snapshot of open orders only replaces it as a fallback: once after every
+(re)connect of the stream, while the stream is down, and on a slow safety
+interval.
+"""
+
+import asyncio
+import collections
+import threading
+import time
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+FINAL_STATUSES = ("closed", "canceled", "rejected", "expired")
+
+
+def _updated_at(order):
+    return order.get('lastUpdateTimestamp') or order.get('timestamp') or 0
+
+
+class OrderStateManager:
+    """
+    Open-order book indexed by id, client order id and symbol, fed by order updates.
+    """
+
+    def __init__(self, orders=None, finished_capacity=10000):
+        """
+        :param orders: Optional initial open orders (ccxt order dicts).
+        :param finished_capacity: Number of recently finished order ids remembered, so a late
+                                  'open' update cannot resurrect an order already closed.
+        """
+        self.orders = {}
+        self.received_at = {}
+        self.finished = collections.OrderedDict()
+        self.finished_capacity = finished_capacity
+        self.by_client_id = {}
+        self.by_symbol = {}
+        self.lock = threading.RLock()
+        self.last_update = None
+        self.last_reconcile = None
+        self.stream_connected = False
+        self._stop = threading.Event()
+        self._threads = []
+        if orders:
+            self.reconcile(orders)
+
+    # ---------------------------
+    # Updates
+    # ---------------------------
+    def upsert(self, order):
+        """
+        Applies one order update: final states remove the order, anything else stores it.
+        Updates older than the stored state (by lastUpdateTimestamp / timestamp) are ignored.
+
+        :return: True if the book changed.
+        """
+        order_id = order.get('id')
+        if order_id is None:
+            logger.warning(f"Ignoring order update without id: {order}")
+            return False
+        with self.lock:
+            self.last_update = time.time()
+            current = self.orders.get(order_id)
+            if current is not None and _updated_at(order) and _updated_at(order) < _updated_at(current):
+                return False
+            if order.get('status') in FINAL_STATUSES:
+                self.finished[order_id] = _updated_at(order)
+                if len(self.finished) > self.finished_capacity:
+                    self.finished.popitem(last=False)
+                return self.remove(order_id) is not None
+            if order_id in self.finished and _updated_at(order) <= self.finished[order_id]:
+                return False
+            if current is not None:
+                self._unindex(current)
+                order = {**current, **{k: v for k, v in order.items() if v is not None}}
+            self.orders[order_id] = order
+            self.received_at[order_id] = self.last_update
+            if order.get('clientOrderId'):
+                self.by_client_id[order['clientOrderId']] = order_id
+            self.by_symbol.setdefault(order.get('symbol'), set()).add(order_id)
+            return True
+
+    def apply_updates(self, orders):
+        """
+        Applies a batch of order updates (e.g. one watch_orders() result). Returns the number applied.
+        """
+        with self.lock:
+            return sum(self.upsert(order) for order in orders)
+
+    def _unindex(self, order):
+        if order.get('clientOrderId'):
+            self.by_client_id.pop(order['clientOrderId'], None)
+        ids = self.by_symbol.get(order.get('symbol'))
+        if ids is not None:
+            ids.discard(order['id'])
+            if not ids:
+                del self.by_symbol[order.get('symbol')]
+
+    def _newer_than(self, order_id, order, fetched_at):
+        if fetched_at is None:
+            return False
+        # Exchange update time, or local arrival time when the exchange clock runs behind ours.
+        return _updated_at(order) >= fetched_at * 1000 or self.received_at.get(order_id, 0.0) >= fetched_at
+
+    def remove(self, order_id):
+        """
+        Removes an order from the book. Returns the removed order, or None.
+        """
+        with self.lock:
+            order = self.orders.pop(order_id, None)
+            self.received_at.pop(order_id, None)
+            if order is not None:
+                self._unindex(order)
+            return order
+
+    def clear(self):
+        with self.lock:
+            self.orders.clear()
+            self.received_at.clear()
+            self.by_client_id.clear()
+            self.by_symbol.clear()
+
+    def reconcile(self, open_orders, fetched_at=None):
+        """
+        Replaces the book with a REST snapshot of open orders.
+
+        :param fetched_at: time.time() when the snapshot request was sent. Orders updated after it
+                           (e.g. added by the stream while the request was in flight) are kept even
+                           though the snapshot does not list them.
+        :return: (added, removed) counts relative to the previous state.
+        """
+        with self.lock:
+            snapshot = {o['id']: o for o in open_orders if o.get('id') is not None}
+            stale = [order_id for order_id, order in self.orders.items()
+                     if order_id not in snapshot and not self._newer_than(order_id, order, fetched_at)]
+            added = sum(order_id not in self.orders for order_id in snapshot)
+            for order_id in stale:
+                self.remove(order_id)
+            for order in snapshot.values():
+                self.upsert(order)
+            self.last_reconcile = time.time()
+        if added or stale:
+            logger.info(f"Order book reconciled: {added} added, {len(stale)} removed.")
+        return added, len(stale)
+
+    # ---------------------------
+    # Lookups
+    # ---------------------------
+    def get(self, order_id):
+        return self.orders.get(order_id)
+
+    def get_by_client_id(self, client_order_id):
+        order_id = self.by_client_id.get(client_order_id)
+        return self.orders.get(order_id) if order_id is not None else None
+
+    def for_symbol(self, symbol):
+        with self.lock:
+            return [self.orders[order_id] for order_id in self.by_symbol.get(symbol, ())]
+
+    def open_orders(self):
+        with self.lock:
+            return list(self.orders.values())
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    # ---------------------------
+    # Synchronization
+    # ---------------------------
+    def start(self, ws_exchange, fetch_open_orders, reconcile_interval=30.0, safety_interval=600.0):
+        """
+        Starts the order stream and the fallback reconciliation on daemon threads.
+
+        :param ws_exchange: ccxt.pro exchange with watch_orders (authenticated), or None for REST only.
+        :param fetch_open_orders: Callable returning the current open orders over REST.
+        :param reconcile_interval: Seconds between REST snapshots while the stream is down.
+        :param safety_interval: Seconds between REST snapshots while the stream is healthy.
+        """
+        self._stop.clear()
+        if ws_exchange is not None:
+            stream = threading.Thread(target=self._run_stream, args=(ws_exchange, fetch_open_orders),
+                                      name="order-stream", daemon=True)
+            stream.start()
+            self._threads.append(stream)
+        reconciler = threading.Thread(target=self._run_reconcile,
+                                      args=(fetch_open_orders, reconcile_interval, safety_interval),
+                                      name="order-reconcile", daemon=True)
+        reconciler.start()
+        self._threads.append(reconciler)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run_stream(self, ws_exchange, fetch_open_orders):
+        asyncio.run(self._consume(ws_exchange, fetch_open_orders))
+
+    async def _consume(self, ws_exchange, fetch_open_orders):
+        backoff = 1.0
+        resync = True
+        try:
+            while not self._stop.is_set():
+                try:
+                    updates = await ws_exchange.watch_orders()
+                    # Connected only once the subscription has delivered; until then the
+                    # reconciler keeps polling as if the stream were down.
+                    self.stream_connected = True
+                    backoff = 1.0
+                    self.apply_updates(updates)
+                    if resync:
+                        # Updates sent while (re)connecting are lost; the subscription is live
+                        # now, so one snapshot closes the gap.
+                        fetched_at = time.time()
+                        self.reconcile(await asyncio.to_thread(fetch_open_orders), fetched_at)
+                        resync = False
+                except Exception as e:
+                    self.stream_connected = False
+                    resync = True
+                    logger.error(f"Error watching orders: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+        finally:
+            self.stream_connected = False
+            close = getattr(ws_exchange, 'close', None)
+            if close is not None:
+                await close()
+
+    def _run_reconcile(self, fetch_open_orders, reconcile_interval, safety_interval):
+        while not self._stop.wait(reconcile_interval):
+            age = time.time() - (self.last_reconcile or 0)
+            if self.stream_connected and age < safety_interval:
+                continue
+            try:
+                fetched_at = time.time()
+                self.reconcile(fetch_open_orders(), fetched_at)
+            except Exception as e:
+                logger.error(f"Error reconciling open orders: {e}")
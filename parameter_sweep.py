@@ -0,0 +1,173 @@
+"""
+parameter_sweep.py
+
+Parallel grid search over the triangle arbitrage backtest parameters
+(threshold x trade_fraction). The historical prices are loaded once and the
+cycle factors computed once in the parent, placed in a shared memory block
+and attached (not pickled) by every worker process of a ProcessPoolExecutor.
+Each worker then runs the columnar backtest for its share of the grid.
+
+Usage:
+    python parameter_sweep.py --data triangle_market_data_historical.json \
+        --thresholds 0.001,0.002,0.003 --trade-fractions 0.05,0.1,0.2
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, util
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import (compute_cycle_factors, to_price_arrays, trade_returns_from_cycles,
+                             summarize_returns)
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+RESULT_COLUMNS = ["threshold", "trade_fraction", "cumulative_return", "sharpe_ratio",
+                  "max_drawdown", "average_return", "std_return", "trade_count"]
+
+# Per-worker state, filled by _init_worker.
+_worker_shm = None
+_worker_cycles = None
+
+
+def _init_worker(shm_name, shape):
+    """
+    Attaches the shared cycle factor block (2 x records) once per worker; it is closed when the worker exits.
+    """
+    global _worker_shm, _worker_cycles
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    cycles = np.ndarray(shape, dtype=np.float64, buffer=_worker_shm.buf)
+    _worker_cycles = (cycles[0], cycles[1])
+    util.Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    """
+    Drops the worker's views of the shared block (close() refuses while they exist) and detaches it.
+    """
+    global _worker_shm, _worker_cycles
+    _worker_cycles = None
+    if _worker_shm is not None:
+        _worker_shm.close()
+        _worker_shm = None
+
+
+def _evaluate(params):
+    """
+    Runs one backtest for a (threshold, trade_fraction) pair against the worker's cycle factors.
+    """
+    threshold, trade_fraction = params
+    cycle1, cycle2 = _worker_cycles
+    return _backtest_stats(cycle1, cycle2, threshold, trade_fraction)
+
+
+def _backtest_stats(cycle1, cycle2, threshold, trade_fraction):
+    """
+    Backtest statistics (without the portfolio curve) for one parameter pair.
+    """
+    trade_returns, opp1, opp2 = trade_returns_from_cycles(cycle1, cycle2, trade_fraction, threshold)
+    stats = summarize_returns(trade_returns)
+    stats.pop("portfolio_history")
+    stats["threshold"] = threshold
+    stats["trade_fraction"] = trade_fraction
+    stats["trade_count"] = int(np.count_nonzero(opp1 | opp2))
+    return stats
+
+
+def run_parameter_sweep(historical_data, thresholds, trade_fractions, max_workers=None,
+                        sort_by="cumulative_return"):
+    """
+    Backtests every combination of thresholds x trade_fractions in parallel.
+
+    Parameters:
+        historical_data: DataFrame, mapping of columns, or list of records with the three close prices.
+        thresholds (iterable of float): Threshold values to test.
+        trade_fractions (iterable of float): Trade fraction values to test.
+        max_workers (int): Number of worker processes (default: os.cpu_count()).
+        sort_by (str): Result column used for ranking, best first (default "cumulative_return").
+
+    Returns:
+        pandas.DataFrame: One row per combination, ranked by sort_by.
+    """
+    grid = list(itertools.product(thresholds, trade_fractions))
+    if not grid:
+        logger.error("Empty parameter grid.")
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    prices = np.vstack(to_price_arrays(historical_data))
+    max_workers = max_workers or os.cpu_count() or 1
+    logger.info(f"Sweeping {len(grid)} parameter combinations over {prices.shape[1]} records "
+                f"with {max_workers} workers...")
+    start = time.perf_counter()
+
+    cycle1, cycle2, _ = compute_cycle_factors(prices[0], prices[1], prices[2])
+    del prices
+    if max_workers == 1:
+        rows = [_backtest_stats(cycle1, cycle2, threshold, fraction) for threshold, fraction in grid]
+    else:
+        shape = (2, len(cycle1))
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * shape[0] * shape[1]))
+        try:
+            shared_cycles = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            shared_cycles[0] = cycle1
+            shared_cycles[1] = cycle2
+            del cycle1, cycle2
+            chunksize = max(1, len(grid) // (max_workers * 4))
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(shm.name, shape)) as executor:
+                rows = list(executor.map(_evaluate, grid, chunksize=chunksize))
+            del shared_cycles
+        finally:
+            shm.close()
+            shm.unlink()
+
+    table = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    table = table.sort_values(sort_by, ascending=(sort_by == "max_drawdown"), kind="stable")
+    table = table.reset_index(drop=True)
+    logger.info(f"Parameter sweep finished in {time.perf_counter() - start:.2f}s.")
+    return table
+
+
+def _parse_grid(text):
+    """
+    Parses either a comma separated list ("0.001,0.002") or a start:stop:step range ("0.001:0.01:0.001").
+    """
+    if ':' in text:
+        start, stop, step = (float(x) for x in text.split(':'))
+        return [round(x, 10) for x in np.arange(start, stop + step / 2, step)]
+    return [float(x) for x in text.split(',') if x.strip()]
+
+
+def main():
+    """
+    CLI entry point for the parameter sweep.
+    """
+    parser = argparse.ArgumentParser(description="Parallel threshold x trade_fraction sweep for the triangle backtest.")
+    parser.add_argument("--data", default="triangle_market_data_historical.json",
+                        help="Historical triangle data (JSON array of merged records).")
+    parser.add_argument("--thresholds", required=True, help="Comma list or start:stop:step range.")
+    parser.add_argument("--trade-fractions", required=True, help="Comma list or start:stop:step range.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--sort-by", default="cumulative_return", choices=RESULT_COLUMNS)
+    parser.add_argument("--top", type=int, default=20, help="Number of rows to print.")
+    parser.add_argument("--output", default=None, help="Optional CSV file for the full ranked table.")
+    args = parser.parse_args()
+
+    historical_data = pd.read_json(args.data, orient="records")
+    table = run_parameter_sweep(historical_data, _parse_grid(args.thresholds), _parse_grid(args.trade_fractions),
+                                max_workers=args.workers, sort_by=args.sort_by)
+    print(table.head(args.top).to_string())
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"Full results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+pnl_engine.py
+
+Exact FIFO and average-cost PnL over a columnar fill table.
+
+A fill table has one row per fill: symbol, side, timestamp (ms), price,
+amount (base units) and fee (quote units). Every symbol is processed with
+whole-array operations:
+
+- The position is the running sum of signed amounts, floored at zero, so a
+  sell larger than the inventory built from the fills only closes what is
+  there; the excess is reported as 'unmatched' (inventory from before the
+  history started) and carries no PnL.
+- FIFO: buys form a piecewise-linear "cumulative cost over cumulative
+  quantity" curve. A sell consuming the quantity range [q0, q1] of that curve
+  has a cost basis of C(q1) - C(q0), one np.interp per symbol.
+- Average cost: the open cost basis follows B_k = f_k * B_(k-1) + c_k (f_k is
+  the fraction of the position kept by a sell, c_k the cost of a buy). The
+  recurrence is solved in fixed-size blocks with a small triangular matrix
+  product, which stays exact and free of over/underflow.
+
+PnLEngine keeps the open FIFO lots and the average-cost position per symbol,
+so new fills can be added incrementally. Per-symbol totals and per time bucket
+(hourly/daily) aggregates are grouped pandas operations over the per-fill result.
+"""
+
+import numpy as np
+import pandas as pd
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+FILL_COLUMNS = ("symbol", "side", "timestamp", "price", "amount", "fee")
+BUCKET_COLUMNS = ("realized_fifo", "realized_avg", "fee", "turnover", "buy_volume", "sell_volume")
+SCAN_BLOCK = 16
+
+
+def to_fill_table(frame):
+    """
+    Normalizes order or fill records into a fill table.
+
+    Accepts OrderHistoryStore.orders_frame() (filled quantity at the average price; unfilled
+    orders are dropped), OrderHistoryStore.trades_frame(), or any DataFrame/list of dicts with
+    the FILL_COLUMNS. Fees charged in the base currency are converted to quote at the fill price.
+
+    :return: DataFrame with FILL_COLUMNS, sorted by timestamp (stable).
+    """
+    frame = pd.DataFrame(frame)
+    if frame.empty:
+        return pd.DataFrame({c: pd.Series(dtype=object if c in ("symbol", "side") else np.float64)
+                             for c in FILL_COLUMNS})
+    if "filled" in frame:
+        amount = pd.to_numeric(frame["filled"], errors='coerce')
+        price = pd.to_numeric(frame["average"], errors='coerce')
+        if "cost" in frame:
+            price = price.fillna(pd.to_numeric(frame["cost"], errors='coerce') / amount)
+        price = price.fillna(pd.to_numeric(frame["price"], errors='coerce'))
+    else:
+        amount = pd.to_numeric(frame["amount"], errors='coerce')
+        price = pd.to_numeric(frame["price"], errors='coerce')
+    fee = pd.to_numeric(frame["fee"], errors='coerce').fillna(0.0) if "fee" in frame else 0.0
+    if "fee_currency" in frame:
+        base = frame["symbol"].str.split('/').str[0]
+        fee = fee.where(frame["fee_currency"] != base, fee * price)
+    fills = pd.DataFrame({
+        "symbol": frame["symbol"],
+        "side": frame["side"],
+        "timestamp": pd.to_numeric(frame["timestamp"], errors='coerce'),
+        "price": price,
+        "amount": amount,
+        "fee": fee
+    })
+    fills = fills[(fills["amount"] > 0) & fills["price"].notna() & fills["side"].isin(("buy", "sell"))]
+    return fills.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def _positions(signed, start=0.0):
+    """
+    Running position floored at zero (a reflected cumulative sum).
+
+    :return: (position before, position after) arrays.
+    """
+    total = start + np.cumsum(signed)
+    floor = np.minimum.accumulate(np.minimum(total, 0.0))
+    after = total - floor
+    before = np.concatenate(([start], after[:-1]))
+    return before, after
+
+
+def _linear_scan(factor, add, start=0.0, block=SCAN_BLOCK):
+    """
+    Solves x_k = factor_k * x_(k-1) + add_k (factor in [0, 1]) for all k.
+
+    The series is cut into blocks. Within a block, x_k = sum_j add_j * prod(factor_(j+1..k)) is a
+    triangular matrix product, with the products taken in log space relative to the block so that
+    zeros (a closed position) cut the sum instead of producing 0 * inf. All blocks are solved at
+    once from a zero start; the block ends are then chained by the same recurrence one level up.
+    """
+    n = len(add)
+    if n == 0:
+        return np.empty(0)
+    pad = -n % block
+    with np.errstate(divide='ignore'):
+        logs = np.log(np.concatenate((factor, np.ones(pad)))).reshape(-1, block)
+    add = np.concatenate((add, np.zeros(pad))).reshape(-1, block)
+    reset = np.isneginf(logs)
+    segment = np.cumsum(reset, axis=1)
+    cum = np.cumsum(np.where(reset, 0.0, logs), axis=1)
+    local = np.empty_like(add)
+    lower = np.tri(block, dtype=bool)
+    for s in range(0, len(add), 256):
+        seg, c = segment[s:s + 256], cum[s:s + 256]
+        # prod(factor_(j+1..k)) for j <= k within the same segment
+        same = (seg[:, :, None] == seg[:, None, :]) & lower
+        weights = np.where(same, np.exp(np.minimum(c[:, :, None] - c[:, None, :], 0.0)), 0.0)
+        local[s:s + 256] = np.einsum('bkj,bj->bk', weights, add[s:s + 256])
+    carry = np.where(segment == 0, np.exp(cum), 0.0)
+    if len(add) == 1:
+        starts = np.array([start])
+    else:
+        ends = _linear_scan(carry[:, -1], local[:, -1], start, block)
+        starts = np.concatenate(([start], ends[:-1]))
+    return (local + carry * starts[:, None]).ravel()[:n]
+
+
+def _fifo(is_buy, amount, price, matched, lots_amount, lots_price):
+    """
+    FIFO cost basis of every sell, given the open lots carried in from earlier fills.
+
+    :return: (cost of the matched amount per fill, open cost basis after each fill,
+              remaining lot amounts, remaining lot prices).
+    """
+    lot_amount = np.concatenate((lots_amount, amount[is_buy]))
+    lot_price = np.concatenate((lots_price, price[is_buy]))
+    quantity = np.concatenate(([0.0], np.cumsum(lot_amount)))
+    cost = np.concatenate(([0.0], np.cumsum(lot_amount * lot_price)))
+    sold = np.where(is_buy, 0.0, matched)
+    consumed = np.cumsum(sold)
+    basis = np.interp(consumed, quantity, cost) - np.interp(consumed - sold, quantity, cost)
+    bought = lots_amount @ lots_price + np.cumsum(np.where(is_buy, amount * price, 0.0))
+    open_cost = bought - np.interp(consumed, quantity, cost)
+    used = consumed[-1] if len(consumed) else 0.0
+    left = np.clip(quantity[1:] - used, 0.0, lot_amount)
+    keep = left > 0
+    return np.where(is_buy, 0.0, basis), open_cost, left[keep], lot_price[keep]
+
+
+def compute_symbol_pnl(side, amount, price, state=None):
+    """
+    FIFO and average-cost PnL of one symbol's fills (in time order).
+
+    :param side: Array of 'buy' / 'sell'.
+    :param state: Carried-in state from a previous call (see PnLEngine), or None for a flat start.
+    :return: (dict of per-fill arrays, new state dict).
+    """
+    state = state or _flat_state()
+    is_buy = np.asarray(side) == "buy"
+    amount = np.asarray(amount, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+
+    before, after = _positions(np.where(is_buy, amount, -amount), state["position"])
+    matched = np.where(is_buy, amount, before - after)
+    proceeds = np.where(is_buy, 0.0, matched * price)
+
+    fifo_basis, fifo_cost, lots_amount, lots_price = _fifo(is_buy, amount, price, matched,
+                                                           state["lots_amount"], state["lots_price"])
+
+    kept = np.divide(after, before, out=np.zeros_like(after), where=before > 0)
+    factor = np.where(is_buy, 1.0, kept)
+    basis = _linear_scan(factor, np.where(is_buy, amount * price, 0.0), state["avg_basis"])
+    basis_before = np.concatenate(([state["avg_basis"]], basis[:-1]))
+
+    fills = {
+        "matched": matched,
+        "unmatched": amount - matched,
+        "position": after,
+        "realized_fifo": proceeds - fifo_basis,
+        "realized_avg": np.where(is_buy, 0.0, proceeds - basis_before * (1.0 - factor)),
+        "fifo_cost": fifo_cost,
+        "avg_cost": basis
+    }
+    new_state = {
+        "position": float(after[-1]) if len(after) else state["position"],
+        "lots_amount": lots_amount,
+        "lots_price": lots_price,
+        "avg_basis": float(basis[-1]) if len(basis) else state["avg_basis"]
+    }
+    return fills, new_state
+
+
+def _flat_state():
+    return {"position": 0.0, "lots_amount": np.empty(0), "lots_price": np.empty(0), "avg_basis": 0.0}
+
+
+def _bucket_frame(fills, freq):
+    """
+    Sums realized PnL, fees, turnover and volumes per symbol and time bucket.
+    """
+    if fills.empty:
+        index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([], tz='UTC')], names=["symbol", "bucket"])
+        return pd.DataFrame(columns=list(BUCKET_COLUMNS) + ["fills"], index=index, dtype=np.float64)
+    frame = fills.assign(bucket=pd.to_datetime(fills["timestamp"], unit='ms', utc=True).dt.floor(freq))
+    return frame.groupby(["symbol", "bucket"])[list(BUCKET_COLUMNS) + ["fills"]].sum()
+
+
+class PnLEngine:
+    """
+    Incremental FIFO / average-cost PnL over a growing fill table.
+    """
+
+    def __init__(self, bucket_freqs=("1h", "1D")):
+        """
+        :param bucket_freqs: pandas frequencies of the time-bucket aggregates kept up to date.
+        """
+        self.bucket_freqs = tuple(bucket_freqs)
+        self.states = {}
+        self.totals = None
+        self.buckets = {freq: None for freq in self.bucket_freqs}
+        self.last_timestamps = {}
+        self.fill_count = 0
+
+    def update(self, fills):
+        """
+        Adds new fills (fill table, or anything to_fill_table accepts). Each symbol's fills must be
+        newer than those of the same symbol already added.
+
+        :return: Per-fill DataFrame of the new fills with realized PnL, matched/unmatched amount,
+                 position, the open cost basis after each fill, turnover and buy/sell volumes.
+        """
+        if not (isinstance(fills, pd.DataFrame) and list(fills.columns) == list(FILL_COLUMNS)):
+            fills = to_fill_table(fills)
+        if fills.empty:
+            return fills.assign(**{c: pd.Series(dtype=np.float64) for c in
+                                   ("matched", "unmatched", "position", "realized_fifo", "realized_avg",
+                                    "fifo_cost", "avg_cost", "turnover", "buy_volume", "buy_value",
+                                    "sell_volume", "sell_value", "fills")})
+        parts = []
+        for symbol, group in fills.groupby("symbol", sort=False):
+            if group["timestamp"].iloc[0] < self.last_timestamps.get(symbol, float('-inf')):
+                logger.warning(f"PnLEngine received {symbol} fills older than its last update; "
+                               f"they are applied after it.")
+            self.last_timestamps[symbol] = float(group["timestamp"].iloc[-1])
+            result, self.states[symbol] = compute_symbol_pnl(
+                group["side"].to_numpy(), group["amount"].to_numpy(), group["price"].to_numpy(),
+                self.states.get(symbol))
+            parts.append(pd.DataFrame(result, index=group.index))
+        is_buy = (fills["side"] == "buy").to_numpy()
+        turnover = fills["amount"].to_numpy() * fills["price"].to_numpy()
+        result = fills.join(pd.concat(parts)).assign(
+            turnover=turnover,
+            buy_volume=np.where(is_buy, fills["amount"], 0.0),
+            buy_value=np.where(is_buy, turnover, 0.0),
+            sell_volume=np.where(is_buy, 0.0, fills["amount"]),
+            sell_value=np.where(is_buy, 0.0, turnover),
+            fills=1)
+
+        self._accumulate(result)
+        self.fill_count += len(fills)
+        return result
+
+    def _accumulate(self, result):
+        totals = result.groupby("symbol")[["buy_volume", "buy_value", "sell_volume", "sell_value", "fee",
+                                           "turnover", "realized_fifo", "realized_avg", "unmatched",
+                                           "fills"]].sum()
+        self.totals = totals if self.totals is None else self.totals.add(totals, fill_value=0.0)
+        for freq in self.bucket_freqs:
+            bucket = _bucket_frame(result, freq)
+            previous = self.buckets[freq]
+            self.buckets[freq] = bucket if previous is None else previous.add(bucket, fill_value=0.0)
+
+    def summary(self, marks=None):
+        """
+        Per-symbol totals, open position and cost basis, plus unrealized PnL where a mark price is given.
+
+        :param marks: Optional dict symbol -> mark price.
+        :return: DataFrame indexed by symbol.
+        """
+        if self.totals is None:
+            return pd.DataFrame()
+        frame = self.totals.copy()
+        frame["position"] = pd.Series({s: st["position"] for s, st in self.states.items()})
+        frame["fifo_cost"] = pd.Series({s: float(st["lots_amount"] @ st["lots_price"])
+                                        for s, st in self.states.items()})
+        frame["avg_cost"] = pd.Series({s: st["avg_basis"] for s, st in self.states.items()})
+        frame["net_realized_fifo"] = frame["realized_fifo"] - frame["fee"]
+        frame["net_realized_avg"] = frame["realized_avg"] - frame["fee"]
+        if marks:
+            frame["mark"] = pd.Series(marks, dtype=np.float64).reindex(frame.index)
+            value = frame["position"] * frame["mark"]
+            frame["unrealized_fifo"] = value - frame["fifo_cost"]
+            frame["unrealized_avg"] = value - frame["avg_cost"]
+        return frame
+
+    def bucket_pnl(self, freq="1D"):
+        """
+        Realized PnL, fees, turnover and volumes per (symbol, bucket) for one of the tracked frequencies.
+        """
+        if freq not in self.buckets:
+            raise ValueError(f"Bucket frequency {freq} is not tracked (have {self.bucket_freqs})")
+        bucket = self.buckets[freq]
+        return bucket if bucket is not None else _bucket_frame(pd.DataFrame(columns=FILL_COLUMNS), freq)
+
+    def open_lots(self, symbol):
+        """
+        Remaining FIFO lots of a symbol as (amounts, prices) arrays, oldest first.
+        """
+        state = self.states.get(symbol, _flat_state())
+        return state["lots_amount"], state["lots_price"]
+
+
+def compute_pnl(fills, marks=None, bucket_freqs=("1h", "1D")):
+    """
+    One-shot PnL of a complete fill table.
+
+    :return: (per-fill DataFrame, per-symbol summary DataFrame, PnLEngine holding the buckets and state).
+    """
+    engine = PnLEngine(bucket_freqs)
+    per_fill = engine.update(fills)
+    return per_fill, engine.summary(marks), engine
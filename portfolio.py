@@ -0,0 +1,197 @@
+"""
+portfolio.py
+
+Portfolio valuation for OKXTrader.
+
+PortfolioValuator values every holding against the quote currency without
+walking the assets one by one. The balance, one bulk ticker snapshot and the
+incremental fill sync of each held asset run concurrently. The fill sync goes
+through the local OrderHistoryStore and only downloads fills newer than its
+cursor, and not at all within 'trade_max_age'. Cost bases come from the
+stored fills through pnl_engine, so a steady-state valuation costs about one
+round trip of latency whatever the number of assets. Assets that were not held
+at the previous valuation need a second, equally concurrent round.
+"""
+
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from logger_config import setup_logger
+from pnl_engine import PnLEngine, to_fill_table
+from rate_limiter import PRIORITY_REPORTING
+
+# Configure logging
+logger = setup_logger(__name__)
+
+STABLE_CURRENCIES = ("USDT", "USD", "USDC", "SGD")
+
+
+class PortfolioValuator:
+    """
+    Concurrent valuation of account holdings with cost bases from the local fill cache.
+    """
+
+    def __init__(self, exchange, price_snapshot, order_history, scheduler=None, quote: str = "USDT",
+                 method: str = "fifo", trade_max_age: float = 60.0, max_workers: int = 64):
+        """
+        :param exchange: ccxt exchange (or ScheduledExchange) providing fetch_balance and fetch_my_trades.
+        :param price_snapshot: PriceSnapshot used for the bulk price request.
+        :param order_history: OrderHistoryStore caching the fills.
+        :param scheduler: Optional RequestScheduler; requests are sent at reporting priority.
+        :param quote: Currency holdings are valued in.
+        :param method: "fifo" or "average" cost basis.
+        :param trade_max_age: Seconds a symbol's fill cache is used without asking for newer fills.
+        :param max_workers: Maximum number of concurrent requests.
+        """
+        self.exchange = exchange
+        self.price_snapshot = price_snapshot
+        self.order_history = order_history
+        self.scheduler = scheduler
+        self.quote = quote
+        self.method = method
+        self.trade_max_age = trade_max_age
+        self.max_workers = max_workers
+        self.holdings = {}
+        self.held_symbols = []
+
+    def _reporting(self):
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        return self.scheduler.priority(PRIORITY_REPORTING)
+
+    def _call(self, method, *args, **kwargs):
+        with self._reporting():
+            return method(*args, **kwargs)
+
+    def _symbols_for(self, holdings):
+        symbols = []
+        for currency, amount in holdings.items():
+            symbol = f"{currency}/{self.quote}"
+            if currency in STABLE_CURRENCIES or float(amount or 0) <= 0 or symbol not in self.exchange.markets:
+                continue
+            symbols.append(symbol)
+        return symbols
+
+    def _sync_trades(self, symbol):
+        synced_at = self.order_history.synced_at(f"trades:{symbol}")
+        if synced_at is not None and time.time() - synced_at < self.trade_max_age:
+            return 0
+        try:
+            return self._call(self.order_history.sync_trades, self.exchange, symbol)
+        except Exception as e:
+            logger.warning(f"Could not sync fills for {symbol}: {e}")
+            return None
+
+    def _submit_round(self, executor, symbols):
+        """
+        Submits the bulk price request and one fill sync per symbol.
+        """
+        prices = executor.submit(self._call, self.price_snapshot.last_prices, symbols, 0) if symbols else None
+        syncs = [executor.submit(self._sync_trades, symbol) for symbol in symbols]
+        return prices, syncs
+
+    def fetch(self):
+        """
+        Fetches the balance, prices and fills with as few sequential round trips as possible.
+
+        :return: (holdings, prices) where holdings is the 'total' balance and prices maps symbol -> last.
+        """
+        expected = list(self.held_symbols)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            balance = executor.submit(self._call, self.exchange.fetch_balance)
+            prices_future, syncs = self._submit_round(executor, expected)
+            holdings = balance.result().get('total', {})
+            held = self._symbols_for(holdings)
+            # Assets not held last time: one more round for their prices and fills
+            missing_prices, missing_syncs = self._submit_round(executor, [s for s in held if s not in expected])
+            prices = {}
+            for future in (prices_future, missing_prices):
+                if future is not None:
+                    prices.update(future.result())
+            for future in syncs + missing_syncs:
+                future.result()
+        self.holdings = holdings
+        self.held_symbols = held
+        return holdings, prices
+
+    def cost_bases(self, symbols):
+        """
+        Open position and cost basis per symbol from the cached fills.
+
+        :return: Dict symbol -> {'position', 'cost', 'realized_pnl', 'fee'} (symbols without fills are omitted).
+        """
+        if not symbols:
+            return {}
+        fills = to_fill_table(pd.concat([self.order_history.trades_frame(symbol) for symbol in symbols]))
+        if fills.empty:
+            return {}
+        engine = PnLEngine(bucket_freqs=())
+        engine.update(fills)
+        summary = engine.summary()
+        cost_column, realized_column = (("fifo_cost", "realized_fifo") if self.method == "fifo"
+                                        else ("avg_cost", "realized_avg"))
+        return {symbol: {'position': float(row['position']), 'cost': float(row[cost_column]),
+                         'realized_pnl': float(row[realized_column]), 'fee': float(row['fee'])}
+                for symbol, row in summary.iterrows()}
+
+    def value(self):
+        """
+        Values every holding at the current price against its cost basis.
+
+        The cost basis of a holding is the open cost per unit of its recorded fills times the
+        balance. Holdings without recorded fills are valued at cost = current value.
+
+        :return: Dict coin -> {'balance', 'current_price', 'cost_basis', 'current_value',
+                 'unrealized_pnl', 'pnl_percent', 'realized_pnl'} plus a 'TOTAL' entry, or None on error.
+        """
+        try:
+            holdings, prices = self.fetch()
+            bases = self.cost_bases(self.held_symbols)
+
+            portfolio = {}
+            total_value = 0.0
+            total_cost = 0.0
+            for symbol in self.held_symbols:
+                currency = symbol.split('/')[0]
+                if symbol not in prices:
+                    logger.warning(f"No price for {symbol}; {currency} left out of the valuation.")
+                    continue
+                amount = float(holdings[currency])
+                current_price = prices[symbol]
+                current_value = current_price * amount
+                basis = bases.get(symbol)
+                if basis and basis['position'] > 0:
+                    cost_basis = basis['cost'] / basis['position'] * amount
+                else:
+                    cost_basis = current_value
+                unrealized_pnl = current_value - cost_basis
+                portfolio[currency] = {
+                    'balance': amount,
+                    'current_price': current_price,
+                    'cost_basis': cost_basis,
+                    'current_value': current_value,
+                    'unrealized_pnl': unrealized_pnl,
+                    'pnl_percent': (unrealized_pnl / cost_basis * 100) if cost_basis > 0 else 0,
+                    'realized_pnl': basis['realized_pnl'] - basis['fee'] if basis else 0.0
+                }
+                total_value += current_value
+                total_cost += cost_basis
+
+            quote_balance = float(holdings.get(self.quote) or 0)
+            total_value += quote_balance
+            total_cost += quote_balance
+            total_unrealized = total_value - total_cost
+            portfolio['TOTAL'] = {
+                'usdt_balance': quote_balance,
+                'portfolio_value': total_value,
+                'cost_basis': total_cost,
+                'unrealized_pnl': total_unrealized,
+                'pnl_percent': (total_unrealized / total_cost * 100) if total_cost > 0 else 0
+            }
+            return portfolio
+        except Exception as e:
+            logger.error(f"Error valuing portfolio: {e}")
+            return None
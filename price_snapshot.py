@@ -0,0 +1,227 @@
+"""
+price_snapshot.py
+
+Batched ticker snapshots for OKXTrader.
+
+Instead of one fetch_ticker round trip per symbol, PriceSnapshot fetches every
+tracked symbol with a single bulk fetch_tickers call and caches the result.
+Reads inside the staleness bound are served from memory. A read that needs a
+missing or stale symbol refreshes all tracked symbols at once, so the legs of
+a triangle (or the holdings of a portfolio) are always sampled together.
+
+OKX only returns tickers of one instrument type per request, so the bulk
+request is split by market type (spot, swap, ...). Symbols the exchange does
+not list are rejected up front, because a single unknown symbol fails the
+whole request with BadSymbol; symbols it lists but returns no ticker for are
+dropped from the tracked set instead of being re-requested on every read.
+AsyncPriceSnapshot is the same cache for ccxt.async_support exchanges;
+concurrent readers of a stale snapshot share a single request.
+"""
+
+import asyncio
+import threading
+import time
+
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+
+def _normalize(symbol: str) -> str:
+    """'BTC-USDT' -> 'BTC/USDT'."""
+    return symbol.replace('-', '/')
+
+
+class PriceSnapshot:
+    """
+    Cached ticker snapshot refreshed with one bulk fetch_tickers call.
+    """
+
+    def __init__(self, exchange, symbols=None, max_staleness: float = 1.0):
+        """
+        :param exchange: ccxt exchange (or compatible) providing fetch_tickers.
+        :param symbols: Symbols to track from the start; more are added as they are requested.
+        :param max_staleness: Seconds a snapshot may be served before it is refreshed.
+        """
+        self.exchange = exchange
+        self.max_staleness = max_staleness
+        self.symbols = set()
+        self.tickers = {}
+        self.fetched_at = {}
+        self.fetch_count = 0
+        self.lock = threading.Lock()
+        self.watch(symbols or [])
+
+    def watch(self, symbols):
+        """
+        Adds symbols to the set refreshed by every bulk request.
+        Symbols missing from exchange.markets (once loaded) are skipped with a warning.
+        """
+        symbols = self._known(_normalize(s) for s in symbols)
+        with self.lock:
+            self.symbols.update(symbols)
+
+    def _known(self, symbols):
+        markets = getattr(self.exchange, 'markets', None)
+        symbols = set(symbols)
+        if not markets:
+            return symbols
+        unknown = symbols.difference(markets)
+        if unknown:
+            logger.warning(f"Not tracking symbols unknown to {getattr(self.exchange, 'id', 'the exchange')}: {sorted(unknown)}")
+        return symbols - unknown
+
+    def refresh(self, symbols=None):
+        """
+        Fetches all tracked symbols (plus 'symbols') with one request per market type and updates the cache.
+
+        :return: Dict mapping symbol -> ticker for the fetched symbols.
+        """
+        tickers = {}
+        for request in self._request_symbols(symbols):
+            batch = self.exchange.fetch_tickers(request)
+            self._store(request, batch)
+            tickers.update(batch)
+        return tickers
+
+    def _request_symbols(self, symbols):
+        """
+        Tracks 'symbols' and returns the tracked set as sorted request lists, one per market type.
+        Symbols become known to the markets only after load_markets(), so they are re-checked here.
+        """
+        self.watch(symbols or [])
+        with self.lock:
+            tracked = self._known(self.symbols)
+            self.symbols.intersection_update(tracked)
+        markets = getattr(self.exchange, 'markets', None) or {}
+        groups = {}
+        for symbol in sorted(tracked):
+            groups.setdefault(markets.get(symbol, {}).get('type'), []).append(symbol)
+        return list(groups.values())
+
+    def _store(self, request, tickers):
+        now = time.monotonic()
+        missing = [s for s in request if s not in tickers]
+        with self.lock:
+            self.fetch_count += 1
+            for symbol, ticker in tickers.items():
+                self.tickers[symbol] = ticker
+                self.fetched_at[symbol] = now
+            # Evicted until requested again; fetched_at keeps them from looking stale meanwhile.
+            for symbol in missing:
+                self.symbols.discard(symbol)
+                self.tickers.pop(symbol, None)
+                self.fetched_at[symbol] = now
+        if missing:
+            logger.warning(f"No ticker returned for {missing}, no longer tracking them")
+
+    def _is_stale(self, symbols, max_staleness):
+        bound = self.max_staleness if max_staleness is None else max_staleness
+        now = time.monotonic()
+        # Unknown symbols are never fetched, so they cannot make the snapshot stale.
+        markets = getattr(self.exchange, 'markets', None)
+        symbols = [s for s in symbols if s in markets] if markets else symbols
+        with self.lock:
+            return any(now - self.fetched_at.get(s, float('-inf')) > bound for s in symbols)
+
+    def _select(self, symbols):
+        with self.lock:
+            return {s: self.tickers[s] for s in symbols if s in self.tickers}
+
+    def get_tickers(self, symbols, max_staleness: float = None):
+        """
+        Returns tickers for the given symbols, refreshing once if any is missing or stale.
+
+        :param symbols: Symbols in 'BTC/USDT' or 'BTC-USDT' form.
+        :param max_staleness: Override of the instance staleness bound (0 forces a refresh).
+        :return: Dict mapping the normalized symbol -> ticker (unknown symbols and symbols the
+                 exchange did not return are omitted).
+        """
+        symbols = [_normalize(s) for s in symbols]
+        if self._is_stale(symbols, max_staleness):
+            self.refresh(symbols)
+        return self._select(symbols)
+
+    def ticker(self, symbol: str, max_staleness: float = None):
+        """
+        Returns the cached ticker for one symbol (None if the exchange has none).
+        """
+        return self.get_tickers([symbol], max_staleness).get(_normalize(symbol))
+
+    def last(self, symbol: str, max_staleness: float = None):
+        """
+        Returns the last traded price of one symbol as a float (None if unavailable).
+        """
+        ticker = self.ticker(symbol, max_staleness)
+        if not ticker or ticker.get('last') is None:
+            return None
+        return float(ticker['last'])
+
+    def last_prices(self, symbols, max_staleness: float = None):
+        """
+        Returns {symbol: last price} for several symbols from one snapshot.
+        """
+        tickers = self.get_tickers(symbols, max_staleness)
+        return {s: float(t['last']) for s, t in tickers.items() if t.get('last') is not None}
+
+
+class AsyncPriceSnapshot(PriceSnapshot):
+    """
+    PriceSnapshot for ccxt.async_support exchanges (fetch_tickers is awaited).
+    """
+
+    def __init__(self, exchange, symbols=None, max_staleness: float = 1.0):
+        super().__init__(exchange, symbols, max_staleness)
+        self._refreshing = None
+
+    async def refresh(self, symbols=None):
+        """
+        Fetches all tracked symbols (plus 'symbols') with concurrent requests per market type.
+        """
+        requests = self._request_symbols(symbols)
+        batches = await asyncio.gather(*(self.exchange.fetch_tickers(request) for request in requests))
+        tickers = {}
+        for request, batch in zip(requests, batches):
+            self._store(request, batch)
+            tickers.update(batch)
+        return tickers
+
+    async def get_tickers(self, symbols, max_staleness: float = None):
+        """
+        Returns tickers for the given symbols, refreshing once if any is missing or stale.
+        Callers arriving while a refresh is in flight await that refresh instead of starting another.
+        """
+        symbols = [_normalize(s) for s in symbols]
+        if self._is_stale(symbols, max_staleness):
+            if self._refreshing is not None:
+                await self._refreshing
+            if self._is_stale(symbols, max_staleness):
+                self._refreshing = asyncio.ensure_future(self.refresh(symbols))
+                try:
+                    await self._refreshing
+                finally:
+                    self._refreshing = None
+        return self._select(symbols)
+
+    async def ticker(self, symbol: str, max_staleness: float = None):
+        """
+        Returns the cached ticker for one symbol (None if the exchange has none).
+        """
+        return (await self.get_tickers([symbol], max_staleness)).get(_normalize(symbol))
+
+    async def last(self, symbol: str, max_staleness: float = None):
+        """
+        Returns the last traded price of one symbol as a float (None if unavailable).
+        """
+        ticker = await self.ticker(symbol, max_staleness)
+        if not ticker or ticker.get('last') is None:
+            return None
+        return float(ticker['last'])
+
+    async def last_prices(self, symbols, max_staleness: float = None):
+        """
+        Returns {symbol: last price} for several symbols from one snapshot.
+        """
+        tickers = await self.get_tickers(symbols, max_staleness)
+        return {s: float(t['last']) for s, t in tickers.items() if t.get('last') is not None}
@@ -0,0 +1,334 @@
+"""
+rate_limiter.py
+
+Thread-safe request budgeting for concurrent calls against the OKX REST API.
+
+TokenBucket caps a single request stream. RequestScheduler keeps one bucket per
+OKX endpoint, sized from OKX's published limits, and serves queued requests by
+priority (orders > market data > account > backfill > reporting).
+ScheduledExchange routes every call made on a ccxt exchange through it.
+"""
+
+import collections
+import contextlib
+import functools
+import heapq
+import itertools
+import re
+import threading
+import time
+
+from metrics import REGISTRY
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to 'capacity' tokens and refills at 'rate'
+    tokens per second. acquire() blocks until a token is available, so a pool of
+    threads sharing one bucket never exceeds the configured request budget.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: Tokens added per second (sustained requests per second).
+        :param capacity: Maximum burst size (default: one second worth of tokens).
+        """
+        if rate <= 0:
+            raise ValueError("TokenBucket rate must be positive.")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Takes 'tokens' if available. Returns 0.0 on success, otherwise the number
+        of seconds until enough tokens will have accumulated.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Blocks until 'tokens' are available and takes them.
+        Returns the total time spent waiting, in seconds.
+        """
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay == 0.0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+# ---------------------------
+# Request scheduling
+# ---------------------------
+class RateLimitRejected(Exception):
+    """
+    Raised when a request cannot get a token within its allowed wait.
+    """
+
+
+# Priorities: lower runs first when requests queue on the same endpoint.
+PRIORITY_ORDER = 0
+PRIORITY_MARKET_DATA = 1
+PRIORITY_ACCOUNT = 2
+PRIORITY_BACKFILL = 3
+PRIORITY_REPORTING = 4
+
+PRIORITY_NAMES = {
+    PRIORITY_ORDER: "order",
+    PRIORITY_MARKET_DATA: "market_data",
+    PRIORITY_ACCOUNT: "account",
+    PRIORITY_BACKFILL: "backfill",
+    PRIORITY_REPORTING: "reporting",
+}
+
+# OKX v5 REST limits as (requests, window seconds), keyed by ccxt method (snake_case).
+# Methods sharing an OKX endpoint share a bucket through the endpoint name.
+OKX_ENDPOINT_LIMITS = {
+    "create_order": ("trade/order", 60, 2.0, PRIORITY_ORDER),
+    "create_market_order": ("trade/order", 60, 2.0, PRIORITY_ORDER),
+    "create_limit_order": ("trade/order", 60, 2.0, PRIORITY_ORDER),
+    # Batch endpoints allow 300 orders per 2s; one request carries up to 20 orders.
+    "create_orders": ("trade/batch-orders", 15, 2.0, PRIORITY_ORDER),
+    "private_post_trade_batch_orders": ("trade/batch-orders", 15, 2.0, PRIORITY_ORDER),
+    "cancel_order": ("trade/cancel-order", 60, 2.0, PRIORITY_ORDER),
+    "cancel_orders": ("trade/cancel-batch-orders", 15, 2.0, PRIORITY_ORDER),
+    "private_post_trade_cancel_batch_orders": ("trade/cancel-batch-orders", 15, 2.0, PRIORITY_ORDER),
+    "fetch_order": ("trade/order-details", 60, 2.0, PRIORITY_ORDER),
+    "fetch_ticker": ("market/ticker", 20, 2.0, PRIORITY_MARKET_DATA),
+    "fetch_tickers": ("market/tickers", 20, 2.0, PRIORITY_MARKET_DATA),
+    "fetch_order_book": ("market/books", 40, 2.0, PRIORITY_MARKET_DATA),
+    "fetch_ohlcv": ("market/history-candles", 20, 2.0, PRIORITY_MARKET_DATA),
+    "fetch_funding_rates": ("public/funding-rate", 20, 2.0, PRIORITY_MARKET_DATA),
+    "load_markets": ("public/instruments", 20, 2.0, PRIORITY_MARKET_DATA),
+    "fetch_balance": ("account/balance", 10, 2.0, PRIORITY_ACCOUNT),
+    "fetch_open_orders": ("trade/orders-pending", 60, 2.0, PRIORITY_ACCOUNT),
+    "fetch_closed_orders": ("trade/orders-history", 40, 2.0, PRIORITY_ACCOUNT),
+    "fetch_my_trades": ("trade/fills", 60, 2.0, PRIORITY_ACCOUNT),
+}
+DEFAULT_ENDPOINT_LIMIT = (20, 2.0)
+
+
+@functools.lru_cache(maxsize=1024)
+def _snake_case(name: str) -> str:
+    """'fetchOpenOrders' -> 'fetch_open_orders' (ccxt exposes both spellings)."""
+    return re.sub(r'(?<=[a-z0-9])(?=[A-Z])', '_', name).lower()
+
+
+class PriorityTokenBucket(TokenBucket):
+    """
+    Token bucket whose blocked callers are served by priority (then arrival order).
+
+    Requests at PRIORITY_BACKFILL or lower priority leave 'reserve' (a fraction of
+    capacity) untouched, so bulk traffic cannot drain the burst that latency-critical
+    calls rely on.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, reserve: float = 0.0):
+        super().__init__(rate, capacity)
+        self.reserve = reserve
+        self.condition = threading.Condition(self.lock)
+        self.waiters = []
+        self._sequence = itertools.count()
+
+    def acquire(self, tokens: float = 1.0, priority: int = PRIORITY_ORDER, timeout: float = None) -> float:
+        """
+        Blocks until 'tokens' are available and no higher-priority caller is waiting.
+        Returns the time spent waiting; raises RateLimitRejected after 'timeout' seconds.
+        """
+        start = time.monotonic()
+        needed = tokens + (self.reserve * self.capacity if priority >= PRIORITY_BACKFILL else 0.0)
+        entry = (priority, next(self._sequence))
+        with self.condition:
+            heapq.heappush(self.waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    at_head = self.waiters[0] == entry
+                    if at_head and self.tokens >= needed:
+                        heapq.heappop(self.waiters)
+                        self.tokens -= tokens
+                        return now - start
+                    remaining = None if timeout is None else timeout - (now - start)
+                    if remaining is not None and remaining <= 0:
+                        raise RateLimitRejected(f"No token within {timeout}s (priority {priority}).")
+                    delay = (needed - self.tokens) / self.rate if at_head else None
+                    waits = [w for w in (delay, remaining) if w is not None]
+                    self.condition.wait(min(waits) if waits else None)
+            finally:
+                if entry in self.waiters:
+                    self.waiters.remove(entry)
+                    heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+
+class RequestScheduler:
+    """
+    Central per-endpoint rate limiting for every exchange request.
+
+    Each OKX endpoint gets its own PriorityTokenBucket sized from OKX_ENDPOINT_LIMITS.
+    A request's priority comes from the method table unless a caller overrides it for
+    a block of code with 'with scheduler.priority(PRIORITY_BACKFILL): ...'.
+    Queue wait times, local rejections and exchange rate-limit errors are tracked per endpoint,
+    and request latency, waits and errors are also reported to a metrics.MetricsRegistry.
+    """
+
+    def __init__(self, limits: dict = None, reserve: float = 0.2, max_wait: dict = None, wait_samples: int = 1024,
+                 metrics=None):
+        """
+        :param limits: Method -> (endpoint, requests, window seconds, default priority); defaults to OKX_ENDPOINT_LIMITS.
+        :param reserve: Fraction of each bucket kept for priorities above PRIORITY_BACKFILL.
+        :param max_wait: Priority -> maximum queue wait in seconds before RateLimitRejected (default: wait forever).
+        :param wait_samples: Number of recent wait times kept per endpoint for percentiles.
+        :param metrics: MetricsRegistry receiving latency histograms and counters (default: metrics.REGISTRY).
+        """
+        self.limits = limits or OKX_ENDPOINT_LIMITS
+        self.reserve = reserve
+        self.max_wait = max_wait or {}
+        self.wait_samples = wait_samples
+        self.registry = metrics or REGISTRY
+        self.buckets = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def route(self, method: str):
+        """
+        Returns (endpoint, requests, window, priority) for a ccxt method name.
+        """
+        name = _snake_case(method)
+        if name in self.limits:
+            return self.limits[name]
+        return (name, DEFAULT_ENDPOINT_LIMIT[0], DEFAULT_ENDPOINT_LIMIT[1], PRIORITY_ACCOUNT)
+
+    def _bucket(self, endpoint, requests, window):
+        with self.lock:
+            bucket = self.buckets.get(endpoint)
+            if bucket is None:
+                bucket = PriorityTokenBucket(requests / window, capacity=requests, reserve=self.reserve)
+                self.buckets[endpoint] = bucket
+                self.stats[endpoint] = {"requests": 0, "rejected": 0, "exchange_rejected": 0, "errors": 0,
+                                        "wait_total": 0.0, "wait_max": 0.0,
+                                        "waits": collections.deque(maxlen=self.wait_samples),
+                                        "by_priority": collections.Counter()}
+            return bucket
+
+    @contextlib.contextmanager
+    def priority(self, priority: int):
+        """
+        Overrides the priority of every request made by this thread inside the block.
+        """
+        previous = getattr(self._local, "priority", None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def acquire(self, method: str, priority: int = None) -> float:
+        """
+        Waits for a token on the method's endpoint. Returns the queue wait in seconds.
+        """
+        endpoint, requests, window, default_priority = self.route(method)
+        if priority is None:
+            priority = getattr(self._local, "priority", None)
+        if priority is None:
+            priority = default_priority
+        bucket = self._bucket(endpoint, requests, window)
+        stats = self.stats[endpoint]
+        try:
+            waited = bucket.acquire(priority=priority, timeout=self.max_wait.get(priority))
+        except RateLimitRejected:
+            with self.lock:
+                stats["rejected"] += 1
+            raise
+        with self.lock:
+            stats["requests"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            stats["waits"].append(waited)
+            stats["by_priority"][PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return waited
+
+    def call(self, method: str, func, *args, priority: int = None, **kwargs):
+        """
+        Runs func(*args, **kwargs) once a token for 'method' is available.
+        """
+        endpoint = self.route(method)[0]
+        try:
+            waited = self.acquire(method, priority)
+        except RateLimitRejected:
+            self.registry.inc("okx_rate_limit_rejected_total", endpoint=endpoint)
+            raise
+        self.registry.observe("okx_rate_limit_wait_seconds", waited, endpoint=endpoint)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            with self.lock:
+                key = "exchange_rejected" if type(e).__name__ in ("RateLimitExceeded", "DDoSProtection") else "errors"
+                self.stats[endpoint][key] += 1
+            self.registry.inc("okx_request_errors_total", endpoint=endpoint, error=type(e).__name__)
+            raise
+        finally:
+            name = _snake_case(method)
+            self.registry.observe("okx_request_seconds", time.perf_counter() - start, endpoint=endpoint, method=name)
+            self.registry.inc("okx_requests_total", endpoint=endpoint, method=name)
+
+    def metrics(self):
+        """
+        Returns per-endpoint request counts, queue wait statistics (seconds) and rejection counts.
+        """
+        with self.lock:
+            report = {}
+            for endpoint, stats in self.stats.items():
+                waits = sorted(stats["waits"])
+                report[endpoint] = {
+                    "requests": stats["requests"],
+                    "rejected": stats["rejected"],
+                    "exchange_rejected": stats["exchange_rejected"],
+                    "errors": stats["errors"],
+                    "wait_mean": stats["wait_total"] / stats["requests"] if stats["requests"] else 0.0,
+                    "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p99": waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+                    "wait_max": stats["wait_max"],
+                    "by_priority": dict(stats["by_priority"]),
+                }
+            return report
+
+
+class ScheduledExchange:
+    """
+    Proxy around a ccxt exchange that routes every request method through a RequestScheduler.
+
+    Non-request attributes (markets, has, parse8601, precision helpers, ...) pass through unchanged.
+    """
+
+    REQUEST_PREFIXES = ("fetch", "create", "cancel", "edit", "load_markets", "private", "public")
+
+    def __init__(self, exchange, scheduler: RequestScheduler = None):
+        self.exchange = exchange
+        self.scheduler = scheduler or RequestScheduler()
+
+    def __getattr__(self, name):
+        attr = getattr(self.exchange, name)
+        if not callable(attr) or not name.startswith(self.REQUEST_PREFIXES):
+            return attr
+
+        def scheduled(*args, **kwargs):
+            return self.scheduler.call(name, attr, *args, **kwargs)
+        return scheduled
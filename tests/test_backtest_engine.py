@@ -0,0 +1,49 @@
+"""
+The columnar and streaming backtests reproduce backtest_triangle_arbitrage_minute.
+"""
+
+import pandas as pd
+import pytest
+
+from backtest_engine import StreamingBacktest, run_vectorized_backtest
+from fake_exchange import FakeExchange, synthetic_triangle_candles
+from okx_trader import OKXTrader
+
+TOLERANCE = 1e-14
+# The Sharpe ratio divides two rounded statistics, so its relative error is a few times larger.
+TOLERANCES = {"cumulative_return": TOLERANCE, "average_return": TOLERANCE, "std_return": TOLERANCE,
+              "sharpe_ratio": 5 * TOLERANCE, "max_drawdown": TOLERANCE}
+
+
+@pytest.fixture(scope="module")
+def records():
+    candles = synthetic_triangle_candles(1735689600000, 3000, seed=3, missing_ratio=0.02)
+    return OKXTrader(exchange=FakeExchange())._merge_triangle_window(candles)
+
+
+@pytest.fixture(scope="module")
+def loop_result(records):
+    return OKXTrader(exchange=FakeExchange()).backtest_triangle_arbitrage_minute(records, 0.1, 0.001)
+
+
+def test_vectorized_matches_loop(records, loop_result):
+    frame = pd.DataFrame.from_records(records)
+    result = run_vectorized_backtest(frame["BTC/USDT"], frame["ETH/USDT"], frame["ETH/BTC"], 0.1, 0.001)
+
+    assert result["trade_count"] > 0
+    for stat, tolerance in TOLERANCES.items():
+        assert result[stat] == pytest.approx(loop_result[stat], rel=tolerance, abs=tolerance), stat
+    assert list(result["portfolio_history"]) == pytest.approx(loop_result["portfolio_history"], rel=TOLERANCE)
+
+
+@pytest.mark.parametrize("batch_size", [1, 257, 5000])
+def test_streaming_matches_loop(records, loop_result, batch_size):
+    backtest = StreamingBacktest(trade_fraction=0.1, threshold=0.001, equity_every=1)
+    for i in range(0, len(records), batch_size):
+        backtest.update(records[i:i + batch_size])
+    result = backtest.result()
+
+    assert result["record_count"] == len(records)
+    for stat, tolerance in TOLERANCES.items():
+        assert result[stat] == pytest.approx(loop_result[stat], rel=tolerance, abs=tolerance), stat
+    assert result["portfolio_history"] == pytest.approx(loop_result["portfolio_history"], rel=TOLERANCE)
@@ -0,0 +1,34 @@
+"""
+The concurrent triangle history download writes exactly what the sequential one writes.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_exchange import FakeExchange, synthetic_triangle_candles
+from okx_trader import OKXTrader
+
+START = datetime(2025, 1, 1)
+
+
+@pytest.mark.parametrize("minutes,chunk_minutes,missing_ratio", [(1000, 100, 0.0), (1234, 70, 0.05)])
+def test_concurrent_download_matches_incremental(tmp_path, minutes, chunk_minutes, missing_ratio):
+    start_ms = int(START.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    candles = synthetic_triangle_candles(start_ms, minutes, seed=1, missing_ratio=missing_ratio)
+    trader = OKXTrader(exchange=FakeExchange(candles, latency=0.001))
+    end = START + timedelta(minutes=minutes)
+    incremental, concurrent = tmp_path / "incremental.json", tmp_path / "concurrent.json"
+
+    trader.fetch_all_historical_triangle_data_incremental(START, end, chunk_minutes=chunk_minutes,
+                                                          filename=str(incremental))
+    written = trader.fetch_all_historical_triangle_data_concurrent(START, end, chunk_minutes=chunk_minutes,
+                                                                   filename=str(concurrent), max_workers=8,
+                                                                   requests_per_second=1e6)
+
+    records = json.loads(incremental.read_text())
+    assert records and written == len(records)
+    # Only timestamps quoted by all three legs are merged.
+    assert len(records) < minutes if missing_ratio else len(records) == minutes
+    assert concurrent.read_bytes() == incremental.read_bytes()
@@ -0,0 +1,126 @@
+"""
+LiveTriangleEngine fed by ReplayTransport: signal emission, callback failures and reconnects.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import live_feed
+from live_feed import LiveTriangleEngine, ReplayTransport
+
+PRICES = {"BTC-USDT": 50000.0, "ETH-USDT": 2600.0, "ETH-BTC": 0.05}
+
+
+def ticker(inst_id, last, ts=1):
+    return json.dumps({"arg": {"channel": "tickers", "instId": inst_id},
+                       "data": [{"instId": inst_id, "last": str(last), "bidPx": str(last), "askPx": str(last),
+                                 "ts": str(ts)}]})
+
+
+RECORDING = [ticker(inst_id, px, ts) for ts, (inst_id, px) in enumerate(PRICES.items(), start=1)]
+
+
+class DroppingReplay(ReplayTransport):
+    """
+    Replay server that drops the first 'drops' connections after 'drop_after' messages.
+    """
+
+    persistent = True
+
+    def __init__(self, messages, drops=1, drop_after=2):
+        super().__init__(messages)
+        self.drops = drops
+        self.drop_after = drop_after
+        self.subscriptions = []
+
+    async def stream(self, inst_ids):
+        self.subscriptions.append(list(inst_ids))
+        dropping = len(self.subscriptions) <= self.drops
+        for i, message in enumerate(self.messages):
+            if dropping and i == self.drop_after:
+                raise ConnectionError("connection reset")
+            yield message
+            await asyncio.sleep(0)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def sleep(seconds):
+        pass
+    monkeypatch.setattr(live_feed.asyncio, "sleep", sleep)
+
+
+def test_replay_emits_signal_once_all_legs_are_quoted():
+    signals = []
+    engine = LiveTriangleEngine(ReplayTransport(RECORDING), threshold=0.002, on_signal=signals.append)
+
+    asyncio.run(engine.run())
+
+    assert engine.update_count == 3
+    assert len(signals) == 1
+    signal = signals[0]
+    assert signal["Cycle1_factor"] == pytest.approx(2600.0 / (50000.0 * 0.05))
+    assert signal["Cycle1_opportunity"] and not signal["Cycle2_opportunity"]
+    assert engine.latency_stats()["count"] == 1
+
+
+def test_failing_callback_does_not_stop_the_feed():
+    def explode(signal):
+        raise RuntimeError("consumer bug")
+    messages = RECORDING + [ticker("ETH-USDT", 2601.0, 4), ticker("ETH-USDT", 2602.0, 5)]
+    engine = LiveTriangleEngine(DroppingReplay(messages, drops=0), on_signal=explode, max_reconnects=0)
+
+    asyncio.run(engine.run(max_messages=len(messages)))
+
+    assert engine.signal_count == 3
+    assert engine.reconnect_count == 0
+
+
+def test_dropped_connection_resubscribes_with_fresh_quotes():
+    transport = DroppingReplay(RECORDING, drops=1, drop_after=2)
+    seen = []
+    engine = LiveTriangleEngine(transport, on_signal=lambda s: seen.append(dict(engine.quotes)))
+
+    asyncio.run(engine.run(max_messages=5))
+
+    assert engine.reconnect_count == 1
+    assert len(transport.subscriptions) == 2
+    assert transport.subscriptions[0] == transport.subscriptions[1] == list(PRICES)
+    # The two quotes from before the drop were cleared: the first signal needs all three legs again.
+    assert engine.update_count == 5
+    assert engine.signal_count == 1
+    assert all(quote["ts"] in (1, 2, 3) for quote in seen[0].values())
+
+
+def test_reconnects_give_up_after_max_reconnects():
+    transport = DroppingReplay(RECORDING, drops=10, drop_after=0)
+    engine = LiveTriangleEngine(transport, max_reconnects=2)
+
+    asyncio.run(engine.run())
+
+    assert len(transport.subscriptions) == 3
+    assert engine.reconnect_count == 2
+
+
+def test_bad_message_is_skipped():
+    transport = ReplayTransport(RECORDING[:1] + ["not json"] + RECORDING[1:])
+    engine = LiveTriangleEngine(transport)
+
+    asyncio.run(engine.run())
+
+    assert engine.update_count == 3
+    assert engine.signal_count == 1
+
+
+def test_replay_error_ends_the_run_instead_of_replaying():
+    transport = DroppingReplay(RECORDING, drops=1, drop_after=2)
+    transport.persistent = False
+    engine = LiveTriangleEngine(transport)
+
+    asyncio.run(engine.run())
+
+    assert len(transport.subscriptions) == 1
+    assert engine.update_count == 2
+    assert engine.reconnect_count == 0
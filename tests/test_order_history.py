@@ -0,0 +1,100 @@
+"""
+OrderHistoryStore sync against FakeExchange, which pages its history the way ccxt okx does.
+"""
+
+import time
+
+import pytest
+from ccxt.base.errors import ArgumentsRequired
+
+from fake_exchange import FakeExchange, synthetic_closed_orders
+from okx_trader import OKXTrader
+from order_history import ARCHIVE_ORDERS_METHOD, RECENT_ORDERS_METHOD, OrderHistoryStore
+
+
+class RecordingExchange(FakeExchange):
+    """
+    FakeExchange that records the arguments of every history request.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params=None):
+        self.calls.append((since, limit, dict(params or {})))
+        return super().fetch_closed_orders(symbol, since, limit, params)
+
+
+def test_fake_rejects_forward_pagination_without_since():
+    with pytest.raises(ArgumentsRequired):
+        FakeExchange().fetch_closed_orders(params={'paginate': True})
+
+
+def test_first_sync_pages_back_through_the_archive():
+    orders = synthetic_closed_orders(250)
+    exchange = RecordingExchange(closed_orders=orders)
+    store = OrderHistoryStore(":memory:")
+
+    assert store.sync_orders(exchange) == 250
+
+    assert [o['id'] for o in store.orders()] == [o['id'] for o in orders]
+    assert store.cursor() == orders[-1]['timestamp']
+    assert store.synced_at() is not None
+    # Three pages, newest first, each ending where the previous one started.
+    assert len(exchange.calls) == 3
+    assert all(params['method'] == ARCHIVE_ORDERS_METHOD and 'paginate' not in params
+               for _, _, params in exchange.calls)
+    assert 'until' not in exchange.calls[0][2]
+    assert exchange.calls[1][2]['until'] == orders[150]['timestamp']
+    assert exchange.calls[0][0] <= time.time() * 1000 - 89 * 86_400_000
+
+
+def test_incremental_sync_uses_update_time_and_recent_endpoint():
+    orders = synthetic_closed_orders(120)
+    exchange = RecordingExchange(closed_orders=orders)
+    store = OrderHistoryStore(":memory:")
+    store.sync_orders(exchange)
+    cursor = store.cursor()
+    exchange.calls.clear()
+
+    now = int(time.time() * 1000)
+    # Created before the cursor but closed after it, and a brand new order.
+    late = dict(orders[0], id='late', timestamp=cursor - 60_000, lastUpdateTimestamp=now)
+    new = dict(orders[1], id='new', timestamp=now, lastUpdateTimestamp=now)
+    exchange.closed_orders = orders + [late, new]
+
+    store.sync_orders(exchange)
+
+    ids = {o['id'] for o in store.orders()}
+    assert {'late', 'new'} <= ids and len(ids) == 122
+    assert store.cursor() == now
+    assert exchange.calls and all(params['method'] == RECENT_ORDERS_METHOD for _, _, params in exchange.calls)
+
+
+def test_interrupted_sync_keeps_the_cursor():
+    exchange = FakeExchange(closed_orders=synthetic_closed_orders(250))
+    store = OrderHistoryStore(":memory:")
+
+    # The second page repeats the boundary order of the first.
+    assert store.sync_orders(exchange, max_pages=2) == 199
+    assert store.cursor() is None
+
+    store.sync_orders(exchange)
+    assert len(store.orders()) == 250
+    assert store.cursor() is not None
+
+
+def test_trades_sync_pages_back():
+    orders = synthetic_closed_orders(230, symbols=("BTC/USDT",))
+    store = OrderHistoryStore(":memory:")
+
+    assert store.sync_trades(FakeExchange(closed_orders=orders), "BTC/USDT") == 230
+    assert len(store.trades_frame("BTC/USDT")) == 230
+    assert store.cursor("trades:BTC/USDT") == orders[-1]['timestamp']
+
+
+def test_trader_reads_closed_orders_after_first_sync():
+    trader = OKXTrader(exchange=FakeExchange(closed_orders=synthetic_closed_orders(150)))
+
+    assert len(trader.get_closed_orders()) == 150
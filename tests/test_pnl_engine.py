@@ -0,0 +1,77 @@
+"""
+OKXTrader keeps one PnLEngine and feeds it only the orders each history sync adds.
+"""
+
+import pandas as pd
+
+from fake_exchange import FakeExchange, synthetic_closed_orders
+from okx_trader import OKXTrader
+from pnl_engine import compute_pnl, to_fill_table
+
+COLUMNS = ['symbol', 'timestamp', 'realized_fifo', 'realized_avg', 'position', 'fifo_cost', 'avg_cost']
+
+
+def one_shot(trader):
+    fills, _, _ = compute_pnl(to_fill_table(trader.order_history.orders_frame()))
+    return fills
+
+
+def assert_same(incremental, expected):
+    pd.testing.assert_frame_equal(incremental[COLUMNS].reset_index(drop=True),
+                                  expected[COLUMNS].reset_index(drop=True), rtol=1e-12)
+
+
+def test_update_pnl_feeds_only_new_orders():
+    orders = synthetic_closed_orders(300)
+    exchange = FakeExchange(closed_orders=orders[:200])
+    trader = OKXTrader(exchange=exchange)
+    fed = []
+    update = trader.pnl_engine.update
+    trader.pnl_engine.update = lambda fills: fed.append(len(fills)) or update(fills)
+
+    assert len(trader.update_pnl()) == 200
+    exchange.closed_orders = orders
+    # The overlap re-downloads stored orders too; only the 100 new ones reach the engine.
+    trader.order_history.sync_orders(exchange)
+    fills = trader.update_pnl()
+
+    assert fed == [200, 100]
+    assert trader.pnl_engine.fill_count == 300
+    assert_same(fills, one_shot(trader))
+    # Nothing new: the engine is not touched again.
+    trader.update_pnl()
+    assert fed == [200, 100]
+
+
+def test_update_pnl_rebuilds_on_an_older_late_order():
+    orders = synthetic_closed_orders(200)
+    late = orders.pop(50)
+    exchange = FakeExchange(closed_orders=orders)
+    trader = OKXTrader(exchange=exchange)
+    trader.update_pnl()
+    engine = trader.pnl_engine
+
+    exchange.closed_orders = orders + [late]
+    trader.order_history.sync_orders(exchange, since=late['timestamp'])
+    fills = trader.update_pnl()
+
+    assert trader.pnl_engine is not engine
+    assert trader.pnl_engine.fill_count == 200
+    assert_same(fills, one_shot(trader))
+
+
+def test_calculate_pnl_and_buckets_match_one_shot_engine():
+    orders = synthetic_closed_orders(400)
+    trader = OKXTrader(exchange=FakeExchange(closed_orders=orders))
+    start = pd.Timestamp(orders[100]['timestamp'], unit='ms', tz='UTC')
+    end = pd.Timestamp(orders[300]['timestamp'], unit='ms', tz='UTC')
+
+    pnl = trader.calculate_pnl(start.isoformat(), end.isoformat())
+    buckets = trader.calculate_pnl_buckets(start.isoformat(), end.isoformat(), freq="1h")
+
+    expected = one_shot(trader)
+    expected = expected[expected['timestamp'].between(orders[100]['timestamp'], orders[300]['timestamp'])]
+    for coin in ('BTC', 'ETH'):
+        rows = expected[expected['symbol'].str.startswith(coin + '/')]
+        assert abs(pnl[coin]['realized_pnl'] - (rows['realized_fifo'].sum() - rows['fee'].sum())) < 1e-9
+    assert set(buckets.index.get_level_values('symbol')) == {'BTC/USDT', 'ETH/USDT'}
@@ -0,0 +1,106 @@
+"""
+TriangleExecutor against AsyncFakeExchange: full, partial and missed fills, and the timeout path.
+"""
+
+import asyncio
+
+import pytest
+
+from config import TAKER_FEE
+from fake_exchange import DEFAULT_PRICES, AsyncFakeExchange
+from market_cache import MarketMetadataCache
+from triangle_executor import TriangleExecutor
+
+NOTIONAL = 1000.0
+
+
+def run_cycle(cycle=1, prices=None, has_stream=True, **kwargs):
+    """
+    Executes one cycle on a fresh AsyncFakeExchange built from kwargs; returns (report, exchange).
+    """
+    executor_kwargs = {k: kwargs.pop(k) for k in ("fill_timeout", "poll_interval") if k in kwargs}
+
+    async def main():
+        exchange = AsyncFakeExchange(**kwargs)
+        if not has_stream:
+            exchange.has = {}
+        cache = MarketMetadataCache(exchange, background=False, persist=False)
+        assert await cache.refresh_async()
+        executor = TriangleExecutor(exchange, cache, **executor_kwargs)
+        try:
+            report = await executor.execute(cycle, prices or dict(DEFAULT_PRICES), NOTIONAL)
+        finally:
+            await executor.stop()
+        return report, exchange
+
+    return asyncio.run(main())
+
+
+def test_full_fill():
+    report, exchange = run_cycle()
+
+    assert report["status"] == "filled"
+    assert [leg["status"] for leg in report["legs"]] == ["closed"] * 3
+    assert report["unwind"] == []
+    assert len(exchange.sync.orders) == 3
+    # Only dust below the minimum order size may be left over.
+    assert all(abs(amount) < 1e-4 for amount in report["residual"].values())
+
+
+@pytest.mark.parametrize("cycle", [1, 2])
+def test_partial_fill_is_unwound(cycle):
+    report, exchange = run_cycle(cycle=cycle, fill_ratios={"ETH/BTC": 0.5})
+
+    assert report["status"] == "partial"
+    middle = report["legs"][1]
+    assert middle["symbol"] == "ETH/BTC"
+    assert middle["status"] == "canceled"
+    assert middle["filled"] == pytest.approx(middle["amount"] * 0.5)
+    # Half the intermediate currency is stranded on each side of the missing leg; both are flattened.
+    assert {leg["symbol"] for leg in report["unwind"]} == {"BTC/USDT", "ETH/USDT"}
+    assert all(leg["status"] == "closed" for leg in report["unwind"])
+    assert len(exchange.sync.orders) == 5
+    # What is left is the fee charged on the unwind buys, not the stranded exposure.
+    unwound = {leg["symbol"].split("/")[0]: leg["filled"] for leg in report["unwind"]}
+    for currency, amount in report["residual"].items():
+        assert abs(amount) <= unwound[currency] * TAKER_FEE + 1e-8
+
+
+def test_zero_fill_needs_no_unwind():
+    report, _ = run_cycle(fill_ratios={sym: 0.0 for sym in DEFAULT_PRICES})
+
+    assert report["status"] == "failed"
+    assert all(leg["status"] == "canceled" and leg["filled"] == 0.0 for leg in report["legs"])
+    assert report["unwind"] == []
+    assert report["residual"] == {}
+    assert report["pnl"] == 0.0
+
+
+def test_ioc_miss_on_stale_signal():
+    # The signal saw ETH/USDT 1% higher than the book: the sell leg's IOC limit is not marketable.
+    prices = dict(DEFAULT_PRICES, **{"ETH/USDT": DEFAULT_PRICES["ETH/USDT"] * 1.01})
+    report, _ = run_cycle(prices=prices)
+
+    sell = report["legs"][2]
+    assert sell["symbol"] == "ETH/USDT"
+    assert sell["status"] == "canceled" and sell["filled"] == 0.0
+    assert report["status"] == "partial"
+    # The ETH bought by the middle leg is sold back against USDT.
+    assert [(leg["symbol"], leg["side"]) for leg in report["unwind"]] == [("ETH/USDT", "sell")]
+
+
+def test_stream_timeout_falls_back_to_cancel_and_fetch():
+    # Order updates arrive long after fill_timeout, so every leg is canceled and re-read over REST.
+    report, exchange = run_cycle(fill_latency=5.0, fill_timeout=0.05)
+
+    assert report["status"] == "filled"
+    assert all(leg["status"] == "closed" for leg in report["legs"])
+    assert exchange.sync.request_count >= 6
+
+
+def test_polling_without_order_stream():
+    report, _ = run_cycle(has_stream=False, fill_ratios={"ETH/BTC": 0.0}, poll_interval=0.001)
+
+    assert [leg["status"] for leg in report["legs"]] == ["closed", "canceled", "closed"]
+    assert report["status"] == "partial"
+    assert {leg["symbol"] for leg in report["unwind"]} == {"BTC/USDT", "ETH/USDT"}
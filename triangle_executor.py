@@ -0,0 +1,292 @@
+"""
+triangle_executor.py
+
+Low-latency execution of the three legs of a triangle arbitrage cycle.
+
+All three legs are sent at once as IOC limit orders. Each order is sized from
+the prices that produced the signal and rounded with the cached precision
+table (market_cache.MarketMetadataCache), so no ticker fetch or sleep sits
+between the signal and the orders. Because the legs run concurrently, the
+account must hold inventory of the intermediate currencies (BTC and ETH) and
+each cycle rebalances it. Fills are tracked through the exchange order stream
+(ccxt.pro watch_orders), with fetch_order polling as a fallback. Once every
+leg is final, any residual BTC/ETH exposure left by partial fills is unwound
+against USDT. Signal-to-acknowledgement and signal-to-fill latencies are
+recorded for every leg.
+"""
+
+import asyncio
+import time
+import uuid
+
+import numpy as np
+
+from book_evaluator import CYCLE_LEGS
+from config import TAKER_FEE
+from logger_config import setup_logger
+
+# Configure logging
+logger = setup_logger(__name__)
+
+FINAL_STATUSES = ("closed", "canceled", "rejected", "expired")
+
+
+class TriangleExecutor:
+    """
+    Fires the legs of a triangle cycle concurrently and reconciles their fills.
+    """
+
+    def __init__(self, exchange, market_cache, fee=TAKER_FEE, max_slippage=0.001, fill_timeout=5.0,
+                 poll_interval=0.05, unwind=True, quote="USDT"):
+        """
+        :param exchange: Async ccxt exchange (ccxt.pro for the order stream) or fake_exchange.AsyncFakeExchange.
+        :param market_cache: MarketMetadataCache used to round amounts and prices.
+        :param fee: Taker fee per leg, used for sizing and residual accounting.
+        :param max_slippage: IOC limit prices are set this far through the signal price.
+        :param fill_timeout: Seconds to wait for a leg to reach a final state before canceling it.
+        :param poll_interval: fetch_order polling interval when the exchange has no order stream.
+        :param unwind: Flatten residual non-quote exposure after partial fills.
+        :param quote: Currency the cycle starts and ends in.
+        """
+        self.exchange = exchange
+        self.market_cache = market_cache
+        self.fee = fee
+        self.max_slippage = max_slippage
+        self.fill_timeout = fill_timeout
+        self.poll_interval = poll_interval
+        self.unwind = unwind
+        self.quote = quote
+        self.pending = {}
+        self.latencies = []
+        self._watcher = None
+
+    # ---------------------------
+    # Order stream
+    # ---------------------------
+    def has_order_stream(self):
+        return bool(getattr(self.exchange, 'has', {}).get('watchOrders'))
+
+    async def start(self):
+        """
+        Starts consuming the order stream (no-op without watch_orders support).
+        """
+        if self._watcher is None and self.has_order_stream():
+            self._watcher = asyncio.ensure_future(self._watch_orders())
+
+    async def stop(self):
+        """
+        Stops the order stream consumer.
+        """
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch_orders(self):
+        while True:
+            try:
+                updates = await self.exchange.watch_orders()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error watching orders: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            for order in updates:
+                self._on_order_update(order)
+
+    def _on_order_update(self, order):
+        waiter = self.pending.get(order.get('clientOrderId'))
+        if waiter is None:
+            return
+        waiter['last'] = order
+        if order.get('status') in FINAL_STATUSES and not waiter['future'].done():
+            waiter['final_ns'] = time.perf_counter_ns()
+            waiter['future'].set_result(order)
+
+    # ---------------------------
+    # Sizing
+    # ---------------------------
+    def plan(self, cycle, prices, notional):
+        """
+        Pre-sizes the legs of a cycle from the signal prices.
+
+        :param cycle: 1 (USDT -> BTC -> ETH -> USDT) or 2 (USDT -> ETH -> BTC -> USDT), see book_evaluator.CYCLE_LEGS.
+        :param prices: Dict symbol -> price the signal was computed from.
+        :param notional: Amount of the quote currency committed to the first leg.
+        :return: List of leg dicts: symbol, side, amount (base units) and IOC limit price.
+        """
+        legs = []
+        holding = notional
+        for symbol, side in CYCLE_LEGS[cycle]:
+            price = prices[symbol]
+            if side == "buy":
+                amount = holding / price
+                holding = amount * (1 - self.fee)
+                limit = price * (1 + self.max_slippage)
+            else:
+                amount = holding
+                holding = amount * price * (1 - self.fee)
+                limit = price * (1 - self.max_slippage)
+            legs.append({
+                "symbol": symbol,
+                "side": side,
+                "amount": self.market_cache.amount_to_precision(symbol, amount),
+                "price": self.market_cache.price_to_precision(symbol, limit)
+            })
+        return legs
+
+    # ---------------------------
+    # Execution
+    # ---------------------------
+    async def execute(self, cycle, prices, notional, signal_ns=None):
+        """
+        Sends all legs at once, waits for their final states and unwinds residual exposure.
+
+        :param signal_ns: time.perf_counter_ns() of the signal (defaults to now); latencies are measured from it.
+        :return: Execution report dict (legs, residual, unwind orders, realized quote PnL, status, latencies).
+        """
+        signal_ns = signal_ns or time.perf_counter_ns()
+        legs = self.plan(cycle, prices, notional)
+        await self.start()
+        results = await asyncio.gather(*(self._run_leg(leg, signal_ns) for leg in legs))
+
+        residual = self._residual(results)
+        unwind_orders = []
+        if self.unwind:
+            unwind_orders = await self._unwind(residual, prices, signal_ns)
+            residual = self._residual(results + unwind_orders)
+
+        filled = [r["filled"] >= r["amount"] * (1 - 1e-9) for r in results]
+        report = {
+            "cycle": cycle,
+            "notional": notional,
+            "legs": results,
+            "unwind": unwind_orders,
+            "residual": {c: v for c, v in residual.items() if c != self.quote},
+            "pnl": residual.get(self.quote, 0.0),
+            "status": "filled" if all(filled) else ("partial" if any(r["filled"] for r in results) else "failed"),
+            "signal_to_fill_ms": max((r["fill_ms"] or 0.0) for r in results)
+        }
+        self.latencies.append([(r["ack_ms"], r["fill_ms"]) for r in results])
+        logger.info(f"Triangle cycle {cycle} executed: status={report['status']}, pnl={report['pnl']:.6f}, "
+                    f"signal_to_fill={report['signal_to_fill_ms']:.3f} ms")
+        return report
+
+    async def _run_leg(self, leg, signal_ns, order_type='limit'):
+        client_id = "tri" + uuid.uuid4().hex[:24]
+        waiter = {"future": asyncio.get_running_loop().create_future(), "last": None, "final_ns": None}
+        # Registered before sending so an update racing the REST acknowledgement is not lost.
+        self.pending[client_id] = waiter
+        params = {'clientOrderId': client_id}
+        if order_type == 'limit':
+            params['timeInForce'] = 'IOC'
+        result = {"symbol": leg["symbol"], "side": leg["side"], "amount": leg["amount"], "price": leg.get("price"),
+                  "id": None, "status": None, "filled": 0.0, "average": None, "ack_ms": None, "fill_ms": None}
+        try:
+            ack = await self.exchange.create_order(leg["symbol"], order_type, leg["side"], leg["amount"],
+                                                   leg.get("price"), params)
+            result["ack_ms"] = (time.perf_counter_ns() - signal_ns) / 1e6
+            result["id"] = ack.get("id")
+            if ack.get("status") in FINAL_STATUSES:
+                self._on_order_update({**ack, 'clientOrderId': client_id})
+            order = await self._wait_final(waiter, leg["symbol"], result["id"])
+            result["fill_ms"] = (waiter["final_ns"] - signal_ns) / 1e6 if waiter["final_ns"] else None
+            result["status"] = order.get("status")
+            result["filled"] = float(order.get("filled") or 0.0)
+            result["average"] = order.get("average") or order.get("price")
+        except Exception as e:
+            logger.error(f"Error executing {leg['side']} {leg['amount']} {leg['symbol']}: {e}")
+            result["status"] = "error"
+        finally:
+            self.pending.pop(client_id, None)
+        return result
+
+    async def _wait_final(self, waiter, symbol, order_id):
+        if self.has_order_stream():
+            try:
+                return await asyncio.wait_for(asyncio.shield(waiter["future"]), self.fill_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Order {order_id} not final after {self.fill_timeout}s; canceling.")
+                return await self._cancel(order_id, symbol, waiter)
+        deadline = time.monotonic() + self.fill_timeout
+        while time.monotonic() < deadline:
+            order = await self.exchange.fetch_order(order_id, symbol)
+            if order.get("status") in FINAL_STATUSES:
+                waiter["final_ns"] = time.perf_counter_ns()
+                return order
+            await asyncio.sleep(self.poll_interval)
+        return await self._cancel(order_id, symbol, waiter)
+
+    async def _cancel(self, order_id, symbol, waiter):
+        try:
+            await self.exchange.cancel_order(order_id, symbol)
+        except Exception as e:
+            logger.warning(f"Could not cancel order {order_id}: {e}")
+        order = await self.exchange.fetch_order(order_id, symbol)
+        waiter["final_ns"] = time.perf_counter_ns()
+        return order
+
+    # ---------------------------
+    # Legging risk
+    # ---------------------------
+    def _residual(self, results):
+        """
+        Net currency change of a set of fills (fees charged on the received currency).
+        """
+        delta = {}
+        for r in results:
+            if not r["filled"]:
+                continue
+            base, quote = r["symbol"].split('/')
+            cost = r["filled"] * r["average"]
+            if r["side"] == "buy":
+                delta[base] = delta.get(base, 0.0) + r["filled"] * (1 - self.fee)
+                delta[quote] = delta.get(quote, 0.0) - cost
+            else:
+                delta[base] = delta.get(base, 0.0) - r["filled"]
+                delta[quote] = delta.get(quote, 0.0) + cost * (1 - self.fee)
+        return delta
+
+    async def _unwind(self, residual, prices, signal_ns):
+        """
+        Flattens every non-quote currency left over by partial fills with market orders against the quote.
+        """
+        legs = []
+        for currency, amount in residual.items():
+            if currency == self.quote:
+                continue
+            symbol = f"{currency}/{self.quote}"
+            try:
+                size = self.market_cache.amount_to_precision(symbol, abs(amount))
+                if size < self.market_cache.min_order_size(symbol):
+                    continue
+            except KeyError:
+                logger.warning(f"No market to unwind {amount} {currency}")
+                continue
+            legs.append({"symbol": symbol, "side": "sell" if amount > 0 else "buy", "amount": size})
+        if not legs:
+            return []
+        logger.warning(f"Unwinding legging exposure: {legs}")
+        return list(await asyncio.gather(*(self._run_leg(leg, signal_ns, order_type='market') for leg in legs)))
+
+    def latency_stats(self):
+        """
+        Returns p50/p99/max signal-to-ack and signal-to-fill latency (ms) per leg index.
+        """
+        if not self.latencies:
+            return {}
+        stats = {}
+        for i in range(len(self.latencies[0])):
+            for j, name in enumerate(("ack", "fill")):
+                values = np.array([run[i][j] for run in self.latencies if run[i][j] is not None])
+                if len(values):
+                    stats[f"leg{i + 1}_{name}_ms"] = {
+                        "p50": float(np.percentile(values, 50)),
+                        "p99": float(np.percentile(values, 99)),
+                        "max": float(values.max())
+                    }
+        return stats